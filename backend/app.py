@@ -1,45 +1,71 @@
-from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, send_file
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, send_file, g
 import zipfile
 import io
 import json
 import time
 import glob
 import os
-from celery.result import AsyncResult
-from worker import celery_app, process_file_task
+import uuid
+import threading
 from flask_cors import CORS
 from config import Config
 from services.vector_db import VectorDB
 from services.llm_service import LLMService
 from services.ingestion_service import IngestionService
 from services.auth_service import AuthService, create_auth_decorators
-from services.kb_service import KnowledgeBaseService
-from worker import celery_app, process_file_task
+from services.kb_service import KnowledgeBaseService, REINDEX_SETTINGS
+from services.blob_store import BlobStore
+from services.ingestion.checkpoint_store import CheckpointStore
+from services.upload_service import ChunkedUploadService, UploadError
+from services.query_filters import parse_filters, filters_from_args
+from services.answer_cache import AnswerCache
+from services.single_flight import SingleFlight
+from services.readiness import Readiness
+from services import metrics
+from services import tracing
+from services import logging_service
+from services import profiler
+from services.logging_service import get_logger
+from services.context_packer import INSTRUCTION_PREFIX, estimate_tokens
+from worker import celery_app, process_file_task, enqueue_file, ingestion_router, rechunk_kb_task
 from celery.result import AsyncResult
 
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
 Config.init_app()
+tracing.configure(Config())
+logging_service.configure(Config())
+profiler.configure(Config())
+log = get_logger("app")
 
 llm_service = LLMService(Config())
 
 # Lazy initialization for VectorDB to speed up server startup
 _vector_db = None
+_vector_db_lock = threading.Lock()
 
 def get_vector_db(kb_id="default"):
     """Lazy singleton for VectorDB - connection established on first use."""
     global _vector_db
     if _vector_db is None:
-        print("Initializing VectorDB connection (lazy)...")
-        _vector_db = VectorDB(Config(), embedding_fn=llm_service.get_embedding, kb_id=kb_id)
-    elif kb_id != _vector_db.kb_id:
+        # The startup warm-up and the first requests may race to connect
+        with _vector_db_lock:
+            if _vector_db is None:
+                log.info("vector_db_connect", kb=kb_id or "default")
+                _vector_db = VectorDB(Config(), embedding_fn=llm_service.get_embedding, kb_id=kb_id or "default")
+    if kb_id is not None and kb_id != _vector_db.kb_id:
         _vector_db.switch_kb(kb_id)
     return _vector_db
 
 
 ingestion_service = None
 auth_service = AuthService(Config())
+# Checkpoints are keyed by content hash: dropped with the last file of that content
+blob_store = BlobStore(Config(), on_collect=CheckpointStore(Config()).delete)
+answer_cache = AnswerCache(Config())
+single_flight = SingleFlight(Config())
+chunked_uploads = ChunkedUploadService(Config(), blob_store)
 kb_service = None
 
 def get_ingestion_service():
@@ -54,8 +80,36 @@ def get_kb_service():
         kb_service = KnowledgeBaseService(Config(), get_vector_db())
     return kb_service
 
+def reindex_conflict(kb_id):
+    """409 response while a KB is re-indexed into a new collection (its files would miss the swap), else None."""
+    if get_kb_service().is_reindexing(kb_id):
+        return jsonify({"error": f"Knowledge base '{kb_id}' is being re-indexed; try again when it finishes"}), 409
+    return None
+
+def enqueue_rechunk(kb_id, **kwargs):
+    """Queues a re-index of a KB; pending collection settings make it a staging re-index that blocks uploads."""
+    recreate = bool((get_kb_service().get(kb_id) or {}).get("pending_settings"))
+    if recreate:
+        get_kb_service().begin_reindex(kb_id)
+    try:
+        return rechunk_kb_task.apply_async(args=(kb_id,), kwargs={"recreate": recreate, **kwargs},
+                                           queue=Config.INGEST_QUEUE_BULK)
+    except Exception:
+        if recreate:
+            get_kb_service().end_reindex(kb_id)
+        raise
+
 require_auth, require_admin = create_auth_decorators(auth_service)
 
+# Backends connect in the background; /api/health answers right away, /api/ready once they're up
+readiness = Readiness({
+    # kb_id=None: connect without switching the shared instance away from a request's KB
+    "weaviate": lambda: get_vector_db(kb_id=None).client.is_live(),
+    "redis": lambda: Config.CELERY_TASK_ALWAYS_EAGER or ingestion_router.redis.ping(),
+})
+if Config.STARTUP_WARMUP:
+    readiness.start()
+
 @app.route('/api/slides/<path:filename>')
 def serve_slide(filename):
     # URL decode the filename
@@ -146,7 +200,7 @@ def serve_thumbnail(filename):
         
         return send_from_directory(thumb_dir, thumb_filename)
     except Exception as e:
-        print(f"Thumbnail generation failed for {filename}: {e}")
+        log.warning("thumbnail_failed", file=filename, error=str(e))
         # Fallback: return original file
         return send_from_directory(os.path.dirname(original_path), os.path.basename(original_path))
 
@@ -170,6 +224,7 @@ def list_documents():
     try:
         documents = []
         doc_id_counter = 0
+        upload_times = blob_store.upload_times()
         
         # Scan all files in UPLOAD_FOLDER and its subdirectories
         for root, dirs, files in os.walk(Config.UPLOAD_FOLDER):
@@ -179,7 +234,7 @@ def list_documents():
                 try:
                     stats = os.stat(file_path)
                     size_mb = round(stats.st_size / (1024 * 1024), 2)
-                    mod_time = time.strftime('%Y-%m-%d', time.localtime(stats.st_mtime))
+                    mod_time = time.strftime('%Y-%m-%d', time.localtime(upload_times.get(os.path.abspath(file_path), stats.st_mtime)))
                 except:
                     size_mb = 0
                     mod_time = "Unknown"
@@ -196,13 +251,104 @@ def list_documents():
             
         return jsonify(documents)
     except Exception as e:
-        print(f"Error listing documents: {e}")
+        log.error("list_documents_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
+QUERIES = metrics.REGISTRY.counter("rag_queries_total", "Answered queries", ("endpoint",))
+INFLIGHT_STREAMS = metrics.REGISTRY.gauge("rag_inflight_streams", "Open /api/query/stream responses")
+CACHE_LOOKUPS = metrics.REGISTRY.counter("rag_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+SINGLE_FLIGHT = metrics.REGISTRY.counter("rag_single_flight_total", "Query pipeline runs (leader) and coalesced requests", ("role",))
+LOG_RECORDS = metrics.REGISTRY.counter("rag_log_records_total", "Structured log records written or dropped", ("result",))
+QUEUE_DEPTH = metrics.REGISTRY.gauge("rag_ingest_queue_depth", "Pending Celery ingestion tasks", ("queue",))
+worker_stages = metrics.SharedStageSink(Config())
+
+def collect_metrics():
+    """Refreshes metrics owned by other services right before /metrics renders."""
+    for cache, hits, misses in (
+        ("answer", answer_cache.hits, answer_cache.misses),
+        ("rerank", llm_service._rerank_cache.hits, llm_service._rerank_cache.misses),
+        ("query_embedding", llm_service.query_embedding_hits, llm_service.query_embedding_misses),
+    ):
+        CACHE_LOOKUPS.set_total(hits, cache, "hit")
+        CACHE_LOOKUPS.set_total(misses, cache, "miss")
+    flights = single_flight.get_stats()
+    SINGLE_FLIGHT.set_total(flights["leaders"], "leader")
+    SINGLE_FLIGHT.set_total(flights["followers"], "follower")
+    SINGLE_FLIGHT.set_total(flights["remote_followers"], "remote_follower")
+    logs = logging_service.get_stats()
+    LOG_RECORDS.set_total(logs["written"], "written")
+    LOG_RECORDS.set_total(logs["dropped"], "dropped")
+    try:
+        for queue in ingestion_router.queues:
+            QUEUE_DEPTH.set(ingestion_router.queue_depth(queue), queue)
+        worker_stages.load_into(metrics.WORKER_STAGE_SECONDS)
+    except Exception as e:
+        log.warning("metrics_redis_unavailable", error=str(e))
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
+@app.before_request
+def start_request_trace():
+    """API requests run in a trace, continuing the caller's (W3C traceparent header) if any."""
+    # Request ID on every log record of this request (X-Request-ID header if the caller sent one)
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    logging_service.set_request_id(g.request_id)
+    if request.path.startswith('/api/'):
+        g.trace = tracing.trace(f"{request.method} {request.path}", parent=request.headers.get('traceparent'))
+        g.trace.__enter__()
+
+@app.after_request
+def add_trace_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    parent = tracing.current_traceparent()
+    if parent:
+        response.headers['traceparent'] = parent
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    request_trace = g.pop('trace', None)
+    if request_trace is not None:
+        request_trace.__exit__(type(exc) if exc else None, exc, None)
+
+def requested_profile():
+    """
+    (mode, profile name) when an admin asked to profile this request with the
+    X-Profile header or ?profile= ("sample" or "cprofile"), else (None, None).
+    The profile is stored under the request ID (X-Request-ID response header).
+    """
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None, None
+    user = auth_service.verify_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+    if not user or user.get('role') != 'admin':
+        return None, None
+    return (mode if mode in profiler.MODES else "sample"), g.request_id
+
+def track_stream(events):
+    """Counts an SSE response as in flight while the client is reading it."""
+    INFLIGHT_STREAMS.inc()
+    try:
+        yield from events
+    finally:
+        INFLIGHT_STREAMS.dec()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format: stage latencies, cache hit rates, queue depth, in-flight streams."""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "message": "Multimodal RAG Backend is running"})
 
+@app.route('/api/ready', methods=['GET'])
+def ready_check():
+    """200 once every backend connected at startup, 503 with the per-backend state until then."""
+    ready, backends = readiness.status()
+    return jsonify({"status": "ready" if ready else "starting", "backends": backends}), 200 if ready else 503
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     kb_id = request.args.get('kb_id', 'default')
@@ -249,6 +395,64 @@ def get_stats():
         "db_active": True
     })
 
+def rerank_id(result):
+    """Stable candidate ID for the rerank cache: KB + object UUID (+ parent, whose text is sent)."""
+    meta = result['metadata']
+    return f"{meta.get('kb_id', '')}/{meta.get('doc_id', '')}/{meta.get('parent_id', '')}"
+
+def rerank_kb_ids(results, kb_id):
+    """KBs of the rerank candidates (their generations invalidate cached rerank orders)."""
+    return sorted({r['metadata'].get('kb_id') or kb_id for r in results})
+
+def packed_sources(sources, first_passage, kept):
+    """
+    Sources whose passage survived context packing, deduplicated by (file, page) in
+    rank order. sources[i] belongs to context_docs[first_passage + i].
+    """
+    kept = set(kept)
+    unique_sources, seen_sources = [], set()
+    for i, s in enumerate(sources):
+        key = (s['name'], s['page'])
+        if first_passage + i in kept and key not in seen_sources:
+            seen_sources.add(key)
+            unique_sources.append(s)
+    return unique_sources
+
+def lookup_answer_cache(kb_id, search_query, history, sources, source_ids, context_docs):
+    """
+    (key, query vector, cached payload) for single-turn questions, (None, None, None)
+    otherwise. Both endpoints call it with the reranked context before packing.
+    """
+    if history:
+        return None, None, None
+    try:
+        # System notes (e.g. the file list) shape the answer as much as the sources do
+        notes = hash(tuple(d for d in context_docs if d.startswith(INSTRUCTION_PREFIX)))
+        kb_ids = {kb_id} | {s.get("kb_id", kb_id) for s in sources}
+        key = answer_cache.make_key(kb_ids, source_ids, extra=(llm_service.generation_settings(), notes))
+        if key is None:
+            # KB generations unknown (Redis down): a cached answer could predate an ingest
+            return None, None, None
+        vector = llm_service.get_embedding(search_query)
+        return key, vector, answer_cache.get(key, vector)
+    except Exception as e:
+        log.warning("answer_cache_lookup_failed", error=str(e))
+        return None, None, None
+
+def replay_answer_stream(cached, context_docs, timings=False):
+    """Replays a cached answer as the same SSE events a generated one produces."""
+    yield f"data: {json.dumps({'type': 'metadata', 'sources': cached['sources']})}\n\n"
+    answer = cached["answer"]
+    for start in range(0, len(answer), 32):
+        yield f"data: {json.dumps({'type': 'delta', 'answer': answer[start:start + 32]})}\n\n"
+    stats = {'time': 0, 'tokens': 0, 'doc_count': len(cached['sources']), 'cached': True,
+             'similarity': cached['similarity'], 'context_tokens': 0,
+             'tokens_saved': sum(estimate_tokens(d) for d in context_docs)}
+    if timings:
+        stats['timings'] = tracing.timings()
+    yield f"data: {json.dumps({'stats': stats})}\n\n"
+    yield "data: [DONE]\n\n"
+
 @app.route('/api/query', methods=['POST'])
 def query_rag():
     data = request.json
@@ -259,7 +463,31 @@ def query_rag():
     
     if not query_text:
         return jsonify({"error": "No query provided"}), 400
-    
+    try:
+        filters = parse_filters(data.get('filters'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    pinned = data.get('pinned_kbs')
+    want_timings = bool(data.get('timings'))
+    trace_parent = tracing.current_traceparent()
+    profile_mode, profile_name = requested_profile()
+
+    def run():
+        # The pipeline runs on the flight's thread; continue this request's trace there
+        with profiler.profile(profile_name, profile_mode), \
+                tracing.trace("rag.query", parent=trace_parent, force=want_timings, kb_id=kb_id):
+            return answer_query(query_text, kb_id, history, is_global, filters, pinned, timings=want_timings)
+
+    # Identical concurrent questions share one pipeline run (a profiled request gets its own)
+    key = single_flight.key("response", kb_id, query_text, history, is_global=is_global, filters=filters, pinned=pinned,
+                            timings=want_timings, profile=profile_name)
+    result = single_flight.call(key, run,
+                                on_error=lambda e: {"error": f"Internal server error: {str(e)}"})
+    QUERIES.inc("query")
+    return jsonify(result), (500 if "error" in result else 200)
+
+def answer_query(query_text, kb_id, history, is_global, filters, pinned, timings=False):
+    """RAG pipeline behind /api/query; returns the response body (stats.timings: per-stage ms, if asked)."""
     # Switch to the specified knowledge base
     db = get_vector_db(kb_id)
     
@@ -277,12 +505,17 @@ def query_rag():
         alpha = 0.7
         n_results = 40
         
+    # The local reranker scores candidates against their chunk vectors
+    local_rerank = llm_service.rerank_provider() == "local"
     if is_global:
-        search_results = db.global_query(search_query, n_results=n_results, alpha=alpha)
+        search_results = db.global_query(search_query, n_results=n_results, alpha=alpha, pinned=pinned, filters=filters,
+                                         include_vector=local_rerank)
     else:
-        search_results = db.query(search_query, n_results=n_results, alpha=alpha)
+        search_results = db.query(search_query, n_results=n_results, alpha=alpha, filters=filters,
+                                  include_vector=local_rerank)
     context_docs = []
     sources = []
+    source_ids = []
     
     # Intent detection: list files
     list_keywords = ["列出", "哪些文件", "什么文件", "所有文件", "file list", "list files", "有", "什么内容", "文件库", "库里", "库中", "show me files", "files you have"]
@@ -295,10 +528,14 @@ def query_rag():
         else:
             context_docs.append(f"【系统提示】当前知识库（ID: {kb_id}）目前是空的，没有已索引的文件。")
     
+    first_passage = len(context_docs)
     if search_results:
         raw_docs = [r['text'] for r in search_results]
         # Perform Rerank
-        reranked_indices = llm_service.rerank(search_query, raw_docs, top_n=5)
+        reranked_indices = llm_service.rerank(search_query, raw_docs, top_n=5,
+                                              ids=[rerank_id(r) for r in search_results],
+                                              vectors=[r.get('vector') for r in search_results] if local_rerank else None,
+                                              kb_ids=rerank_kb_ids(search_results, kb_id))
         
         for idx in reranked_indices:
             result = search_results[idx]
@@ -307,6 +544,7 @@ def query_rag():
             
             context_with_source = f"【文件：{source_file}】\n{result['text']}"
             context_docs.append(context_with_source)
+            source_ids.append(rerank_id(result))
             
             sources.append({
                 "name": source_file,
@@ -317,32 +555,41 @@ def query_rag():
             })
     
     if not context_docs:
-        return jsonify({"answer": "抱歉，在知识库中未找到相关资料。", "sources": []})
+        return {"answer": "抱歉，在知识库中未找到相关资料。", "sources": []}
     
+    cache_key, query_vector, cached = lookup_answer_cache(kb_id, search_query, history, sources, source_ids, context_docs)
+    if cached:
+        stats = {"time": 0, "tokens": 0, "doc_count": cached["doc_count"],
+                 "cached": True, "similarity": cached["similarity"]}
+        if timings:
+            stats["timings"] = tracing.timings()
+        return {"answer": cached["answer"], "sources": cached["sources"], "stats": stats}
+
+    context_docs, history, packing = llm_service.pack_context(query_text, context_docs, history)
+    log.debug("context_packed", tokens=packing["tokens_after"], budget=packing["budget"],
+              saved=packing["tokens_saved"], duplicates=packing["duplicates"])
+
     start_time = time.time()
     answer, usage = llm_service.generate_response(query_text, context_docs, history=history)
     end_time = time.time()
     duration = round(end_time - start_time, 2)
     
-    # Deduplicate sources preserving order
-    unique_sources = []
-    seen_sources = set()
-    for s in sources:
-        # Create a unique key directly from the dictionary items
-        key = (s['name'], s['page'])
-        if key not in seen_sources:
-            seen_sources.add(key)
-            unique_sources.append(s)
+    # Only cite what the model was shown
+    unique_sources = packed_sources(sources, first_passage, packing["kept"])
+
+    if cache_key is not None and usage:
+        answer_cache.put(cache_key, query_vector, {"answer": answer, "sources": unique_sources, "doc_count": len(sources)})
             
-    return jsonify({
-        "answer": answer,
-        "sources": unique_sources,
-        "stats": {
-            "time": duration,
-            "tokens": usage.get("total_tokens", 0),
-            "doc_count": len(sources) # total chunks found before dedup/limit
-        }
-    })
+    stats = {
+        "time": duration,
+        "tokens": usage.get("total_tokens", 0),
+        "doc_count": len(sources), # total chunks found before dedup/limit
+        "context_tokens": packing["tokens_after"],
+        "tokens_saved": packing["tokens_saved"]
+    }
+    if timings:
+        stats["timings"] = tracing.timings()
+    return {"answer": answer, "sources": unique_sources, "stats": stats}
 
 @app.route('/api/query/stream', methods=['POST'])
 @require_auth
@@ -359,15 +606,49 @@ def query_rag_stream():
         
         if not query_text:
             return jsonify({"error": "No query provided"}), 400
+        try:
+            filters = parse_filters(data.get('filters'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        print(f"DEBUG: Streaming query in KB '{kb_id}' (Global: {is_global}): {query_text[:50]}...")
+        pinned = data.get('pinned_kbs')
         
         # Switch to the specified knowledge base
         try:
-            db = get_vector_db(kb_id)
+            get_vector_db(kb_id)
         except Exception as e:
-            print(f"ERROR: Failed to switch to KB '{kb_id}': {e}")
+            log.error("kb_switch_failed", kb=kb_id, error=str(e))
             return jsonify({"error": f"Failed to access knowledge base: {str(e)}"}), 500
+
+        want_timings = bool(data.get('timings'))
+        trace_parent = tracing.current_traceparent()
+        profile_mode, profile_name = requested_profile()
+
+        def run():
+            with profiler.profile(profile_name, profile_mode), \
+                    tracing.trace("rag.query_stream", parent=trace_parent, force=want_timings, kb_id=kb_id):
+                yield from stream_query_events(query_text, kb_id, history, is_global, filters, pinned,
+                                               timings=want_timings)
+
+        # Identical concurrent questions share one pipeline run; every request gets its token stream
+        key = single_flight.key("stream", kb_id, query_text, history, is_global=is_global, filters=filters, pinned=pinned,
+                                timings=want_timings, profile=profile_name)
+        events = single_flight.subscribe(key, run, on_error=stream_error)
+        QUERIES.inc("stream")
+        return Response(stream_with_context(track_stream(events)), content_type='text/event-stream')
+    except Exception as e:
+        log.error("stream_request_failed", error=str(e))
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+def stream_error(e):
+    """Error answer and end of stream, as one SSE chunk."""
+    return f"data: {json.dumps({'answer': f'抱歉，生成内容时遇到严重错误：{str(e)}'})}\n\ndata: [DONE]\n\n"
+
+def stream_query_events(query_text, kb_id, history, is_global, filters, pinned, timings=False):
+    """RAG pipeline behind /api/query/stream; yields its SSE chunks (final stats.timings if asked)."""
+    try:
+        log.info("stream_query", kb=kb_id, is_global=is_global, query=query_text[:50])
+        db = get_vector_db(kb_id)
         
         # Contextual Query Rewriting
         search_query = llm_service.rewrite_query(query_text, history)
@@ -376,7 +657,7 @@ def query_rag_stream():
         try:
             # 1.1 Intent Detection for parameter optimization
             intent = llm_service.detect_intent(query_text)
-            print(f"DEBUG: Detected intent: {intent}")
+            log.debug("intent", intent=intent)
             
             alpha = None
             n_results = 20
@@ -387,18 +668,22 @@ def query_rag_stream():
                 alpha = 0.7 # Semantic centric
                 n_results = 40
                 
+            local_rerank = llm_service.rerank_provider() == "local"
             if is_global:
-                search_results = db.global_query(search_query, n_results=n_results, alpha=alpha)
+                search_results = db.global_query(search_query, n_results=n_results, alpha=alpha, pinned=pinned, filters=filters,
+                                                 include_vector=local_rerank)
             else:
-                search_results = db.query(search_query, n_results=n_results, alpha=alpha)
-            print(f"DEBUG: Retrieval returned {len(search_results)} results for query type {intent}")
+                search_results = db.query(search_query, n_results=n_results, alpha=alpha, filters=filters,
+                                          include_vector=local_rerank)
+            log.debug("retrieval", results=len(search_results), intent=intent)
         except Exception as e:
-            print(f"ERROR: Vector query failed: {e}")
+            log.error("retrieval_failed", kb=kb_id, error=str(e))
             search_results = [] # Fallback to no results
 
             
         context_docs = []
         sources = []
+        source_ids = []
         
         # ... (list_keywords logic unchanged) ...
         # [Existing Intent detection logic here]
@@ -413,15 +698,19 @@ def query_rag_stream():
                 else:
                     context_docs.append(f"【系统提示】当前知识库（ID: {kb_id}）目前是空的，没有已索引的文件。")
             except Exception as e:
-                print(f"ERROR: list_all_filenames failed: {e}")
+                log.error("list_filenames_failed", kb=kb_id, error=str(e))
 
+        first_passage = len(context_docs)
         if search_results:
             raw_docs = [r['text'] for r in search_results]
             # Perform Rerank
             try:
-                print(f"DEBUG: Performing Rerank for {len(raw_docs)} documents...")
-                reranked_indices = llm_service.rerank(search_query, raw_docs, top_n=5)
-                print(f"DEBUG: Rerank returned indices: {reranked_indices}")
+                log.debug("rerank_start", docs=len(raw_docs))
+                reranked_indices = llm_service.rerank(search_query, raw_docs, top_n=5,
+                                                      ids=[rerank_id(r) for r in search_results],
+                                                      vectors=[r.get('vector') for r in search_results] if local_rerank else None,
+                                                      kb_ids=rerank_kb_ids(search_results, kb_id))
+                log.debug("rerank_done", indices=reranked_indices)
                 
                 for idx in reranked_indices:
                     result = search_results[idx]
@@ -429,6 +718,7 @@ def query_rag_stream():
                     source_file = meta.get("source_file", "Unknown")
                     context_with_source = f"【文件：{source_file}】\n{result['text']}"
                     context_docs.append(context_with_source)
+                    source_ids.append(rerank_id(result))
                     sources.append({
                         "name": source_file,
                         "page": meta.get("page_number", 1),
@@ -438,26 +728,29 @@ def query_rag_stream():
                         "content": meta.get("text_snippet", "")
                     })
             except Exception as e:
-                print(f"ERROR: Rerank failed: {e}")
+                log.error("rerank_failed", error=str(e))
                 # Fallback to first few results
                 for result in search_results[:5]:
                     meta = result['metadata']
                     source_file = meta.get("source_file", "Unknown")
                     context_docs.append(f"【文件：{source_file}】\n{result['text']}")
+                    source_ids.append(rerank_id(result))
                     sources.append({"name": source_file, "page": meta.get("chunk_id", 1), "type": "unknown"})
         
-        print(f"DEBUG: Final context_docs count: {len(context_docs)}")
+        cache_key, query_vector, cached = lookup_answer_cache(kb_id, search_query, history, sources, source_ids, context_docs)
+        if cached:
+            log.info("answer_cache_hit", similarity=cached["similarity"])
+            yield from replay_answer_stream(cached, context_docs, timings=timings)
+            return
+
+        context_docs, history, packing = llm_service.pack_context(query_text, context_docs, history)
+        log.debug("context_packed", docs=len(context_docs), tokens=packing["tokens_after"],
+                  budget=packing["budget"], saved=packing["tokens_saved"])
         if context_docs:
-            print(f"DEBUG: First 100 chars of top context: {context_docs[0][:100]}...")
+            log.debug("top_context", preview=context_docs[0][:100])
         
-        # Deduplicate sources
-        unique_sources = []
-        seen_sources = set()
-        for s in sources:
-            key = (s['name'], s['page'])
-            if key not in seen_sources:
-                seen_sources.add(key)
-                unique_sources.append(s)
+        # Only cite what the model was shown
+        unique_sources = packed_sources(sources, first_passage, packing["kept"])
 
         def generate():
             try:
@@ -466,6 +759,8 @@ def query_rag_stream():
                 
                 start_time = time.time()
                 stats_data = {"total_tokens": 0}
+                answer_parts = []
+                failed = False
                 
                 # Then stream content
                 for chunk in llm_service.generate_stream(query_text, context_docs, history=history):
@@ -473,33 +768,41 @@ def query_rag_stream():
                     if isinstance(chunk, dict) and "__stats__" in chunk:
                         stats_data = chunk["__stats__"]
                     else:
+                        answer_parts.append(chunk)
+                        failed = failed or chunk.startswith(("\n[API Error", "\n[Stream Error"))
                         yield f"data: {json.dumps({'type': 'delta', 'answer': chunk})}\n\n"
+
+                if cache_key is not None and answer_parts and not failed:
+                    answer_cache.put(cache_key, query_vector, {"answer": "".join(answer_parts), "sources": unique_sources,
+                                                               "doc_count": len(sources)})
                 
                 # Send final stats
                 end_time = time.time()
                 duration = round(end_time - start_time, 2)
-                yield f"data: {json.dumps({'stats': {'time': duration, 'tokens': stats_data.get('total_tokens', 0), 'doc_count': len(unique_sources)}})}\n\n"
+                stats = {'time': duration, 'tokens': stats_data.get('total_tokens', 0), 'doc_count': len(unique_sources),
+                         'context_tokens': packing['tokens_after'], 'tokens_saved': packing['tokens_saved']}
+                if timings:
+                    stats['timings'] = tracing.timings()
+                yield f"data: {json.dumps({'stats': stats})}\n\n"
                 yield "data: [DONE]\n\n"
             except Exception as e:
-                print(f"ERROR in streaming generation: {e}")
+                log.error("stream_generation_failed", error=str(e))
                 yield f"data: {json.dumps({'answer': f'抱歉，生成内容时遇到严重错误：{str(e)}'})}\n\n"
                 yield "data: [DONE]\n\n"
 
-        return Response(stream_with_context(generate()), content_type='text/event-stream')
+        yield from generate()
     except Exception as e:
-        print(f"ERROR in query_rag_stream entry: {e}")
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        log.error("stream_pipeline_failed", error=str(e))
+        yield stream_error(e)
 
 
 @app.route('/api/preview-text/<path:filename>', methods=['GET'])
 def get_text_preview(filename):
-    print(f"DEBUG: get_text_preview called for {filename}")
     try:
         content = get_vector_db().get_file_content(filename)
-        print(f"DEBUG: content length: {len(content)}")
         return jsonify({"content": content})
     except Exception as e:
-        print(f"DEBUG: error in get_text_preview: {e}")
+        log.error("text_preview_failed", file=filename, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/search', methods=['GET'])
@@ -507,9 +810,14 @@ def global_search():
     query = request.args.get('q')
     if not query:
         return jsonify({"results": []})
+    try:
+        # Optional filters: ?tags=a,b&file_types=pdf&source_files=x.pdf&date_from=2024-01-01&date_to=...
+        filters = filters_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        results = get_vector_db().query(query, n_results=20)
+        results = get_vector_db().query(query, n_results=20, filters=filters)
         formatted = []
         for r in results:
             meta = r.get('metadata', {})
@@ -522,17 +830,16 @@ def global_search():
             })
         return jsonify({"results": formatted})
     except Exception as e:
-        print(f"Search error: {e}")
+        log.error("search_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/ppt-preview/<path:filename>', methods=['GET'])
 def get_ppt_preview(filename):
-    print(f"DEBUG: get_ppt_preview called for {filename}")
     try:
         # URL decode the filename
         from urllib.parse import unquote
         filename = unquote(filename)
-        print(f"DEBUG: decoded filename: {filename}")
+        log.debug("ppt_preview", file=filename)
         
         filename_no_ext = os.path.splitext(filename)[0]
         slides_dir = Config.SLIDES_FOLDER
@@ -540,9 +847,8 @@ def get_ppt_preview(filename):
         # Escape the filename prefix for glob to handle special characters like '[' and ']'
         safe_prefix = glob.escape(filename_no_ext)
         pattern = os.path.join(slides_dir, f"{safe_prefix}_slide_*.jpg")
-        print(f"DEBUG: looking for slides with pattern: {pattern}")
         slide_files = glob.glob(pattern)
-        print(f"DEBUG: found {len(slide_files)} slides")
+        log.debug("ppt_slides", pattern=pattern, slides=len(slide_files))
         
         if not slide_files:
              return jsonify({
@@ -570,7 +876,7 @@ def get_ppt_preview(filename):
         })
 
     except Exception as e:
-        print(f"Error serving PPT preview: {e}")
+        log.error("ppt_preview_failed", file=filename, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/files/batch', methods=['DELETE'])
@@ -583,6 +889,9 @@ def delete_files_batch():
     filenames = data.get('filenames', [])
     if not filenames:
         return jsonify({"error": "No filenames provided"}), 400
+    conflict = reindex_conflict('default')
+    if conflict:
+        return conflict
         
     deleted_count = 0
     errors = []
@@ -599,6 +908,7 @@ def delete_files_batch():
                 if filename in files:
                     file_path = os.path.join(root, filename)
                     os.remove(file_path)
+                    blob_store.release(file_path)
                     file_deleted = True
                     break
             
@@ -676,9 +986,12 @@ def download_files_batch():
 @require_auth
 def delete_file(filename):
     kb_id = request.args.get('kb_id', 'default')
-    print(f"DEBUG: Deleting file {filename} from KB {kb_id}")
+    log.info("delete_file", file=filename, kb=kb_id)
     if not getattr(request, 'current_user', {}).get('role') == 'admin':
         return jsonify({"error": "Admin access required"}), 403
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
         
     try:
         # 1. Switch to correct KB and Delete from VectorDB
@@ -698,6 +1011,7 @@ def delete_file(filename):
                 if filename in files:
                     file_path = os.path.join(root, filename)
                     os.remove(file_path)
+                    blob_store.release(file_path)
                     file_deleted = True
                     break
             if file_deleted: break
@@ -713,7 +1027,7 @@ def delete_file(filename):
         return jsonify({"message": f"File {filename} deleted successfully"}), 200
 
     except Exception as e:
-        print(f"Error deleting file {filename}: {e}")
+        log.error("delete_file_failed", file=filename, kb=kb_id, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 # Note: Legacy ThreadPoolExecutor removed in favor of Celery in worker.py
@@ -747,6 +1061,9 @@ def upload_file():
     kb = get_kb_service().get(kb_id)
     if not kb:
         return jsonify({"error": f"Knowledge base '{kb_id}' not found"}), 404
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
     
     filename = file.filename
     
@@ -755,18 +1072,100 @@ def upload_file():
     os.makedirs(save_dir, exist_ok=True)
     
     file_path = os.path.join(save_dir, filename)
-    file.save(file_path)
+    # Hash while streaming to disk; identical content is stored once across KBs
+    file_hash, is_duplicate = blob_store.save_stream(file.stream, file_path)
     
-    # Submit task to Celery
-    task = process_file_task.delay(file_path, kb_id)
+    # Submit task to Celery, routed by estimated cost
+    task, route = enqueue_file(file_path, kb_id, file_hash=file_hash, cached=is_duplicate,
+                               profile=requested_profile()[0])
     
     return jsonify({
         "message": f"File {file.filename} uploaded to '{kb['name']}'. Processing started.", 
         "task_id": task.id,
         "kb_id": kb_id,
+        "queue": route["queue"],
+        "duplicate": is_duplicate,
         "status": "pending"
     }), 202
 
+# ============ Chunked / Resumable Upload Routes ============
+
+@app.route('/api/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """Start a resumable upload: {filename, kb_id, size, chunk_size?}."""
+    data = request.json or {}
+    kb_id = data.get('kb_id', 'default')
+    kb = get_kb_service().get(kb_id)
+    if not kb:
+        return jsonify({"error": f"Knowledge base '{kb_id}' not found"}), 404
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
+    
+    try:
+        manifest = chunked_uploads.init(
+            data.get('filename'), kb_id, int(data.get('size', -1)), data.get('chunk_size')
+        )
+    except (UploadError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "upload_id": manifest["upload_id"],
+        "chunk_size": manifest["chunk_size"],
+        "total_chunks": manifest["total_chunks"]
+    }), 201
+
+@app.route('/api/upload/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """Upload one chunk as the raw request body. Chunks may arrive in any order and be retried."""
+    try:
+        status = chunked_uploads.put_chunk(upload_id, index, request.stream)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"received": len(status["received"]), "missing": len(status["missing"])})
+
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """Which chunks have arrived, so an interrupted client can resume."""
+    try:
+        return jsonify(chunked_uploads.status(upload_id))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route('/api/upload/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Assemble, dedup and queue processing. Repeated calls return the same task."""
+    try:
+        kb_id = chunked_uploads.status(upload_id)["kb_id"]
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 404
+    # The chunks stay; the client completes again once the re-index has finished
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
+    
+    save_dir = os.path.join(Config.UPLOAD_FOLDER, kb_id)
+    os.makedirs(save_dir, exist_ok=True)
+    
+    profile_mode = requested_profile()[0]
+
+    def enqueue(file_path, file_hash, is_duplicate):
+        task, route = enqueue_file(file_path, kb_id, file_hash=file_hash, cached=is_duplicate, profile=profile_mode)
+        return {
+            "task_id": task.id,
+            "kb_id": kb_id,
+            "queue": route["queue"],
+            "file_hash": file_hash,
+            "duplicate": is_duplicate
+        }
+    
+    try:
+        result = chunked_uploads.complete(upload_id, save_dir, enqueue)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    return jsonify({**result, "status": "pending"}), 202
+
 @app.route('/api/tasks/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     status_data = get_async_task_status(task_id)
@@ -779,6 +1178,46 @@ def get_task_status(task_id):
         
     return jsonify(status_data)
 
+@app.route('/api/queues', methods=['GET'])
+@require_admin
+def get_queue_metrics():
+    """Depth and wait/run latency for each ingestion queue."""
+    try:
+        return jsonify(ingestion_router.get_metrics())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/storage', methods=['GET'])
+@require_admin
+def get_storage_stats():
+    """Deduplicated blob storage (referenced vs stored bytes) and the parent side store."""
+    return jsonify({**blob_store.get_stats(), "parent_store": get_vector_db().parent_store.get_stats()})
+
+@app.route('/api/answer-cache', methods=['GET', 'DELETE'])
+@require_admin
+def answer_cache_stats():
+    """Semantic answer cache hit rate and size; DELETE empties it."""
+    if request.method == 'DELETE':
+        answer_cache.clear()
+    return jsonify(answer_cache.get_stats())
+
+@app.route('/api/single-flight', methods=['GET'])
+@require_admin
+def single_flight_stats():
+    """Coalesced query pipelines: leaders, followers attached to them, and flights in progress."""
+    return jsonify(single_flight.get_stats())
+
+@app.route('/api/profiles', methods=['GET'])
+@require_admin
+def list_profiles():
+    """Stored request/task profiles, newest first (.folded: collapsed stacks, .prof: pstats)."""
+    return jsonify(profiler.list_profiles())
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+@require_admin
+def download_profile(name):
+    return send_from_directory(profiler.profiles_folder(), name, as_attachment=True)
+
 @app.route('/api/config', methods=['GET'])
 @require_admin
 def get_config():
@@ -809,13 +1248,16 @@ def create_knowledge_base():
     data = request.json
     name = data.get('name', '').strip()
     description = data.get('description', '')
+    settings = {k: data[k] for k in ('tokenizer', 'pinned', 'vector_compression', 'vector_dims') if k in data}
     
     if not name:
         return jsonify({"error": "Name is required"}), 400
     
     try:
-        kb = get_kb_service().create(name, description)
+        kb = get_kb_service().create(name, description, settings=settings)
         return jsonify(kb), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -825,6 +1267,7 @@ def delete_knowledge_base(kb_id):
     """Delete a knowledge base and all its data."""
     try:
         get_kb_service().delete(kb_id)
+        blob_store.release_prefix(kb_id)
         return jsonify({"message": f"Knowledge base '{kb_id}' deleted"})
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -849,6 +1292,59 @@ def rename_knowledge_base(kb_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/knowledge-bases/<kb_id>/settings', methods=['PUT'])
+@require_admin
+def update_knowledge_base_settings(kb_id):
+    """
+    Update KB settings (tokenizer, pinned, vector storage). Changing index settings triggers a re-index.
+    Vector storage changes that need a new collection stay in "pending_settings" until the
+    re-index has built it; until then search keeps using the live collection and settings.
+    """
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
+    try:
+        kb, changed = get_kb_service().update_settings(kb_id, request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    task_id = None
+    if any(key in REINDEX_SETTINGS for key in changed):
+        # Existing objects were indexed with the old settings; rebuild from checkpoints
+        task_id = enqueue_rechunk(kb_id, trace_parent=tracing.current_traceparent()).id
+        kb = get_kb_service().get(kb_id)
+    return jsonify({**kb, "reindex_task_id": task_id})
+
+@app.route('/api/knowledge-bases/<kb_id>/rechunk', methods=['POST'])
+@require_admin
+def rechunk_knowledge_base(kb_id):
+    """
+    Re-chunk a knowledge base (reuses extracted content). Given Chunker parameters
+    are stored with the KB, so later uploads and re-indexes keep using them.
+    """
+    if not get_kb_service().get(kb_id):
+        return jsonify({"error": "Knowledge base not found"}), 404
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
+    
+    data = request.json or {}
+    try:
+        params = {}
+        if data.get('chunk_size') is not None:
+            params["chunk_size"] = int(data['chunk_size'])
+        if data.get('chunk_overlap') is not None:
+            params["chunk_overlap"] = int(data['chunk_overlap'])
+        if data.get('semantic_threshold') is not None:
+            params["semantic_threshold"] = float(data['semantic_threshold'])
+        get_kb_service().update_settings(kb_id, params)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid chunker parameters: {e}"}), 400
+    
+    # The task reads the (now updated) chunk settings of the KB
+    task = enqueue_rechunk(kb_id, trace_parent=tracing.current_traceparent(), profile=requested_profile()[0])
+    return jsonify({"task_id": task.id, "kb_id": kb_id, "status": "pending"}), 202
+
 @app.route('/api/knowledge-bases/<kb_id>/documents', methods=['GET'])
 @require_auth
 def get_kb_documents(kb_id):
@@ -864,6 +1360,8 @@ def get_kb_documents(kb_id):
     # Pre-fetch stats for all documents in this KB to avoid N+1 queries
     db = get_vector_db(kb_id)
     all_stats = db.get_all_docs_stats()
+    # Duplicate uploads share their blob's mtime; the store records each upload's time
+    upload_times = blob_store.upload_times()
     
     if kb_id == 'default':
         # Recursive scan for default KB
@@ -875,6 +1373,7 @@ def get_kb_documents(kb_id):
                 file_path = os.path.join(root, filename)
                 if os.path.isfile(file_path):
                     stat = os.stat(file_path)
+                    uploaded_at = upload_times.get(os.path.abspath(file_path), stat.st_mtime)
                     ext = filename.split('.')[-1].lower() if '.' in filename else ''
                     
                     # Get info from pre-fetched stats
@@ -884,8 +1383,8 @@ def get_kb_documents(kb_id):
                         "name": filename,
                         "type": ext,
                         "size": f"{stat.st_size / 1024:.1f} KB" if stat.st_size < 1024*1024 else f"{stat.st_size / (1024*1024):.1f} MB",
-                        "date": time.strftime('%Y-%m-%d %H:%M', time.localtime(stat.st_mtime)),
-                        "mtime": stat.st_mtime,  # For sorting
+                        "date": time.strftime('%Y-%m-%d %H:%M', time.localtime(uploaded_at)),
+                        "mtime": uploaded_at,  # For sorting
                         "status": "indexed",
                         "tags": doc_info["tags"],
                         "chunks": doc_info["chunks"]
@@ -898,6 +1397,7 @@ def get_kb_documents(kb_id):
                 file_path = os.path.join(kb_dir, filename)
                 if os.path.isfile(file_path):
                     stat = os.stat(file_path)
+                    uploaded_at = upload_times.get(os.path.abspath(file_path), stat.st_mtime)
                     ext = filename.split('.')[-1].lower() if '.' in filename else ''
                     
                     doc_info = all_stats.get(filename, {"tags": [], "chunks": 0})
@@ -906,8 +1406,8 @@ def get_kb_documents(kb_id):
                         "name": filename,
                         "type": ext,
                         "size": f"{stat.st_size / 1024:.1f} KB" if stat.st_size < 1024*1024 else f"{stat.st_size / (1024*1024):.1f} MB",
-                        "date": time.strftime('%Y-%m-%d %H:%M', time.localtime(stat.st_mtime)),
-                        "mtime": stat.st_mtime,  # For sorting
+                        "date": time.strftime('%Y-%m-%d %H:%M', time.localtime(uploaded_at)),
+                        "mtime": uploaded_at,  # For sorting
                         "status": "indexed",
                         "tags": doc_info["tags"],
                         "chunks": doc_info["chunks"]
@@ -928,6 +1428,9 @@ def update_document_tags():
     
     if not filename:
         return jsonify({"error": "Filename is required"}), 400
+    conflict = reindex_conflict(kb_id)
+    if conflict:
+        return conflict
         
     db = get_vector_db(kb_id)
     success = db.update_document_tags(filename, tags)
@@ -23,17 +23,50 @@ class Config:
     WEAVIATE_HOST = os.getenv("WEAVIATE_HOST", "weaviate")
     WEAVIATE_PORT = int(os.getenv("WEAVIATE_PORT", 8080))
     WEAVIATE_GRPC_PORT = int(os.getenv("WEAVIATE_GRPC_PORT", 50051))
+    # Global search fan-out: shared worker pool size and per-KB time budget (seconds)
+    GLOBAL_QUERY_MAX_WORKERS = int(os.getenv("GLOBAL_QUERY_MAX_WORKERS", 16))
+    GLOBAL_QUERY_KB_TIMEOUT = float(os.getenv("GLOBAL_QUERY_KB_TIMEOUT", 8.0))
+    # int8-compressed KBs: candidates re-scored with float32 vectors after the quantized search
+    VECTOR_RESCORE_LIMIT = int(os.getenv("VECTOR_RESCORE_LIMIT", 200))
     
     # Redis & Celery
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
     CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
     CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
-    
+    # Run tasks inside the API process instead of a worker (single-process dev and load tests, no Redis broker)
+    CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "0") == "1"
+    # Connect Weaviate and Redis in the background at API startup (see /api/ready)
+    STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+    # Ingestion queues (routed by estimated cost = file type weight x size in MB)
+    INGEST_QUEUE_INTERACTIVE = "ingest_interactive"
+    INGEST_QUEUE_DEFAULT = "ingest_default"
+    INGEST_QUEUE_BULK = "ingest_bulk"
+    INGEST_INTERACTIVE_MAX_COST = float(os.getenv("INGEST_INTERACTIVE_MAX_COST", 2.0))
+    INGEST_BULK_MIN_COST = float(os.getenv("INGEST_BULK_MIN_COST", 40.0))
+    # Every N pending files in one KB lowers its next task's priority by one step
+    INGEST_FAIRNESS_STEP = int(os.getenv("INGEST_FAIRNESS_STEP", 5))
+    # Backlog counters expire after this long without any routing or finished task (seconds)
+    INGEST_PENDING_TTL = int(os.getenv("INGEST_PENDING_TTL", 6 * 3600))
+    # A re-index into a new collection blocks uploads/deletes of its KB; a crashed one stops blocking after this (seconds)
+    REINDEX_LOCK_TTL = int(os.getenv("REINDEX_LOCK_TTL", 6 * 3600))
+
+    # Chunked/resumable uploads
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+    UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+
     # Models
     TEXT_EMBEDDING_MODEL = "m3e-base"  # Local or API-based
     QWEN_LLM_MODEL = "qwen-plus"
     QWEN_VL_MODEL = "qwen-vl-plus"
+    # VLM image description: images are downscaled before upload and described
+    # by at most VLM_MAX_WORKERS concurrent calls. VLM_BASE_URL switches to an
+    # OpenAI-compatible endpoint (e.g. a local stand-in).
+    VLM_MAX_IMAGE_SIDE = int(os.getenv("VLM_MAX_IMAGE_SIDE", 1280))
+    VLM_MAX_WORKERS = int(os.getenv("VLM_MAX_WORKERS", 4))
+    VLM_BASE_URL = os.getenv("VLM_BASE_URL")
 
     @classmethod
     def init_app(cls):
@@ -55,7 +88,30 @@ class Config:
         "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1", # Used for openai-compatible
         "top_k": 60,
         "temperature": 0.5,
-        "hybrid_alpha": 0.5  # 0 = BM25 only, 1 = Vector only, 0.5 = Equal weight
+        "hybrid_alpha": 0.5,  # 0 = BM25 only, 1 = Vector only, 0.5 = Equal weight
+        # Post-retrieval scoring (see services/scoring.py)
+        "scoring": {"recency_boost": 0.1, "recency_window_days": 30, "filename_boost": 3.0, "rrf_k": 60},
+        # Global search routing: search only the top_m most relevant KBs (0 = search all)
+        "kb_routing": {"top_m": 8, "vector_weight": 0.6},
+        # Reranking: provider auto | dashscope | local; max_chars caps each text sent to a remote reranker
+        "rerank": {"provider": "auto", "max_chars": 1500, "vector_weight": 0.5},
+        # Prompt context budget in estimated tokens (see services/context_packer.py for all keys)
+        "context_budget": {"default_tokens": 6000, "history_tokens": 1000,
+                           "models": {"qwen-turbo": 6000, "qwen-plus": 12000, "qwen-max": 6000,
+                                      "deepseek": 12000, "gpt-4o": 12000}},
+        # Semantic answer cache: cosine threshold between paraphrased questions (see services/answer_cache.py)
+        "answer_cache": {"enabled": True, "threshold": 0.95, "ttl_seconds": 3600, "max_entries": 1000},
+        # Coalesce identical concurrent queries; redis=True shares flights across worker processes
+        "single_flight": {"enabled": True, "redis": False, "lease_seconds": 180, "follower_timeout": 90},
+        # Request tracing: exporter "jsonl" (DATA_FOLDER/traces), "otlp" (endpoint = collector /v1/traces) or "none";
+        # jsonl files are kept retention_days and capped at max_file_mb per day
+        "tracing": {"enabled": True, "sample_rate": 0.1, "exporter": "jsonl", "endpoint": "",
+                    "retention_days": 7, "max_file_mb": 200},
+        # Structured JSON-lines logs in DATA_FOLDER/logs; sample_rates e.g. {"debug": 0.1}
+        "logging": {"level": "info", "sample_rates": {}, "buffer_size": 10000, "console_level": "warning",
+                    "retention_days": 14, "max_file_mb": 500},
+        # On-demand profiling (X-Profile header / ?profile= for admins); profiles kept in DATA_FOLDER/profiles
+        "profiling": {"max_concurrent": 2, "interval_ms": 5, "max_profiles": 200}
     }
 
     @classmethod
@@ -0,0 +1,200 @@
+"""
+Semantic Answer Cache
+Serves a previous answer when a new question is a close paraphrase of a cached
+one (query embedding cosine >= threshold) AND retrieval picked exactly the same
+top-k sources from the same KB generations. Each KB's generation is bumped on
+every ingest or delete, so cached answers never outlive the content
+they were generated from. While Redis (which holds the generations) is
+unreachable, the cache is bypassed: a worker's bumps could not be seen. Entries expire after ttl_seconds and the least
+recently used are evicted beyond max_entries.
+Conversations with history are never cached: the answer depends on the thread.
+"""
+import time
+import threading
+import itertools
+from collections import OrderedDict
+import numpy as np
+from services.logging_service import get_logger
+
+log = get_logger("answer_cache")
+
+DEFAULT_SETTINGS = {"enabled": True, "threshold": 0.95, "ttl_seconds": 3600, "max_entries": 1000}
+
+GENERATION_KEY = "answer_cache:generation"
+
+
+class KBGenerations:
+    """
+    Per-KB content generation counters in a Redis hash, shared by the API and
+    the Celery workers. While Redis is unreachable (retried every RETRY_SECONDS)
+    generations are unknown: get() returns None and callers skip their caches.
+    Bumps made meanwhile are replayed once Redis is back, so entries cached by
+    other processes before the outage do not match again.
+    """
+    RETRY_SECONDS = 30
+    _unsent = set()     # KBs bumped while Redis was down (per process)
+    _unsent_lock = threading.Lock()
+
+    def __init__(self, config, redis_client=None):
+        self.config = config
+        self._redis = redis_client
+        self._down_until = 0
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+            from redis.retry import Retry
+            from redis.backoff import NoBackoff
+            # On the query path: fail fast and fall back rather than retry with backoff
+            self._redis = redis.Redis(host=self.config.REDIS_HOST, port=self.config.REDIS_PORT,
+                                      socket_connect_timeout=0.5, socket_timeout=0.5,
+                                      retry=Retry(NoBackoff(), 0))
+        return self._redis
+
+    def _redis_available(self):
+        return time.time() >= self._down_until
+
+    def _redis_failed(self, e):
+        log.warning("kb_generations_unavailable", error=str(e), retry_seconds=self.RETRY_SECONDS)
+        self._down_until = time.time() + self.RETRY_SECONDS
+
+    def _send_unsent(self):
+        with self._unsent_lock:
+            unsent = set(self._unsent)
+        for kb_id in unsent:
+            self.redis.hincrby(GENERATION_KEY, kb_id, 1)
+            with self._unsent_lock:
+                self._unsent.discard(kb_id)
+
+    def get(self, kb_ids):
+        """Tuple of (kb_id, generation) for the given KBs, sorted by kb_id; None while Redis is down."""
+        kb_ids = sorted(set(kb_ids))
+        if not kb_ids:
+            return ()
+        if not self._redis_available():
+            return None
+        try:
+            self._send_unsent()
+            values = self.redis.hmget(GENERATION_KEY, kb_ids)
+            return tuple((kb, int(v or 0)) for kb, v in zip(kb_ids, values))
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    def bump(self, kb_id):
+        """Marks a KB's content as changed."""
+        with self._unsent_lock:
+            self._unsent.add(kb_id)
+        if self._redis_available():
+            try:
+                self._send_unsent()
+            except Exception as e:
+                self._redis_failed(e)
+
+
+class AnswerCache:
+    def __init__(self, config, generations=None):
+        self.config = config
+        self.generations = generations or KBGenerations(config)
+        self._entries = OrderedDict()   # entry id -> entry, least recently used first
+        self._buckets = {}              # cache key -> set of entry ids
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def settings(self):
+        return {**DEFAULT_SETTINGS, **(self.config.SETTINGS.get("answer_cache") or {})}
+
+    def make_key(self, kb_ids, source_ids, extra=None):
+        """
+        Exact-match part of the lookup, shared by the blocking and streaming
+        endpoints; extra covers anything else that shaped the answer (model,
+        generation settings, system notes).
+        Take the key before generating, so an ingest during generation is not masked.
+        None while the KB generations are unknown (Redis down): nothing is cached.
+        """
+        generations = self.generations.get(kb_ids)
+        if generations is None:
+            return None
+        return (generations, frozenset(source_ids), extra)
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else None
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets.get(entry["key"])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry["key"]]
+
+    def get(self, key, vector):
+        """Cached payload for the closest paraphrase under `key`, or None."""
+        settings = self.settings()
+        if not settings["enabled"] or key is None or vector is None:
+            return None
+        query = self._unit(vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, float(settings["threshold"])
+            for entry_id in list(self._buckets.get(key, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created"] > settings["ttl_seconds"]:
+                    self._drop(entry_id)
+                    self.expirations += 1
+                    continue
+                if query is None or len(entry["vector"]) != len(query):
+                    continue
+                score = float(entry["vector"] @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return {**self._entries[best_id]["payload"], "similarity": round(best_score, 4)}
+
+    def put(self, key, vector, payload):
+        settings = self.settings()
+        if not settings["enabled"] or key is None or vector is None:
+            return
+        unit = self._unit(vector)
+        if unit is None:
+            return
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {"key": key, "vector": unit, "payload": payload, "created": time.time()}
+            self._buckets.setdefault(key, set()).add(entry_id)
+            self.stores += 1
+            while len(self._entries) > max(int(settings["max_entries"]), 0):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "settings": self.settings(),
+            }
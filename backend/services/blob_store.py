@@ -0,0 +1,162 @@
+"""
+Content-Addressed Blob Store
+Uploaded files are hashed while streaming to disk and stored once per content
+hash. KB directories hold hard links (or copies, across filesystems) to the blob,
+and a reference table maps KB file paths to hashes for cleanup. Links of one
+blob share its mtime, so the table also records each file's upload time. When a blob
+loses its last reference, on_collect(content_hash) lets derived data keyed by
+the same hash (ingestion checkpoints) be dropped with it.
+"""
+import os
+import shutil
+import time
+import sqlite3
+import hashlib
+import tempfile
+
+class BlobStore:
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, config, on_collect=None):
+        self.config = config
+        self.on_collect = on_collect
+        self.root = os.path.join(config.DATA_FOLDER, "blobs")
+        os.makedirs(self.root, exist_ok=True)
+        self.db_path = os.path.join(self.root, "refs.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                " rel_path TEXT PRIMARY KEY, content_hash TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_hash ON refs (content_hash)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(refs)")}
+            if "uploaded_at" not in columns:
+                conn.execute("ALTER TABLE refs ADD COLUMN uploaded_at REAL")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def blob_path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def _rel_path(self, file_path):
+        return os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.config.UPLOAD_FOLDER))
+
+    def save_stream(self, stream, dest_path):
+        """
+        Streams `stream` to disk while hashing it, stores the blob once and
+        places `dest_path` as a reference to it.
+        Returns (content_hash, is_duplicate).
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: stream.read(self.BLOCK_SIZE), b''):
+                    digest.update(block)
+                    f.write(block)
+            return self.add_file(tmp_path, dest_path, digest.hexdigest())
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def add_file(self, src_path, dest_path, content_hash):
+        """
+        Moves an already-hashed file into the store (unless the blob exists)
+        and links it to `dest_path`. Returns (content_hash, is_duplicate).
+        """
+        blob = self.blob_path(content_hash)
+        is_duplicate = os.path.exists(blob)
+        if not is_duplicate:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(src_path, blob)
+
+        previous_hash = self.lookup(dest_path)
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        try:
+            os.link(blob, dest_path)
+        except OSError:
+            # Different filesystem (e.g. separate Docker volumes): fall back to a copy
+            shutil.copyfile(blob, dest_path)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO refs (rel_path, content_hash, uploaded_at) VALUES (?, ?, ?)",
+                (self._rel_path(dest_path), content_hash, time.time())
+            )
+            # Overwriting a KB file with new content may orphan the old blob
+            if previous_hash and previous_hash != content_hash:
+                self._collect(conn, previous_hash)
+        return content_hash, is_duplicate
+
+    def lookup(self, file_path):
+        """Content hash for a stored KB file, or None if it predates the store."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash FROM refs WHERE rel_path = ?", (self._rel_path(file_path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def upload_time(self, file_path):
+        """When a KB file was uploaded; its mtime if it predates the store."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT uploaded_at FROM refs WHERE rel_path = ?", (self._rel_path(file_path),)
+            ).fetchone()
+        return row[0] if row and row[0] is not None else os.path.getmtime(file_path)
+
+    def upload_times(self):
+        """{absolute KB file path: upload time} of every recorded file (for listings)."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT rel_path, uploaded_at FROM refs WHERE uploaded_at IS NOT NULL").fetchall()
+        upload_folder = os.path.abspath(self.config.UPLOAD_FOLDER)
+        return {os.path.join(upload_folder, rel_path): uploaded_at for rel_path, uploaded_at in rows}
+
+    def release(self, file_path):
+        """Drops the reference for a KB file; deletes the blob once unreferenced."""
+        self._release_where("rel_path = ?", (self._rel_path(file_path),))
+
+    def release_prefix(self, rel_dir):
+        """Drops all references under a KB directory (e.g. when the KB is deleted)."""
+        prefix = rel_dir.rstrip("/\\") + os.sep
+        self._release_where("substr(rel_path, 1, ?) = ?", (len(prefix), prefix))
+
+    def _release_where(self, clause, params):
+        with self._connect() as conn:
+            hashes = [r[0] for r in conn.execute(f"SELECT DISTINCT content_hash FROM refs WHERE {clause}", params)]
+            if not hashes:
+                return
+            conn.execute(f"DELETE FROM refs WHERE {clause}", params)
+            for content_hash in hashes:
+                self._collect(conn, content_hash)
+
+    def _collect(self, conn, content_hash):
+        """Deletes a blob that no KB file references any more."""
+        remaining = conn.execute(
+            "SELECT COUNT(*) FROM refs WHERE content_hash = ?", (content_hash,)
+        ).fetchone()[0]
+        if remaining == 0:
+            blob = self.blob_path(content_hash)
+            if os.path.exists(blob):
+                os.remove(blob)
+            if self.on_collect:
+                self.on_collect(content_hash)
+
+    def get_stats(self):
+        """Logical (referenced) vs physical (stored) bytes."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT content_hash, COUNT(*) FROM refs GROUP BY content_hash").fetchall()
+        physical = logical = 0
+        for content_hash, ref_count in rows:
+            blob = self.blob_path(content_hash)
+            size = os.path.getsize(blob) if os.path.exists(blob) else 0
+            physical += size
+            logical += size * ref_count
+        return {
+            "blobs": len(rows),
+            "references": sum(r[1] for r in rows),
+            "logical_bytes": logical,
+            "physical_bytes": physical,
+        }
@@ -0,0 +1,171 @@
+"""
+Prompt Context Packing
+Fits the retrieved passages and the chat history into a per-model token budget
+before generation: each passage is trimmed to the sentences around its
+query-relevant ones, near-duplicate passages are dropped, and history keeps
+only the newest turns that fit. Token counts are local estimates (no tokenizer
+download): one token per CJK character, four characters per token otherwise.
+"""
+import re
+from services.tokenizer import get_tokenizer
+
+DEFAULT_BUDGET = {
+    "default_tokens": 6000,
+    # Context tokens per model (exact name, else longest matching prefix, else default_tokens)
+    "models": {"qwen-turbo": 6000, "qwen-plus": 12000, "qwen-max": 6000, "deepseek": 12000, "gpt-4o": 12000},
+    "history_tokens": 1000,      # carved out of the model budget
+    "history_turns": 5,
+    "passage_tokens": 1500,      # cap per passage after trimming
+    "instruction_tokens": 2000,  # cap for system notes such as the KB file list
+    "window_sentences": 2,       # sentences kept on each side of a relevant one
+    "dedup_threshold": 0.8,      # shingle overlap above which a lower-ranked passage is dropped
+}
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;\n])|(?<=\.)\s+')
+_HEADER = re.compile(r'^【[^】\n]*】[^\n]*\n')
+INSTRUCTION_PREFIX = "【系统提示】"
+ELLIPSIS = "……"
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate(text, max_tokens):
+    """Longest prefix of text within max_tokens, cut at a line or sentence end where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    boundary = max(cut.rfind("\n"), cut.rfind("。"))
+    if boundary > lo // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + ELLIPSIS
+
+
+def _shingles(text, n=4):
+    text = re.sub(r'\s+', '', text.lower())
+    return {hash(text[i:i + n]) for i in range(max(len(text) - n + 1, 1))}
+
+
+class ContextPacker:
+    def __init__(self, settings=None):
+        self.settings = {**DEFAULT_BUDGET, **(settings or {})}
+        self._tokenizer = get_tokenizer("bigram")
+
+    def budget_for(self, model):
+        models = self.settings.get("models") or {}
+        model = (model or "").lower()
+        if model in models:
+            return int(models[model])
+        prefixes = [m for m in models if model.startswith(m.lower())]
+        if prefixes:
+            return int(models[max(prefixes, key=len)])
+        return int(self.settings["default_tokens"])
+
+    def trim_passage(self, query_terms, text):
+        """Keeps a passage's header line and the sentence windows around its query-relevant sentences."""
+        header = ""
+        match = _HEADER.match(text)
+        if match:
+            header, text = match.group(0), text[match.end():]
+        sentences = [s for s in _SENTENCE_END.split(text) if s and s.strip()]
+        lowered = [s.lower() for s in sentences]
+        scores = [sum(1 for term in query_terms if term in s) for s in lowered]
+        best = max(scores) if scores else 0
+        if not best:
+            return header + text
+        window = int(self.settings["window_sentences"])
+        keep = set()
+        for i, score in enumerate(scores):
+            if score * 2 >= best:
+                keep.update(range(max(0, i - window), min(len(sentences), i + window + 1)))
+
+        parts, previous = [], -1
+        for i in sorted(keep):
+            if i != previous + 1:
+                parts.append(ELLIPSIS)
+            parts.append(sentences[i])
+            previous = i
+        if previous != len(sentences) - 1:
+            parts.append(ELLIPSIS)
+        return header + "".join(parts).strip()
+
+    def truncate_history(self, history, max_tokens):
+        """Newest turns first, within max_tokens; returned in chronological order."""
+        kept, used = [], 0
+        for message in reversed(history[-int(self.settings["history_turns"]):]):
+            content = message.get("content") or ""
+            cost = estimate_tokens(content)
+            if used + cost > max_tokens:
+                remaining = max_tokens - used
+                if remaining >= 50:
+                    kept.append({**message, "content": _truncate(content, remaining)})
+                break
+            kept.append(message)
+            used += cost
+        return kept[::-1]
+
+    def pack(self, query, context_docs, history=None, model=None):
+        """
+        Returns (context_docs, history, report). context_docs stay in rank order;
+        report has budget, tokens_before, tokens_after, tokens_saved, passages_in,
+        passages_out, duplicates and kept (input indices of the packed docs).
+        """
+        history = history or []
+        turns = history[-int(self.settings["history_turns"]):]
+        tokens_before = (sum(estimate_tokens(d) for d in context_docs)
+                         + sum(estimate_tokens(m.get("content") or "") for m in turns))
+
+        budget = self.budget_for(model)
+        history_budget = min(int(self.settings["history_tokens"]), budget // 4)
+        packed_history = self.truncate_history(history, history_budget)
+        remaining = budget - sum(estimate_tokens(m["content"]) for m in packed_history)
+
+        query_terms = set(self._tokenizer.tokenize((query or "").lower()).split())
+        threshold = float(self.settings["dedup_threshold"])
+        passage_cap = int(self.settings["passage_tokens"])
+        instruction_cap = int(self.settings["instruction_tokens"])
+        packed, kept, seen, duplicates = [], [], [], 0
+        for index, doc in enumerate(context_docs):
+            if remaining < 50:
+                break
+            # Instructions (e.g. the file list) are kept as written, only capped
+            is_instruction = doc.startswith(INSTRUCTION_PREFIX)
+            if is_instruction:
+                text = _truncate(doc, min(remaining, instruction_cap))
+            else:
+                text = self.trim_passage(query_terms, doc)
+                shingles = _shingles(text)
+                if any(len(shingles & other) / min(len(shingles), len(other)) >= threshold for other in seen):
+                    duplicates += 1
+                    continue
+                seen.append(shingles)
+                text = _truncate(text, min(remaining, passage_cap))
+            packed.append(text)
+            kept.append(index)
+            remaining -= estimate_tokens(text)
+
+        tokens_after = (sum(estimate_tokens(d) for d in packed)
+                        + sum(estimate_tokens(m["content"]) for m in packed_history))
+        report = {
+            "budget": budget,
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": max(tokens_before - tokens_after, 0),
+            "passages_in": len(context_docs),
+            "passages_out": len(packed),
+            "duplicates": duplicates,
+            "kept": kept,
+        }
+        return packed, packed_history, report
@@ -0,0 +1,39 @@
+"""
+Daily JSONL Files
+Retention for the per-day files the log writer (DATA_FOLDER/logs) and the span
+exporter (DATA_FOLDER/traces) append to: files older than retention_days are
+deleted when a new day's file is opened, and a day's file stops growing at
+max_file_mb (later records of that day are dropped and counted).
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+DAY_PATTERN = re.compile(r"-(\d{4}-\d{2}-\d{2})\.jsonl$")
+
+
+def day_path(folder, prefix, day=None):
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(folder, f"{prefix}-{day}.jsonl")
+
+
+def prune(folder, prefix, retention_days):
+    """Deletes prefix-YYYY-MM-DD.jsonl files older than retention_days (0 keeps everything)."""
+    if not retention_days or not os.path.isdir(folder):
+        return 0
+    cutoff = (datetime.now() - timedelta(days=int(retention_days))).strftime("%Y-%m-%d")
+    removed = 0
+    for name in os.listdir(folder):
+        match = DAY_PATTERN.search(name)
+        if name.startswith(f"{prefix}-") and match and match.group(1) < cutoff:
+            try:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def over_cap(size_bytes, max_file_mb):
+    """True once a day's file has reached max_file_mb (0 = no cap)."""
+    return bool(max_file_mb) and size_bytes >= float(max_file_mb) * 1024 * 1024
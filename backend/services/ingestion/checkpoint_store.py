@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from services.vector_codec import VectorCodec
+from services.logging_service import get_logger
+
+log = get_logger("checkpoint_store")
+
+class CheckpointStore:
+    """
+    On-disk cache of intermediate ingestion artifacts, keyed by file content hash and stage.
+    Layout: <DATA_FOLDER>/checkpoints/<hash[:2]>/<hash>/<stage>[.<variant>].jsonl|.npy
+
+    Stages:
+    - extracted: processor output (pages/slides/sheets), one JSON record per line
+    - chunks:    parent/child chunk records, variant = chunker signature
+    - vectors:   embedding matrix aligned with indexed chunks, variant = chunker + model;
+                 float32 .npy, or a float16 .npz for KBs with lossy checkpoints
+    """
+    READ_BLOCK = 1024 * 1024
+
+    def __init__(self, config):
+        self.config = config
+        self.root = os.path.join(config.DATA_FOLDER, "checkpoints")
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def hash_file(cls, file_path):
+        """SHA-256 of the file content, streamed in 1 MB blocks."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(cls.READ_BLOCK), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, file_hash, stage, variant, ext):
+        name = f"{stage}.{variant}{ext}" if variant else f"{stage}{ext}"
+        return os.path.join(self.root, file_hash[:2], file_hash, name)
+
+    def _atomic_write(self, path, write_fn):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+
+    def load_records(self, file_hash, stage, variant=""):
+        """Returns the list of records for a stage, or None if not checkpointed."""
+        path = self._path(file_hash, stage, variant, ".jsonl")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except Exception as e:
+            log.warning("checkpoint_unreadable", path=path, error=str(e), fallback="recompute")
+            return None
+
+    def save_records(self, file_hash, stage, records, variant=""):
+        path = self._path(file_hash, stage, variant, ".jsonl")
+        def write(f):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+                f.write(b"\n")
+        self._atomic_write(path, write)
+
+    def load_vectors(self, file_hash, variant="", lossless=False):
+        """
+        Returns a float32 matrix, or None. The float32 copy is preferred; a
+        compressed copy is decoded unless `lossless` precision is required.
+        """
+        paths = [self._path(file_hash, "vectors", variant, ".npy")]
+        if not lossless:
+            paths.append(self._path(file_hash, "vectors", variant, ".npz"))
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                if path.endswith(".npz"):
+                    with np.load(path) as arrays:
+                        return VectorCodec.decode(arrays)
+                return np.load(path)
+            except Exception as e:
+                log.warning("checkpoint_unreadable", path=path, error=str(e), fallback="recompute")
+        return None
+
+    def save_vectors(self, file_hash, vectors, variant="", codec=None):
+        """Stores float32, or float16 when the KB's codec allows lossy checkpoints."""
+        if codec is not None and codec.checkpoint_lossy:
+            path = self._path(file_hash, "vectors", variant, ".npz")
+            self._atomic_write(path, lambda f: np.savez(f, **codec.encode(vectors)))
+        else:
+            path = self._path(file_hash, "vectors", variant, ".npy")
+            self._atomic_write(path, lambda f: np.save(f, np.asarray(vectors, dtype=np.float32)))
+
+    def delete(self, file_hash):
+        """Drops every checkpoint of a file content (once no KB file has that content)."""
+        shutil.rmtree(os.path.join(self.root, file_hash[:2], file_hash), ignore_errors=True)
+
+    def has_stage(self, file_hash, stage, variant=""):
+        if stage == "vectors":
+            return any(os.path.exists(self._path(file_hash, stage, variant, ext)) for ext in (".npy", ".npz"))
+        return os.path.exists(self._path(file_hash, stage, variant, ".jsonl"))
@@ -1,17 +1,25 @@
 import re
 import numpy as np
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 class Chunker:
-    def __init__(self, chunk_size=800, chunk_overlap=100, embedding_fn=None):
+    def __init__(self, chunk_size=800, chunk_overlap=100, embedding_fn=None, semantic_threshold=0.85):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.embedding_fn = embedding_fn
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", "。", "！", "？", " ", ""]
-        )
+        self.semantic_threshold = semantic_threshold
+        self._splitter = None
+
+    @property
+    def splitter(self):
+        """Recursive character splitter, built on first use (langchain is slow to import)."""
+        if self._splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+            )
+        return self._splitter
 
     def split_sentences(self, text):
         """Simple regex-based sentence splitter for Chinese/English."""
@@ -24,10 +32,23 @@ class Chunker:
         v1, v2 = np.array(v1), np.array(v2)
         return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
 
-    def semantic_split(self, text, threshold=0.85):
+    def signature(self, mode="semantic", embedding_model=None):
+        """
+        Identifies the chunking parameters, e.g. for keying cached chunk output.
+        semantic_split groups sentences by their embeddings, so the embedding
+        model is part of the signature whenever an embedding_fn is set.
+        """
+        signature = f"{mode}-s{self.chunk_size}-o{self.chunk_overlap}-t{self.semantic_threshold}"
+        if self.embedding_fn and embedding_model:
+            signature = f"{signature}-{embedding_model}"
+        return signature
+
+    def semantic_split(self, text, threshold=None):
         """
         Groups sentences into chunks based on semantic similarity.
         """
+        if threshold is None:
+            threshold = self.semantic_threshold
         if not self.embedding_fn:
             return self.splitter.split_text(text)
 
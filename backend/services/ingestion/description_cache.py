@@ -0,0 +1,113 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# Perceptual fallback: 256-bit dHash, matched within a Hamming distance, same aspect ratio only
+HASH_SIZE = 16
+MAX_DISTANCE = 12
+# Hashes with fewer set (or cleared) bits than this carry too little structure to identify an
+# image: blank, solid and low-contrast text slides all hash to (nearly) all zeros
+MIN_INFORMATIVE_BITS = 32
+ASPECT_TOLERANCE = 0.02
+
+class DescriptionCache:
+    """
+    Persistent cache of VLM image descriptions.
+    Entries are found by exact content hash first, then by a near-identical
+    perceptual hash (dHash) with the same aspect ratio, so a re-saved,
+    re-compressed or downscaled copy of the same diagram is also a hit.
+    """
+    def __init__(self, config):
+        self.db_path = os.path.join(config.DATA_FOLDER, "vlm_cache.sqlite3")
+        os.makedirs(config.DATA_FOLDER, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions ("
+                " content_hash TEXT NOT NULL, phash TEXT, model TEXT NOT NULL,"
+                " description TEXT NOT NULL, created_at REAL,"
+                " PRIMARY KEY (content_hash, model))"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(descriptions)")}
+            if "aspect" not in columns:
+                # Rows from before the aspect column have 64-bit hashes and are never matched perceptually
+                conn.execute("ALTER TABLE descriptions ADD COLUMN aspect REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_descriptions_aspect ON descriptions (model, aspect)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def content_hash(image_path):
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def perceptual_hash(image):
+        """
+        256-bit difference hash of a PIL image, as 64 hex chars.
+        None when the hash is too uniform to tell images apart.
+        """
+        from PIL import Image
+        small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+        bits = 0
+        for row in range(HASH_SIZE):
+            for col in range(HASH_SIZE):
+                left = pixels[row * (HASH_SIZE + 1) + col]
+                right = pixels[row * (HASH_SIZE + 1) + col + 1]
+                bits = (bits << 1) | (1 if left > right else 0)
+        ones = bin(bits).count("1")
+        if min(ones, HASH_SIZE * HASH_SIZE - ones) < MIN_INFORMATIVE_BITS:
+            return None
+        return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+    @staticmethod
+    def aspect_ratio(image):
+        width, height = image.size
+        return round(width / height, 3) if height else None
+
+    def get(self, content_hash, phash, model, aspect=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT description FROM descriptions WHERE content_hash = ? AND model = ?",
+                (content_hash, model)
+            ).fetchone()
+            if row is None and phash and aspect:
+                row = self._nearest(conn, phash, model, aspect)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    @staticmethod
+    def _nearest(conn, phash, model, aspect):
+        """Closest stored hash of the same model and aspect ratio within MAX_DISTANCE, as a (description,) row."""
+        target = int(phash, 16)
+        best, best_distance = None, MAX_DISTANCE + 1
+        rows = conn.execute(
+            "SELECT phash, description FROM descriptions WHERE model = ? AND aspect BETWEEN ? AND ?"
+            " AND phash IS NOT NULL",
+            (model, aspect * (1 - ASPECT_TOLERANCE), aspect * (1 + ASPECT_TOLERANCE))
+        )
+        for stored, description in rows:
+            if len(stored) != len(phash):
+                continue
+            distance = bin(int(stored, 16) ^ target).count("1")
+            if distance < best_distance:
+                best, best_distance = (description,), distance
+        return best
+
+    def put(self, content_hash, phash, model, description, aspect=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO descriptions (content_hash, phash, model, description, created_at, aspect)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, phash, model, description, time.time(), aspect)
+            )
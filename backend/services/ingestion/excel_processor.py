@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 
 class ExcelProcessor:
     def __init__(self, config):
@@ -8,6 +7,7 @@ class ExcelProcessor:
     def process(self, file_path):
         results = []
         filename = os.path.basename(file_path)
+        import pandas as pd
         
         try:
             if file_path.endswith('.csv'):
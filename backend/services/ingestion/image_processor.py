@@ -1,11 +1,28 @@
-import dashscope
 from http import HTTPStatus
 import os
+import base64
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.ingestion.description_cache import DescriptionCache
+from services.logging_service import get_logger
+
+log = get_logger("image_processor")
 
 class ImageProcessor:
+    # Bounds concurrent VLM calls across all threads of this process
+    _vlm_slots = None
+    _slots_lock = threading.Lock()
+
     def __init__(self, config):
         self.config = config
-        dashscope.api_key = getattr(self.config, 'DASH_SCOPE_API_KEY', os.getenv("DASH_SCOPE_API_KEY"))
+        self.api_key = getattr(self.config, 'DASH_SCOPE_API_KEY', os.getenv("DASH_SCOPE_API_KEY"))
+        self.max_side = getattr(self.config, 'VLM_MAX_IMAGE_SIDE', 1280)
+        self.max_workers = getattr(self.config, 'VLM_MAX_WORKERS', 4)
+        self.cache = DescriptionCache(config)
+        with ImageProcessor._slots_lock:
+            if ImageProcessor._vlm_slots is None:
+                ImageProcessor._vlm_slots = threading.BoundedSemaphore(self.max_workers)
 
     def process(self, image_path):
         """
@@ -17,23 +34,102 @@ class ImageProcessor:
             'page_number': 1
         }]
 
+    def describe_images(self, image_paths):
+        """Describe several images concurrently. Returns descriptions in input order."""
+        if not image_paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(image_paths))) as executor:
+            return list(executor.map(self.describe_image, image_paths))
+
     def describe_image(self, image_path):
+        model = getattr(self.config, 'QWEN_VL_MODEL', 'qwen-vl-plus')
+        content_hash = DescriptionCache.content_hash(image_path)
+        upload_path, phash, aspect = self._prepare_image(image_path)
+        try:
+            cached = self.cache.get(content_hash, phash, model, aspect)
+            if cached is not None:
+                return cached
+
+            with ImageProcessor._vlm_slots:
+                description, ok = self._call_vlm(upload_path, model)
+            # Only successful descriptions are cached; errors should be retried next time
+            if ok:
+                self.cache.put(content_hash, phash, model, description, aspect)
+            return description
+        finally:
+            if upload_path != image_path:
+                os.remove(upload_path)
+
+    def _prepare_image(self, image_path):
+        """
+        Downscales/recompresses the image to a VLM-appropriate resolution.
+        Returns (path_to_upload, perceptual_hash, aspect_ratio). Falls back to the original file.
+        """
+        try:
+            from PIL import Image
+            with Image.open(image_path) as img:
+                phash = DescriptionCache.perceptual_hash(img)
+                aspect = DescriptionCache.aspect_ratio(img)
+                if max(img.size) <= self.max_side and os.path.getsize(image_path) <= 1024 * 1024:
+                    return image_path, phash, aspect
+                img.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                fd, tmp_path = tempfile.mkstemp(suffix='.jpg')
+                with os.fdopen(fd, 'wb') as f:
+                    img.save(f, 'JPEG', quality=85, optimize=True)
+                return tmp_path, phash, aspect
+        except Exception as e:
+            log.warning("image_downscale_skipped", path=image_path, error=str(e))
+            return image_path, None, None
+
+    def _call_vlm(self, image_path, model):
+        """Returns (description, success)."""
+        prompt = '请详细描述这张图片的内容、风格和可能的用途。如果是图表，请提取其中的关键文字和数据。'
+        base_url = getattr(self.config, 'VLM_BASE_URL', None)
+        if base_url:
+            return self._call_openai_compatible(base_url, image_path, model, prompt)
+
         import warnings
+        import dashscope
         # Suppress the unclosed file ResourceWarning from dashscope's internal OSS upload
         warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed file")
-        
+
         content = [
             {'image': f'file://{os.path.abspath(image_path)}'},
-            {'text': '请详细描述这张图片的内容、风格和可能的用途。如果是图表，请提取其中的关键文字和数据。'}
+            {'text': prompt}
         ]
         messages = [{'role': 'user', 'content': content}]
         try:
             # Use the model from config if available, otherwise default to qwen-vl-plus
-            model = getattr(self.config, 'QWEN_VL_MODEL', 'qwen-vl-plus')
-            response = dashscope.MultiModalConversation.call(model=model, messages=messages)
+            response = dashscope.MultiModalConversation.call(model=model, messages=messages, api_key=self.api_key)
             if response.status_code == HTTPStatus.OK:
-                return response.output.choices[0].message.content[0]['text']
+                return response.output.choices[0].message.content[0]['text'], True
             else:
-                return f"无法描述图片内容: {response.message}"
+                return f"无法描述图片内容: {response.message}", False
+        except Exception as e:
+            return f"图片解析异常: {e}", False
+
+    def _call_openai_compatible(self, base_url, image_path, model, prompt):
+        """Calls an OpenAI-compatible vision endpoint (e.g. a local stand-in VLM)."""
+        import requests
+        with open(image_path, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('ascii')
+        payload = {
+            "model": model,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded}"}},
+                    {"type": "text", "text": prompt},
+                ],
+            }],
+        }
+        headers = {"Authorization": f"Bearer {self.config.SETTINGS.get('api_key', '')}"}
+        try:
+            resp = requests.post(f"{base_url.rstrip('/')}/chat/completions", json=payload, headers=headers, timeout=120)
+            if resp.status_code == 200:
+                return resp.json()['choices'][0]['message']['content'], True
+            return f"无法描述图片内容: {resp.status_code}", False
         except Exception as e:
-            return f"图片解析异常: {e}"
+            return f"图片解析异常: {e}", False
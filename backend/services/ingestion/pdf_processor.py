@@ -1,5 +1,4 @@
 import os
-import pdfplumber
 
 class PDFProcessor:
     def __init__(self, config):
@@ -9,6 +8,7 @@ class PDFProcessor:
         results = []
         base_filename = os.path.basename(file_path).replace('.pdf', '')
         
+        import pdfplumber
         try:
             with pdfplumber.open(file_path) as pdf:
                 for i, page in enumerate(pdf.pages):
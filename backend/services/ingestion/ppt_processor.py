@@ -1,5 +1,4 @@
 import os
-from pptx import Presentation
 
 class PPTProcessor:
     def __init__(self, config):
@@ -9,6 +8,7 @@ class PPTProcessor:
         """
         Processes a PPT file: extracts text per slide and renders slide images as JPGs.
         """
+        from pptx import Presentation
         import aspose.slides as slides
         
         # 1. Text extraction via python-pptx (cleaner)
@@ -1,5 +1,4 @@
 import os
-import docx
 
 class WordProcessor:
     def __init__(self, config):
@@ -8,6 +7,7 @@ class WordProcessor:
     def process(self, file_path):
         results = []
         base_filename = os.path.basename(file_path).replace('.docx', '')
+        import docx
         
         try:
             doc = docx.Document(file_path)
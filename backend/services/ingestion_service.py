@@ -1,5 +1,6 @@
 import os
 import uuid
+import numpy as np
 from datetime import datetime
 from services.ingestion.text_cleaner import TextCleaner
 from services.ingestion.chunker import Chunker
@@ -9,9 +10,15 @@ from services.ingestion.word_processor import WordProcessor
 from services.ingestion.excel_processor import ExcelProcessor
 from services.ingestion.image_processor import ImageProcessor
 from services.ingestion.svg_processor import SVGProcessor
+from services.ingestion.checkpoint_store import CheckpointStore
+from services.blob_store import BlobStore
+from services.metrics import timed, timed_method
+from services.logging_service import get_logger
+
+log = get_logger("ingestion")
 
 class IngestionService:
-    def __init__(self, config, vector_db):
+    def __init__(self, config, vector_db, chunker=None):
         self.config = config
         self.vector_db = vector_db
         # Initialize processors
@@ -23,113 +30,218 @@ class IngestionService:
         self.svg_processor = SVGProcessor(config)
         
         # Initialize helper modules
-        # Initialize helper modules
-        self.chunker = Chunker(embedding_fn=self.vector_db.embedding_fn)
+        self._chunker = chunker
+        self._kb_chunkers = {}
+        self.checkpoints = CheckpointStore(config)
+        self.blob_store = BlobStore(config)
 
-    def process_file(self, file_path):
+    @property
+    def chunker(self):
+        """The explicit chunker, else one built from the current KB's chunk settings."""
+        if self._chunker is not None:
+            return self._chunker
+        from services.kb_service import load_kb_settings, CHUNK_SETTINGS
+        settings = load_kb_settings(self.vector_db.kb_id)
+        params = tuple(settings[key] for key in CHUNK_SETTINGS)
+        if params not in self._kb_chunkers:
+            self._kb_chunkers[params] = Chunker(embedding_fn=self.vector_db.embedding_fn,
+                                                **dict(zip(CHUNK_SETTINGS, params)))
+        return self._kb_chunkers[params]
+
+    @timed_method("ingestion", "process_file")
+    def process_file(self, file_path, file_hash=None):
         """
         Orchestrates the ingestion process:
         1. Identify file type
         2. Extract content using appropriate processor
         3. Clean and Semantic-Chunk content (Small-to-Big)
-        4. Generate embeddings and store in VectorDB
+        4. Generate embeddings and store in VectorDB (parents with children go to the ParentStore)
+
+        Stages 2-4 are checkpointed by file content hash, so a retry after a
+        failed upsert (or a re-chunk with new Chunker parameters) resumes from
+        the last completed stage instead of re-parsing and re-embedding.
         """
         filename = os.path.basename(file_path)
         ext = filename.split('.')[-1].lower()
+        file_type = self.FILE_TYPES.get(ext)
+        if not file_type:
+            return {"status": "skipped", "message": f"Unsupported extension: {ext}"}
         
         file_stats = os.stat(file_path)
         file_size = self._format_size(file_stats.st_size)
-        upload_date = datetime.fromtimestamp(file_stats.st_mtime).strftime('%Y-%m-%d')
-
-        documents = []
-        metadatas = []
-        ids = []
+        # Duplicate uploads are links to one blob (one mtime): use the recorded upload time
+        upload_ts = self.blob_store.upload_time(file_path)
+        upload_date = datetime.fromtimestamp(upload_ts).strftime('%Y-%m-%d')
 
         try:
-            extracted_data = [] # List of {'text_content': str, 'page_number': int, ...}
-            
-            # ... (File type identification logic, unchanged) ...
-            if ext in ['ppt', 'pptx']:
-                extracted_data = self.ppt_processor.process(file_path)
-                file_type = "ppt"
-            elif ext in ['pdf']:
-                extracted_data = self.pdf_processor.process(file_path)
-                file_type = "pdf"
-            elif ext in ['docx']:
-                extracted_data = self.word_processor.process(file_path)
-                file_type = "docx"
-            elif ext in ['xlsx', 'xls', 'csv']:
-                extracted_data = self.excel_processor.process(file_path)
-                file_type = "excel"
-            elif ext in ['png', 'jpg', 'jpeg']:
-                extracted_data = self.image_processor.process(file_path)
-                file_type = "image"
-            elif ext in ['svg']:
-                extracted_data = self.svg_processor.process(file_path)
-                file_type = "svg"
-            elif ext in ['txt', 'md']:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    text_content = f.read()
-                extracted_data = [{"text_content": text_content, "page_number": 1}]
-                file_type = "text"
+            file_hash = file_hash or CheckpointStore.hash_file(file_path)
+
+            # Stage 1: Extraction
+            extracted_data = self.checkpoints.load_records(file_hash, "extracted")
+            if extracted_data is None:
+                with timed("ingestion", "extract"):
+                    extracted_data = self._extract(file_path, ext)
+                self.checkpoints.save_records(file_hash, "extracted", extracted_data)
             else:
-                return {"status": "skipped", "message": f"Unsupported extension: {ext}"}
-            
-            # RAG 2.0: Parent-Child Chunking
-            for item in extracted_data:
-                raw_text = item.get('text_content', '')
-                cleaned_text = TextCleaner.clean(raw_text)
-                if not cleaned_text or len(cleaned_text) < 5:
-                    continue
-                
-                # 1. Store the Full Page/Block as Parent
-                parent_id = str(uuid.uuid4())
-                documents.append(cleaned_text)
-                parent_meta = {
+                log.info("ingest_resumed", file=filename, reused="extracted content")
+
+            # Stage 2: RAG 2.0 Parent-Child Chunking
+            chunker = self.chunker
+            chunk_variant = chunker.signature(embedding_model=self.config.TEXT_EMBEDDING_MODEL)
+            chunks = self.checkpoints.load_records(file_hash, "chunks", chunk_variant)
+            if chunks is None:
+                with timed("ingestion", "chunk"):
+                    chunks = self._chunk(extracted_data, chunker)
+                self.checkpoints.save_records(file_hash, "chunks", chunks, chunk_variant)
+
+            if not chunks:
+                return {"status": "warning", "message": "No content extracted"}
+
+            # Parents with their own children go to the side store; only the rest is embedded
+            has_children = {c["parent_id"] for c in chunks if not c["is_parent"]}
+            indexed = [c for c in chunks if not (c["is_parent"] and c["id"] in has_children)]
+            side_parents = [c for c in chunks if c["is_parent"] and c["id"] in has_children]
+
+            # Stage 3: Embedding
+            # Keyed by the embedding alone: a compression change re-encodes, it doesn't re-embed
+            codec = self.vector_db.codec()
+            vector_variant = f"{chunk_variant}-{self.config.TEXT_EMBEDDING_MODEL}-indexed"
+            vectors = None
+            if self.vector_db.embedding_fn:
+                vectors = self.checkpoints.load_vectors(file_hash, vector_variant, lossless=codec.needs_float32)
+                if vectors is None or len(vectors) != len(indexed):
+                    with timed("ingestion", "embed"):
+                        embeddings = self.vector_db.embedding_fn([c["text"] for c in indexed])
+                    if not embeddings or any(e is None for e in embeddings):
+                        raise RuntimeError("Embedding failed; chunks are checkpointed for retry")
+                    self.checkpoints.save_vectors(file_hash, embeddings, vector_variant, codec)
+                    vectors = embeddings
+
+            # Stage 4: Upsert. Object IDs are derived from (KB, file, chunk), so
+            # a retried upsert overwrites its own partial writes instead of duplicating.
+            def object_id(chunk_id):
+                return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.vector_db.kb_id}/{filename}/{chunk_id}"))
+
+            # Parents first, so a searchable child always resolves to its parent
+            side_ids = [object_id(c["id"]) for c in side_parents]
+            with timed("ingestion", "store_parents"):
+                self.vector_db.parent_store.put_file(
+                    self.vector_db.kb_id, filename,
+                    [(pid, c["text"], c.get("page_number", 0)) for pid, c in zip(side_ids, side_parents)]
+                )
+                # Drop parent objects indexed by earlier versions
+                self.vector_db.delete_objects(side_ids)
+
+            documents = []
+            metadatas = []
+            ids = []
+            for chunk in indexed:
+                meta = {
                     "source_file": filename,
                     "file_type": file_type,
                     "upload_date": upload_date,
-                    "page_number": item.get('page_number', 0),
-                    "is_parent": True,
-                    "doc_id": parent_id
+                    "upload_ts": upload_ts,
+                    "page_number": chunk.get("page_number", 0),
+                    "is_parent": chunk["is_parent"],
                 }
-                if 'image_url' in item: parent_meta['image_url'] = item['image_url']
-                metadatas.append(parent_meta)
-                ids.append(parent_id)
-                
-                # 2. Store Semantic Fragments as Children
-                # Using semantic mode for better boundaries
-                child_chunks = self.chunker.split_text(cleaned_text, mode="semantic")
-                
-                for i, chunk in enumerate(child_chunks):
-                    # Skip if the chunk is identical to parent (no need to double store)
-                    if len(child_chunks) == 1 and chunk == cleaned_text:
-                        continue
-                        
-                    documents.append(chunk)
-                    child_meta = {
-                        "source_file": filename,
-                        "file_type": file_type,
-                        "upload_date": upload_date,
-                        "page_number": item.get('page_number', 0),
-                        "chunk_index": i,
-                        "is_parent": False,
-                        "parent_id": parent_id
-                    }
-                    if 'image_url' in item: child_meta['image_url'] = item['image_url']
-                    metadatas.append(child_meta)
-                    ids.append(str(uuid.uuid4()))
-            
-            if documents:
-                self.vector_db.add_documents(documents, metadatas, ids)
-                return {"status": "success", "total_chunks": len(documents)}
-            else:
-                return {"status": "warning", "message": "No content extracted"}
+                if chunk["is_parent"]:
+                    meta["doc_id"] = object_id(chunk["id"])
+                else:
+                    meta["chunk_index"] = chunk.get("chunk_index", 0)
+                    meta["parent_id"] = object_id(chunk["parent_id"])
+                if chunk.get("image_url"):
+                    meta["image_url"] = chunk["image_url"]
+                documents.append(chunk["text"])
+                metadatas.append(meta)
+                ids.append(object_id(chunk["id"]))
+
+            if isinstance(vectors, np.ndarray):
+                vectors = vectors.tolist()
+            self.vector_db.add_documents(documents, metadatas, ids, vectors=vectors)
+            # Only after the new version is in: drop chunks it no longer has
+            self.vector_db.delete_stale_objects(filename, ids)
+            try:
+                # Keep the KB routing summary in step with the index (advisory; never fails ingest)
+                with timed("ingestion", "route_update"):
+                    self.vector_db.kb_router.add_file(self.vector_db.kb_id, filename, documents, vectors)
+            except Exception as route_e:
+                log.warning("route_update_failed", file=filename, error=str(route_e))
+            return {"status": "success", "total_chunks": len(documents), "side_parents": len(side_parents)}
 
         except Exception as e:
-            print(f"Error processing file {filename}: {e}")
+            log.error("ingest_failed", file=filename, error=str(e))
             raise e
 
+    FILE_TYPES = {
+        'ppt': 'ppt', 'pptx': 'ppt',
+        'pdf': 'pdf',
+        'docx': 'docx',
+        'xlsx': 'excel', 'xls': 'excel', 'csv': 'excel',
+        'png': 'image', 'jpg': 'image', 'jpeg': 'image',
+        'svg': 'svg',
+        'txt': 'text', 'md': 'text',
+    }
+
+    def _extract(self, file_path, ext):
+        """Returns a list of {'text_content': str, 'page_number': int, ...}"""
+        if ext in ['ppt', 'pptx']:
+            return self.ppt_processor.process(file_path)
+        elif ext in ['pdf']:
+            return self.pdf_processor.process(file_path)
+        elif ext in ['docx']:
+            return self.word_processor.process(file_path)
+        elif ext in ['xlsx', 'xls', 'csv']:
+            return self.excel_processor.process(file_path)
+        elif ext in ['png', 'jpg', 'jpeg']:
+            return self.image_processor.process(file_path)
+        elif ext in ['svg']:
+            return self.svg_processor.process(file_path)
+        else:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                text_content = f.read()
+            return [{"text_content": text_content, "page_number": 1}]
+
+    def _chunk(self, extracted_data, chunker):
+        """
+        Builds parent/child chunk records. IDs are local to the file; they are
+        namespaced per KB and filename at upsert time.
+        """
+        chunks = []
+        for item in extracted_data:
+            raw_text = item.get('text_content', '')
+            cleaned_text = TextCleaner.clean(raw_text)
+            if not cleaned_text or len(cleaned_text) < 5:
+                continue
+            
+            # 1. Store the Full Page/Block as Parent
+            parent_id = f"p{len(chunks)}"
+            chunks.append({
+                "id": parent_id,
+                "text": cleaned_text,
+                "page_number": item.get('page_number', 0),
+                "is_parent": True,
+                "image_url": item.get('image_url'),
+            })
+            
+            # 2. Store Semantic Fragments as Children
+            # Using semantic mode for better boundaries
+            child_chunks = chunker.split_text(cleaned_text, mode="semantic")
+            
+            for i, chunk in enumerate(child_chunks):
+                # Skip if the chunk is identical to parent (no need to double store)
+                if len(child_chunks) == 1 and chunk == cleaned_text:
+                    continue
+                chunks.append({
+                    "id": f"{parent_id}c{i}",
+                    "text": chunk,
+                    "page_number": item.get('page_number', 0),
+                    "chunk_index": i,
+                    "is_parent": False,
+                    "parent_id": parent_id,
+                    "image_url": item.get('image_url'),
+                })
+        return chunks
+
     def _format_size(self, size_bytes):
         for unit in ['B', 'KB', 'MB', 'GB']:
             if size_bytes < 1024:
@@ -0,0 +1,269 @@
+"""
+Knowledge Base Routing Index
+Global search uses this to query only the KBs likely to contain the answer.
+Each KB gets a summary that is updated incrementally at ingest:
+- centroid: sum of its normalized chunk vectors
+- term sketch: hashed chunk-frequency counts of bigram tokens (fixed size per KB)
+Per-file contributions are stored too, so deleting or re-ingesting a file
+subtracts exactly what it added.
+"""
+import os
+import zlib
+import sqlite3
+import threading
+import numpy as np
+from services.tokenizer import get_tokenizer, detokenize
+
+# Routing always uses bigrams so query terms are comparable across KBs,
+# whatever tokenizer each KB uses for BM25.
+ROUTING_TOKENIZER = "bigram"
+
+class KBRouter:
+    SKETCH_BUCKETS = 1 << 15
+
+    def __init__(self, config, folder=None):
+        """folder: where the index lives (default DATA_FOLDER; a staging re-index uses its own)."""
+        self.config = config
+        folder = folder or config.DATA_FOLDER
+        self.db_path = os.path.join(folder, "kb_router.sqlite3")
+        os.makedirs(folder, exist_ok=True)
+        self._tokenizer = get_tokenizer(ROUTING_TOKENIZER)
+        self._snapshot = None
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kbs ("
+                " kb_id TEXT PRIMARY KEY, n_chunks INTEGER NOT NULL, dim INTEGER NOT NULL,"
+                " vec_sum BLOB, sketch BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " kb_id TEXT NOT NULL, filename TEXT NOT NULL, n_chunks INTEGER NOT NULL,"
+                " dim INTEGER NOT NULL, vec_sum BLOB, buckets BLOB NOT NULL, counts BLOB NOT NULL,"
+                " PRIMARY KEY (kb_id, filename))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.isolation_level = None  # explicit BEGIN IMMEDIATE for read-modify-write
+        return conn
+
+    # ---- summaries ----
+
+    def _term_buckets(self, text):
+        """Distinct sketch buckets of the routing tokens in `text`."""
+        tokens = set(self._tokenizer.tokenize(text.lower()).split())
+        return {zlib.crc32(t.encode('utf-8')) % self.SKETCH_BUCKETS for t in tokens}
+
+    def _file_summary(self, texts, vectors):
+        counts = {}
+        for text in texts:
+            for b in self._term_buckets(text):
+                counts[b] = counts.get(b, 0) + 1
+        buckets = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+        vec_sum, dim = None, 0
+        if vectors is not None and len(vectors):
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            vec_sum = (matrix / np.where(norms > 0, norms, 1.0)).sum(axis=0)
+            dim = matrix.shape[1]
+        return len(texts), dim, vec_sum, buckets, values
+
+    def _apply(self, conn, kb_id, n_chunks, dim, vec_sum, buckets, counts, sign):
+        """Adds (sign=1) or subtracts (sign=-1) a file summary from the KB summary."""
+        row = conn.execute("SELECT n_chunks, dim, vec_sum, sketch FROM kbs WHERE kb_id = ?", (kb_id,)).fetchone()
+        if row:
+            kb_chunks, kb_dim = row[0], row[1]
+            kb_vec = np.frombuffer(row[2], dtype=np.float32).copy() if row[2] else None
+            sketch = np.frombuffer(row[3], dtype=np.float32).copy()
+        else:
+            kb_chunks, kb_dim, kb_vec = 0, 0, None
+            sketch = np.zeros(self.SKETCH_BUCKETS, dtype=np.float32)
+
+        kb_chunks = max(0, kb_chunks + sign * n_chunks)
+        np.add.at(sketch, buckets, sign * counts)
+        np.maximum(sketch, 0, out=sketch)
+        if vec_sum is not None:
+            if kb_vec is None or kb_dim != dim:
+                # First vectors for this KB, or the embedding model changed
+                kb_vec, kb_dim = (vec_sum.copy(), dim) if sign > 0 else (None, 0)
+            else:
+                kb_vec += sign * vec_sum
+
+        conn.execute(
+            "INSERT OR REPLACE INTO kbs (kb_id, n_chunks, dim, vec_sum, sketch) VALUES (?, ?, ?, ?, ?)",
+            (kb_id, kb_chunks, kb_dim, kb_vec.tobytes() if kb_vec is not None else None, sketch.tobytes())
+        )
+
+    def _remove_file(self, conn, kb_id, filename):
+        row = conn.execute(
+            "SELECT n_chunks, dim, vec_sum, buckets, counts FROM files WHERE kb_id = ? AND filename = ?",
+            (kb_id, filename)
+        ).fetchone()
+        if not row:
+            return False
+        vec_sum = np.frombuffer(row[2], dtype=np.float32) if row[2] else None
+        self._apply(conn, kb_id, row[0], row[1], vec_sum,
+                    np.frombuffer(row[3], dtype=np.int32), np.frombuffer(row[4], dtype=np.float32), -1)
+        conn.execute("DELETE FROM files WHERE kb_id = ? AND filename = ?", (kb_id, filename))
+        return True
+
+    def _bump(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    def add_file(self, kb_id, filename, texts, vectors=None):
+        """Records a file's chunks in its KB summary (replaces a previous version)."""
+        n_chunks, dim, vec_sum, buckets, counts = self._file_summary(texts, vectors)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._remove_file(conn, kb_id, filename)
+            self._apply(conn, kb_id, n_chunks, dim, vec_sum, buckets, counts, 1)
+            conn.execute(
+                "INSERT INTO files (kb_id, filename, n_chunks, dim, vec_sum, buckets, counts)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kb_id, filename, n_chunks, dim, vec_sum.tobytes() if vec_sum is not None else None,
+                 buckets.tobytes(), counts.tobytes())
+            )
+            self._bump(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def remove_file(self, kb_id, filename):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if self._remove_file(conn, kb_id, filename):
+                self._bump(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def drop_kb(self, kb_id):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM files WHERE kb_id = ?", (kb_id,))
+            conn.execute("DELETE FROM kbs WHERE kb_id = ?", (kb_id,))
+            self._bump(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def rebuild_kb(self, kb_id, collection, tokenizer=None):
+        """
+        Rebuilds a KB summary from the objects stored in its Weaviate collection.
+        Stored text is BM25-tokenized with the KB's tokenizer (e.g. "知 识 库"), which is
+        undone first so the routing bigrams match the ones queries produce.
+        """
+        if tokenizer is None:
+            from services.kb_service import load_kb_settings
+            tokenizer = load_kb_settings(kb_id)["tokenizer"]
+        by_file = {}
+        for obj in collection.iterator(include_vector=True, return_properties=["text", "source_file"]):
+            texts, vectors = by_file.setdefault(obj.properties.get("source_file", ""), ([], []))
+            texts.append(detokenize(obj.properties.get("text", ""), tokenizer))
+            vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            if vector:
+                vectors.append(vector)
+        self.drop_kb(kb_id)
+        for filename, (texts, vectors) in by_file.items():
+            self.add_file(kb_id, filename, texts, vectors if len(vectors) == len(texts) else None)
+        return len(by_file)
+
+    # ---- routing ----
+
+    def _load_snapshot(self):
+        """In-memory matrices of all KB summaries, reloaded only when the index changes."""
+        conn = self._connect()
+        try:
+            generation = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+            with self._lock:
+                if self._snapshot and self._snapshot["generation"] == generation:
+                    return self._snapshot
+            rows = conn.execute("SELECT kb_id, n_chunks, dim, vec_sum, sketch FROM kbs WHERE n_chunks > 0").fetchall()
+        finally:
+            conn.close()
+
+        kb_ids = [r[0] for r in rows]
+        n_chunks = np.array([r[1] for r in rows], dtype=np.float32)
+        sketches = np.stack([np.frombuffer(r[4], dtype=np.float32) for r in rows]) if rows \
+            else np.zeros((0, self.SKETCH_BUCKETS), dtype=np.float32)
+        dims = {r[2] for r in rows if r[3]}
+        centroids = None
+        if len(dims) == 1:
+            dim = dims.pop()
+            centroids = np.zeros((len(rows), dim), dtype=np.float32)
+            for i, r in enumerate(rows):
+                if r[3]:
+                    centroids[i] = np.frombuffer(r[3], dtype=np.float32)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms > 0, norms, 1.0)
+        snapshot = {
+            "generation": generation,
+            "kb_ids": kb_ids,
+            "index": {kb_id: i for i, kb_id in enumerate(kb_ids)},
+            "n_chunks": n_chunks,
+            "sketches": sketches,
+            "centroids": centroids,
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def score(self, query_text, query_vector=None, kb_ids=None):
+        """Relevance of each summarized KB to the query: {kb_id: score in [0, 1]}."""
+        snap = self._load_snapshot()
+        rows = [snap["index"][k] for k in (kb_ids if kb_ids is not None else snap["kb_ids"]) if k in snap["index"]]
+        if not rows:
+            return {}
+        rows = np.asarray(rows)
+        weight = float(self.config.SETTINGS.get("kb_routing", {}).get("vector_weight", 0.6))
+
+        # Term evidence: chunk frequency of query terms in the KB, weighted by rarity across KBs
+        buckets = np.fromiter(self._term_buckets(query_text), dtype=np.int64)
+        term = np.zeros(len(rows))
+        if len(buckets):
+            counts = snap["sketches"][np.ix_(rows, buckets)]
+            idf = np.log1p(len(rows) / (1.0 + (counts > 0).sum(axis=0)))
+            term = ((counts / np.maximum(snap["n_chunks"][rows], 1.0)[:, None]) * idf).sum(axis=1)
+            if term.max() > 0:
+                term = term / term.max()
+
+        # Semantic evidence: cosine between the query and the KB centroid
+        centroids = snap["centroids"]
+        if query_vector is not None and centroids is not None and len(query_vector) == centroids.shape[1]:
+            q = np.asarray(query_vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            cosine = np.clip(centroids[rows] @ q, 0.0, 1.0)
+            combined = weight * cosine + (1 - weight) * term
+        else:
+            combined = term
+        return {snap["kb_ids"][r]: float(s) for r, s in zip(rows, combined)}
+
+    def select(self, query_text, query_vector, kb_ids, top_m, pinned=()):
+        """
+        KBs to search: the top_m best-scoring, plus pinned KBs and KBs without a
+        summary yet (never skipped, since nothing is known about them).
+        Returns (selected kb_ids in input order, scores).
+        """
+        if top_m <= 0 or len(kb_ids) <= top_m:
+            return list(kb_ids), {}
+        scores = self.score(query_text, query_vector, kb_ids)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_m]
+        keep = set(ranked) | set(pinned or ()) | {k for k in kb_ids if k not in scores}
+        return [k for k in kb_ids if k in keep], scores
@@ -3,11 +3,60 @@ Knowledge Base Management Service
 """
 import json
 import os
+import importlib.util
+import time
 import shutil
+import tempfile
 from datetime import datetime
 
 KB_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'knowledge_bases.json')
 
+# Per-KB index settings and their defaults
+DEFAULT_KB_SETTINGS = {
+    "tokenizer": "unigram",
+    "pinned": False,  # always searched by global queries, regardless of routing
+    "vector_compression": "none",  # none | float16 | int8 (see services/vector_codec.py)
+    "vector_dims": 0,  # truncate vectors to this many dimensions (0 = full size)
+    # Chunker parameters for ingestion and re-chunking (POST /rechunk updates them)
+    "chunk_size": 800,
+    "chunk_overlap": 100,
+    "semantic_threshold": 0.85,
+}
+CHUNK_SETTINGS = ("chunk_size", "chunk_overlap", "semantic_threshold")
+# Settings that change how documents are indexed (changing them requires a re-index)
+REINDEX_SETTINGS = ("tokenizer", "vector_compression", "vector_dims") + CHUNK_SETTINGS
+# Settings baked into the Weaviate collection (see requires_recreate)
+COLLECTION_SETTINGS = ("vector_compression", "vector_dims")
+
+def requires_recreate(before, after):
+    """
+    Whether a settings change alters what is baked into the collection itself
+    (vector length, or the int8 quantizer), so the KB must be re-indexed into a
+    fresh collection. "none" <-> "float16" only changes local checkpoints.
+    """
+    before = {**DEFAULT_KB_SETTINGS, **(before or {})}
+    after = {**DEFAULT_KB_SETTINGS, **(after or {})}
+    return (before["vector_dims"] != after["vector_dims"]
+            or (before["vector_compression"] == "int8") != (after["vector_compression"] == "int8"))
+
+_settings_cache = {"mtime": None, "kbs": {}}
+
+def load_kb_settings(kb_id):
+    """
+    Index settings for a KB, read from KB_FILE (re-read only when it changes).
+    Used on the query hot path, so it avoids parsing the file every call.
+    """
+    try:
+        mtime = os.path.getmtime(KB_FILE)
+        if mtime != _settings_cache["mtime"]:
+            with open(KB_FILE, 'r', encoding='utf-8') as f:
+                _settings_cache["kbs"] = {kb['id']: kb for kb in json.load(f)}
+            _settings_cache["mtime"] = mtime
+    except Exception:
+        pass
+    kb = _settings_cache["kbs"].get(kb_id, {})
+    return {key: kb.get(key, default) for key, default in DEFAULT_KB_SETTINGS.items()}
+
 class KnowledgeBaseService:
     def __init__(self, config, vector_db):
         self.config = config
@@ -32,8 +81,11 @@ class KnowledgeBaseService:
             return []
     
     def _save(self, data):
-        with open(KB_FILE, 'w', encoding='utf-8') as f:
+        # Write-then-rename, so concurrent readers never see a half-written list (and 404 a KB)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(KB_FILE), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, KB_FILE)
     
     def list_all(self):
         """List all knowledge bases with updated file counts."""
@@ -67,7 +119,7 @@ class KnowledgeBaseService:
                 return kb
         return None
     
-    def create(self, name, description=""):
+    def create(self, name, description="", settings=None):
         """Create a new knowledge base."""
         kbs = self._load()
         
@@ -90,6 +142,7 @@ class KnowledgeBaseService:
             "created_at": datetime.now().isoformat(),
             "file_count": 0
         }
+        new_kb.update(self._validate_settings(settings or {}))
         kbs.append(new_kb)
         self._save(kbs)
         
@@ -135,6 +188,112 @@ class KnowledgeBaseService:
         
         raise ValueError(f"Knowledge base '{kb_id}' not found")
     
+    def _validate_settings(self, settings):
+        from services.tokenizer import MODES
+        from services.vector_codec import COMPRESSION_MODES, MIN_DIMS
+        clean = {}
+        for key, value in settings.items():
+            if key not in DEFAULT_KB_SETTINGS:
+                raise ValueError(f"Unknown setting: {key}")
+            if key == "tokenizer" and value not in MODES:
+                raise ValueError(f"Tokenizer must be one of {', '.join(MODES)}")
+            if key == "tokenizer" and value == "word" and importlib.util.find_spec("jieba") is None:
+                raise ValueError("Tokenizer 'word' requires the jieba package (pip install jieba)")
+            if key == "pinned" and not isinstance(value, bool):
+                raise ValueError("pinned must be true or false")
+            if key == "vector_compression" and value not in COMPRESSION_MODES:
+                raise ValueError(f"vector_compression must be one of {', '.join(COMPRESSION_MODES)}")
+            if key == "vector_dims" and (not isinstance(value, int) or (value and value < MIN_DIMS)):
+                raise ValueError(f"vector_dims must be 0 (full size) or at least {MIN_DIMS}")
+            if key == "chunk_size" and (not isinstance(value, int) or isinstance(value, bool) or value < 50):
+                raise ValueError("chunk_size must be an integer of at least 50")
+            if key == "chunk_overlap" and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ValueError("chunk_overlap must be a non-negative integer")
+            if key == "semantic_threshold":
+                if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 < value <= 1:
+                    raise ValueError("semantic_threshold must be a number in (0, 1]")
+                value = float(value)
+            clean[key] = value
+        return clean
+    
+    def update_settings(self, kb_id, settings):
+        """
+        Update index settings of a knowledge base.
+        Returns (kb, changed_keys); changed index settings require re-indexing.
+        Collection settings that need a new collection (requires_recreate) are
+        stored as kb["pending_settings"] instead: the live collection keeps its
+        settings until a re-index has built the new one and swapped it in.
+        """
+        clean = self._validate_settings(settings)
+        kbs = self._load()
+        for kb in kbs:
+            if kb['id'] == kb_id:
+                current = {**DEFAULT_KB_SETTINGS, **{k: kb[k] for k in DEFAULT_KB_SETTINGS if k in kb}}
+                if clean.get("chunk_overlap", current["chunk_overlap"]) >= clean.get("chunk_size", current["chunk_size"]):
+                    raise ValueError("chunk_overlap must be smaller than chunk_size")
+                requested = {**current, **(kb.get("pending_settings") or {})}
+                changed = [k for k, v in clean.items() if requested.get(k) != v]
+                target = {**requested, **clean}
+                pending = {k: target[k] for k in COLLECTION_SETTINGS if target[k] != current[k]}
+                if requires_recreate(current, target):
+                    kb["pending_settings"] = pending
+                    clean = {k: v for k, v in clean.items() if k not in COLLECTION_SETTINGS}
+                else:
+                    kb.pop("pending_settings", None)
+                    clean.update(pending)
+                kb.update(clean)
+                self._save(kbs)
+                return kb, changed
+        
+        raise ValueError(f"Knowledge base '{kb_id}' not found")
+
+    def _modify(self, kb_id, fn):
+        kbs = self._load()
+        for kb in kbs:
+            if kb['id'] == kb_id:
+                fn(kb)
+                self._save(kbs)
+                return kb
+        raise ValueError(f"Knowledge base '{kb_id}' not found")
+
+    def apply_pending_settings(self, kb_id, applied):
+        """Makes the collection settings a staging re-index was built with live (once it is swapped in)."""
+        def apply(kb):
+            kb.update(applied)
+            # Settings changed again during the re-index stay pending for the next one
+            pending = {k: v for k, v in (kb.get("pending_settings") or {}).items()
+                       if kb.get(k, DEFAULT_KB_SETTINGS[k]) != v}
+            if pending:
+                kb["pending_settings"] = pending
+            else:
+                kb.pop("pending_settings", None)
+        return self._modify(kb_id, apply)
+
+    def begin_reindex(self, kb_id):
+        """Marks a re-index into a new collection as running: uploads and deletes wait for it."""
+        return self._modify(kb_id, lambda kb: kb.update(reindexing_since=time.time()))
+
+    def end_reindex(self, kb_id):
+        return self._modify(kb_id, lambda kb: kb.pop("reindexing_since", None))
+
+    def is_reindexing(self, kb_id):
+        since = (self.get(kb_id) or {}).get("reindexing_since")
+        return bool(since) and time.time() - since < self.config.REINDEX_LOCK_TTL
+    
+    def list_file_paths(self, kb_id):
+        """Absolute paths of all files stored for a knowledge base."""
+        paths = []
+        if kb_id == 'default':
+            other_kb_ids = [kb['id'] for kb in self._load() if kb['id'] != 'default']
+            for root, dirs, files in os.walk(self.config.UPLOAD_FOLDER):
+                dirs[:] = [d for d in dirs if d not in other_kb_ids]
+                paths.extend(os.path.join(root, f) for f in files)
+        else:
+            kb_dir = os.path.join(self.config.UPLOAD_FOLDER, kb_id)
+            if os.path.exists(kb_dir):
+                paths = [os.path.join(kb_dir, f) for f in os.listdir(kb_dir)]
+        return [p for p in paths if os.path.isfile(p)]
+    
     def update_file_count(self, kb_id):
         """Update file count for a knowledge base."""
         kbs = self._load()
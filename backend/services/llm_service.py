@@ -1,12 +1,30 @@
-import dashscope
 from http import HTTPStatus
 import os
+import threading
+from collections import OrderedDict
+from services.reranker import LocalReranker, RerankCache, truncate_texts
+from services.context_packer import ContextPacker
+from services.answer_cache import KBGenerations
+from services.metrics import timed, timed_method, timed_stream
+from services.logging_service import get_logger
+
+log = get_logger("llm")
 
 class LLMService:
+    QUERY_EMBEDDING_CACHE_SIZE = 256
+
     def __init__(self, config):
         self.config = config
-        dashscope.api_key = self.config.DASH_SCOPE_API_KEY
-
+        self._rerank_cache = RerankCache()
+        # Rerank results are only reused while the candidates' KBs are unchanged
+        self.generations = KBGenerations(config)
+        # Single-text embeddings (queries) are requested repeatedly: retrieval, rerank, retries
+        self._query_embeddings = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        self.query_embedding_hits = 0
+        self.query_embedding_misses = 0
+
+    @timed_method("llm", "generate")
     def generate_response(self, query, context_docs, history=None):
         """
         Returns a tuple: (content, usage_dict)
@@ -52,6 +70,7 @@ class LLMService:
 
         if provider == "dashscope":
             # Use original DashScope SDK logic
+            import dashscope
             dashscope.api_key = api_key
             try:
                 response = dashscope.Generation.call(
@@ -70,11 +89,10 @@ class LLMService:
                     }
                     return response.output.choices[0].message.content, usage
                 else:
-                    error_msg = f"Qwen API Error: {response.code} - {response.message}"
-                    print(error_msg)
+                    log.error("generate_api_error", provider=provider, code=response.code, message=response.message)
                     return f"抱歉，Qwen 服务遇到问题：{response.message}", {}
             except Exception as e:
-                print(f"DashScope Exception: {e}")
+                log.error("generate_failed", provider=provider, error=str(e))
                 return f"调用模型失败: {str(e)}", {}
 
         elif provider in ["deepseek", "openai"]:
@@ -103,7 +121,7 @@ class LLMService:
             }
             
             try:
-                print(f"Calling Generic API: {endpoint} with model {model}")
+                log.debug("generate_call", provider=provider, endpoint=endpoint, model=model)
                 resp = requests.post(endpoint, json=payload, headers=headers, timeout=60)
                 
                 if resp.status_code == 200:
@@ -119,7 +137,7 @@ class LLMService:
                 else:
                     return f"API Error ({resp.status_code}): {resp.text}", {}
             except Exception as e:
-                print(f"Generic API Exception: {e}")
+                log.error("generate_failed", provider=provider, error=str(e))
                 return f"调用外部模型失败: {str(e)}", {}
         
         else:
@@ -141,12 +159,25 @@ class LLMService:
             
             # If single string, handle directly
             if isinstance(text_or_list, str):
-                print(f"DEBUG: Generating embedding using model: {model_name}")
-                resp = TextEmbedding.call(model=model_name, input=text_or_list, api_key=api_key)
+                key = (model_name, text_or_list)
+                with self._query_embeddings_lock:
+                    if key in self._query_embeddings:
+                        self._query_embeddings.move_to_end(key)
+                        self.query_embedding_hits += 1
+                        return self._query_embeddings[key]
+                    self.query_embedding_misses += 1
+                log.debug("embed_query", model=model_name)
+                with timed("llm", "embed_query"):
+                    resp = TextEmbedding.call(model=model_name, input=text_or_list, api_key=api_key)
                 if resp.status_code == HTTPStatus.OK:
-                    return resp.output['embeddings'][0]['embedding']
+                    embedding = resp.output['embeddings'][0]['embedding']
+                    with self._query_embeddings_lock:
+                        self._query_embeddings[key] = embedding
+                        while len(self._query_embeddings) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                            self._query_embeddings.popitem(last=False)
+                    return embedding
                 else:
-                    print(f"Embedding Error: {resp.code} - {resp.message}")
+                    log.error("embed_api_error", code=resp.code, message=resp.message)
                     return None
             
             # If list, implement batching (DashScope limit is 25)
@@ -156,13 +187,14 @@ class LLMService:
                 
                 for i in range(0, len(text_or_list), batch_size):
                     batch = text_or_list[i : i + batch_size]
-                    print(f"DEBUG: Generating embedding for batch {i//batch_size + 1} (size {len(batch)}) using model: {model_name}")
+                    log.debug("embed_batch", batch=i // batch_size + 1, size=len(batch), model=model_name)
                     
-                    resp = TextEmbedding.call(
-                        model=model_name,
-                        input=batch,
-                        api_key=api_key
-                    )
+                    with timed("llm", "embed_batch"):
+                        resp = TextEmbedding.call(
+                            model=model_name,
+                            input=batch,
+                            api_key=api_key
+                        )
                     
                     if resp.status_code == HTTPStatus.OK:
                         # Map back using original indices within this batch
@@ -170,28 +202,78 @@ class LLMService:
                             original_index = i + item['text_index']
                             all_embeddings[original_index] = item['embedding']
                     else:
-                        print(f"Embedding Error in batch {i//batch_size + 1}: {resp.code} - {resp.message}")
+                        log.error("embed_api_error", batch=i // batch_size + 1, code=resp.code, message=resp.message)
                         return None # Fail fast on batch error
                 
                 return all_embeddings
         except Exception as e:
-            print(f"Embedding Exception: {str(e)}")
+            log.error("embed_failed", error=str(e))
             return None
 
-    def rerank(self, query, documents, top_n=5):
+    def _rerank_settings(self):
+        return {"provider": "auto", "max_chars": 1500, "vector_weight": 0.5,
+                **(self.config.SETTINGS.get("rerank") or {})}
+
+    def generation_settings(self):
+        """Settings that shape a generated answer besides its context (e.g. for the answer cache key)."""
+        settings = self.config.SETTINGS
+        return (settings.get("llm_provider", "dashscope"), settings.get("model_name"), settings.get("temperature", 0.5),
+                settings.get("base_url", ""), os.getenv("CURRENT_TIME", "2024年"))
+
+    @timed_method("llm", "pack_context")
+    def pack_context(self, query, context_docs, history=None):
+        """
+        Fits context_docs and history into the current model's token budget.
+        Returns (context_docs, history, report); report["kept"] are the indices of
+        the input docs that were packed (see services/context_packer.py).
         """
-        Reranks documents using DashScope Rerank API.
+        packer = ContextPacker(self.config.SETTINGS.get("context_budget"))
+        return packer.pack(query, context_docs, history, model=self.config.SETTINGS.get("model_name"))
+
+    def rerank_provider(self):
+        """'dashscope' or 'local'. 'auto' uses DashScope's API only when it is the LLM provider."""
+        provider = self._rerank_settings()["provider"]
+        if provider == "auto":
+            return "dashscope" if self.config.SETTINGS.get("llm_provider", "dashscope") == "dashscope" else "local"
+        return provider
+
+    @timed_method("llm", "rerank")
+    def rerank(self, query, documents, top_n=5, ids=None, vectors=None, kb_ids=None):
+        """
+        Reranks documents using DashScope Rerank API, or the local BM25 + cosine reranker.
         documents: list of strings (content only)
+        ids: stable candidate IDs; with them, results are cached per (query, ids)
+        vectors: candidate chunk vectors for the local reranker (optional)
+        kb_ids: KBs the candidates come from; their content generations are part of
+                the cache key, so a re-upload under the same IDs is reranked again
+                (not cached while the generations are unknown)
         Returns: list of indices sorted by relevance
         """
-        provider = self.config.SETTINGS.get("llm_provider", "dashscope")
+        settings = self._rerank_settings()
+        provider = self.rerank_provider()
+        cache_key = None
+        generations = self.generations.get(kb_ids or []) if ids is not None else None
+        if generations is not None:
+            cache_key = (provider, query, tuple(ids), top_n, generations)
+            cached = self._rerank_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        indices = None
+        if provider == "dashscope":
+            indices = self._rerank_dashscope(query, truncate_texts(documents, settings["max_chars"]), top_n)
+        if indices is None:
+            # Local reranking (also the fallback when the remote API fails)
+            query_vector = self.get_embedding(query) if vectors is not None else None
+            indices = LocalReranker(settings["vector_weight"]).rerank(query, documents, top_n, query_vector, vectors)
+
+        if cache_key is not None:
+            self._rerank_cache.put(cache_key, indices)
+        return indices
+
+    @timed_method("llm", "rerank_api")
+    def _rerank_dashscope(self, query, documents, top_n):
         api_key = self.config.SETTINGS.get("api_key")
-        
-        if provider != "dashscope":
-            # For now, only support DashScope rerank
-            # If other provider, return first top_n as fallback
-            return list(range(min(len(documents), top_n)))
-
         try:
             from dashscope import TextReRank
             resp = TextReRank.call(
@@ -206,11 +288,11 @@ class LLMService:
                 # resp.output.results is a list of results with index and relevance_score
                 return [r.index for r in resp.output.results]
             else:
-                print(f"Rerank Error: {resp.code} - {resp.message}. Falling back to original order.")
-                return list(range(min(len(documents), top_n)))
+                log.warning("rerank_api_error", code=resp.code, message=resp.message, fallback="local")
+                return None
         except Exception as e:
-            print(f"Rerank Exception: {str(e)}. Falling back.")
-            return list(range(min(len(documents), top_n)))
+            log.warning("rerank_api_failed", error=str(e), fallback="local")
+            return None
 
     def fuzzy_correct_query(self, query):
         """
@@ -225,6 +307,7 @@ class LLMService:
         except ImportError:
             return query, query
     
+    @timed_method("llm", "rewrite")
     def rewrite_query(self, query, history):
         """
         Rewrites the user query to be standalone based on conversation history.
@@ -263,6 +346,7 @@ class LLMService:
             model = self.config.SETTINGS.get("model_name")
             
             if provider == "dashscope":
+                import dashscope
                 dashscope.api_key = api_key
                 response = dashscope.Generation.call(
                     model=model,
@@ -273,7 +357,7 @@ class LLMService:
                 if response.status_code == HTTPStatus.OK:
                     rewritten = response.output.choices[0].message.content.strip()
                     rewritten = rewritten.strip('"').strip("'")
-                    print(f"DEBUG: Query rewritten to: {rewritten}")
+                    log.debug("query_rewritten", query=rewritten)
                     return rewritten
             elif provider in ["deepseek", "openai"]:
                 import requests
@@ -287,13 +371,14 @@ class LLMService:
                 if resp.status_code == 200:
                     rewritten = resp.json()['choices'][0]['message']['content'].strip()
                     rewritten = rewritten.strip('"').strip("'")
-                    print(f"DEBUG: Query rewritten to: {rewritten}")
+                    log.debug("query_rewritten", query=rewritten)
                     return rewritten
         except Exception as e:
-            print(f"ERROR: Query rewriting failed: {e}")
+            log.warning("query_rewrite_failed", error=str(e))
             
         return query
 
+    @timed_method("llm", "intent")
     def detect_intent(self, query):
         """
         Detects user intent: FILE_QUERY, SUMMARY, or FACTOID.
@@ -319,6 +404,7 @@ Category:"""
             model = self.config.SETTINGS.get("model_name")
             
             if provider == "dashscope":
+                import dashscope
                 dashscope.api_key = api_key
                 response = dashscope.Generation.call(model=model, messages=messages, result_format='message', temperature=0.1)
                 if response.status_code == HTTPStatus.OK:
@@ -333,10 +419,11 @@ Category:"""
                 if resp.status_code == 200:
                     return resp.json()['choices'][0]['message']['content'].strip().upper()
         except Exception as e:
-            print(f"Intent detection failed: {e}")
+            log.warning("intent_detection_failed", error=str(e))
             
         return "FACTOID"
 
+    @timed_stream("llm", "generate_stream", first_stage="first_token")
     def generate_stream(self, query, context_docs, history=None):
         """
         Yields chunks of content (strings).
@@ -381,6 +468,7 @@ Category:"""
         temp = self.config.SETTINGS.get("temperature", 0.5)
 
         if provider == "dashscope":
+            import dashscope
             dashscope.api_key = api_key
             total_tokens = 0
             try:
@@ -0,0 +1,201 @@
+"""
+Structured Logging
+JSON-lines logging off the request path. A log call checks the level (and the
+sample rate for its level), then appends one dict to a bounded in-memory queue;
+a background thread writes the records to DATA_FOLDER/logs/rag-YYYY-MM-DD.jsonl
+and echoes warnings and errors to the console. When the queue is full, records are
+dropped (and counted) instead of blocking a query. Daily files are kept for
+retention_days, and a day's file stops growing at max_file_mb (see
+services/daily_files.py); console echoes continue past the cap.
+
+    log = get_logger("vector_db")
+    log.debug("query", kb=kb_id, query=query_text)
+
+Every record carries the request ID (set per API request with
+set_request_id()) and, inside a trace, the trace ID.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+from datetime import datetime
+from services.tracing import current_trace_id
+from services import daily_files
+
+DEFAULT_SETTINGS = {
+    "level": "info",
+    # Fraction of records kept per level, e.g. {"debug": 0.1}; unlisted levels keep all
+    "sample_rates": {},
+    "buffer_size": 10000,
+    "console_level": "warning",
+    "retention_days": 14,   # older daily files are deleted (0 = keep all)
+    "max_file_mb": 500,     # records beyond this size per day are dropped (0 = no cap)
+}
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+SETTINGS_REFRESH_SECONDS = 5
+WRITE_BATCH = 512
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_config = None
+_writer = None
+_writer_lock = threading.Lock()
+# Refreshed from SETTINGS by the writer thread, so a log call reads plain values
+_min_level = LEVELS["info"]
+_sample_rates = {}
+
+
+def configure(config):
+    """Called once per process (API and workers); applies SETTINGS["logging"]."""
+    global _config
+    _config = config
+    _apply_settings()
+
+
+def settings():
+    overrides = (_config.SETTINGS.get("logging") or {}) if _config is not None else {}
+    return {**DEFAULT_SETTINGS, **overrides}
+
+
+def _apply_settings():
+    global _min_level, _sample_rates
+    config = settings()
+    _min_level = LEVELS.get(str(config["level"]).lower(), LEVELS["info"])
+    _sample_rates = {LEVELS[k]: float(v) for k, v in (config["sample_rates"] or {}).items() if k in LEVELS}
+
+
+def set_request_id(request_id):
+    return _request_id.set(request_id)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class Logger:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def log(self, level, event, **fields):
+        if level < _min_level:
+            return
+        rate = _sample_rates.get(level)
+        if rate is not None and random.random() >= rate:
+            return
+        _get_writer().submit({"ts": time.time(), "level": level, "logger": self.name, "event": event,
+                              "request_id": _request_id.get(), "trace_id": current_trace_id(), **fields})
+
+    def debug(self, event, **fields):
+        self.log(10, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(20, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(30, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(40, event, **fields)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, Logger(name))
+    return logger
+
+
+class LogWriter:
+    """Background writer behind every Logger of the process."""
+    def __init__(self, buffer_size):
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._file = None
+        self._file_day = None
+        self.written = 0
+        self.dropped = 0
+        threading.Thread(target=self._run, name="log-writer", daemon=True).start()
+
+    def submit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self, day, config):
+        if self._file_day != day:
+            if self._file is not None:
+                self._file.close()
+            folder = os.path.join(_config.DATA_FOLDER if _config is not None else ".", "logs")
+            os.makedirs(folder, exist_ok=True)
+            daily_files.prune(folder, "rag", config["retention_days"])
+            self._file = open(daily_files.day_path(folder, "rag", day), "a", encoding="utf-8")
+            self._file_day = day
+        return self._file
+
+    def _run(self):
+        names = {v: k for k, v in LEVELS.items()}
+        refreshed = time.time()
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=SETTINGS_REFRESH_SECONDS))
+                while len(batch) < WRITE_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if time.time() - refreshed >= SETTINGS_REFRESH_SECONDS:
+                refreshed = time.time()
+                try:
+                    _apply_settings()
+                except Exception as e:
+                    get_logger("logging").warning("invalid_settings", error=str(e))
+            if not batch:
+                continue
+            config = settings()
+            console_level = LEVELS.get(str(config["console_level"]).lower(), LEVELS["warning"])
+            try:
+                f = self._open(datetime.now().strftime("%Y-%m-%d"), config)
+                capped = daily_files.over_cap(f.tell(), config["max_file_mb"])
+                for record in batch:
+                    level = record["level"]
+                    record["level"] = names.get(level, level)
+                    if capped:
+                        self.dropped += 1
+                    else:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    if level >= console_level:
+                        extra = " ".join(f"{k}={v}" for k, v in record.items()
+                                         if k not in ("ts", "level", "logger", "event") and v is not None)
+                        print(f"[{record['level'].upper()}] {record['logger']}: {record['event']} {extra}",
+                              file=sys.stderr if level >= LEVELS["error"] else sys.stdout)
+                f.flush()
+                if not capped:
+                    self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                # The log file itself failed: report straight to the console
+                print(f"[ERROR] logging: write_failed records={len(batch)} error={e}", file=sys.stderr)
+
+    def get_stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter(int(settings()["buffer_size"]))
+    return _writer
+
+
+def get_stats():
+    return {**_get_writer().get_stats(), "settings": settings()}
@@ -0,0 +1,278 @@
+"""
+Metrics
+Prometheus-style counters, gauges and histograms kept in process memory and
+rendered in the text exposition format on /metrics (no client library needed).
+Recording is a lock, a bisect and a few additions, so pipeline stages can be
+timed on the hot path:
+
+    with timed("vector_db", "hybrid_search"):
+        ...
+
+Celery workers are separate processes: with enable_shared_sink() their stage
+timings are also added to a Redis hash, which the API renders as
+rag_worker_stage_seconds.
+"""
+import time
+import bisect
+import functools
+import threading
+from services.tracing import start_span, end_span
+from services.logging_service import get_logger
+
+log = get_logger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_total(self, value, *labels):
+        """Mirrors a monotonic count kept elsewhere (e.g. a cache's own hit counter)."""
+        with self._lock:
+            self._values[labels] = float(value)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount=1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def replace(self, labels, bucket_counts, total, count):
+        """Sets a whole series (per-bucket, non-cumulative counts), e.g. one aggregated elsewhere."""
+        with self._lock:
+            self._values[tuple(labels)] = [list(bucket_counts), float(total), int(count)]
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def add_collector(self, fn):
+        """fn() runs before every render, to refresh gauges from other services."""
+        self._collectors.append(fn)
+
+    def render(self):
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                log.warning("collector_failed", error=str(e))
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Duration of pipeline stages", ("component", "stage"))
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Pipeline stages that raised", ("component", "stage"))
+WORKER_STAGE_SECONDS = REGISTRY.histogram("rag_worker_stage_seconds", "Duration of pipeline stages in Celery workers",
+                                          ("component", "stage"))
+
+_shared_sink = None
+
+
+def observe_stage(component, stage, seconds):
+    STAGE_SECONDS.observe(seconds, component, stage)
+    if _shared_sink is not None:
+        _shared_sink.observe(component, stage, seconds)
+
+
+class timed:
+    """Context manager recording one stage's duration (and an error if it raises); also a trace span."""
+    __slots__ = ("component", "stage", "start", "span")
+
+    def __init__(self, component, stage):
+        self.component = component
+        self.stage = stage
+
+    def __enter__(self):
+        self.span = start_span(f"{self.component}.{self.stage}")
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.inc(self.component, self.stage)
+        observe_stage(self.component, self.stage, time.perf_counter() - self.start)
+        if self.span is not None:
+            end_span(self.span, exc)
+        return False
+
+
+def timed_method(component, stage):
+    """Decorator form of timed()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(component, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_stream(component, stage, first_stage):
+    """For generators: records first_stage at the first yield and stage when exhausted."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            first = True
+            with timed(component, stage):
+                for item in fn(*args, **kwargs):
+                    if first:
+                        observe_stage(component, first_stage, time.perf_counter() - start)
+                        first = False
+                    yield item
+        return wrapper
+    return decorator
+
+
+# ---- worker processes ----
+
+SHARED_KEY = "metrics:worker_stages"
+
+
+class SharedStageSink:
+    """Stage timings of worker processes, summed in one Redis hash ("component|stage|field")."""
+    def __init__(self, config, redis_client=None):
+        self.config = config
+        self._redis = redis_client
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=self.config.REDIS_HOST, port=self.config.REDIS_PORT)
+        return self._redis
+
+    def observe(self, component, stage, seconds):
+        prefix = f"{component}|{stage}|"
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(SHARED_KEY, f"{prefix}b{bisect.bisect_left(LATENCY_BUCKETS, seconds)}", 1)
+            pipe.hincrbyfloat(SHARED_KEY, f"{prefix}sum", seconds)
+            pipe.hincrby(SHARED_KEY, f"{prefix}count", 1)
+            pipe.execute()
+        except Exception as e:
+            log.warning("worker_stage_record_failed", error=str(e))
+
+    def load_into(self, histogram):
+        series = {}
+        for field, value in self.redis.hgetall(SHARED_KEY).items():
+            field = field.decode() if isinstance(field, bytes) else field
+            component, stage, name = field.split("|", 2)
+            entry = series.setdefault((component, stage), [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0])
+            if name == "sum":
+                entry[1] = float(value)
+            elif name == "count":
+                entry[2] = int(value)
+            else:
+                entry[0][int(name[1:])] = int(value)
+        for labels, (counts, total, count) in series.items():
+            histogram.replace(labels, counts, total, count)
+
+
+def enable_shared_sink(config):
+    """Called by worker processes: mirror stage timings to Redis for the API's /metrics."""
+    global _shared_sink
+    _shared_sink = SharedStageSink(config)
@@ -0,0 +1,87 @@
+"""
+Parent Chunk Side Store
+Small-to-Big retrieval only ever looks parents up by ID to swap in richer
+context, so parents that have children live here instead of in Weaviate:
+no vector, no embedding call, and one batched lookup per query.
+Parents without distinct children are still indexed in Weaviate as-is.
+"""
+import os
+import sqlite3
+
+class ParentStore:
+    def __init__(self, config, folder=None):
+        """folder: where the database lives (default DATA_FOLDER; a staging re-index uses its own)."""
+        folder = folder or config.DATA_FOLDER
+        self.db_path = os.path.join(folder, "parents.sqlite3")
+        os.makedirs(folder, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers never wait on an ingest
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parents ("
+                " parent_id TEXT PRIMARY KEY, kb_id TEXT NOT NULL, source_file TEXT NOT NULL,"
+                " page_number INTEGER, seq INTEGER, text TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_parents_file ON parents (kb_id, source_file)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def put_file(self, kb_id, source_file, parents, replace=True):
+        """Stores the parents of a file (replacing earlier ones). parents: [(parent_id, text, page_number)]"""
+        with self._connect() as conn:
+            if replace:
+                conn.execute("DELETE FROM parents WHERE kb_id = ? AND source_file = ?", (kb_id, source_file))
+            conn.executemany(
+                "INSERT OR REPLACE INTO parents (parent_id, kb_id, source_file, page_number, seq, text)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(pid, kb_id, source_file, page, seq, text) for seq, (pid, text, page) in enumerate(parents)]
+            )
+
+    def get_many(self, parent_ids):
+        """{parent_id: text} for the IDs that are stored here."""
+        ids = list({pid for pid in parent_ids if pid})
+        found = {}
+        with self._connect() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT parent_id, text FROM parents WHERE parent_id IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def get_file(self, kb_id, source_file):
+        """[(page_number, text)] of a file's stored parents, in document order."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT page_number, text FROM parents WHERE kb_id = ? AND source_file = ? ORDER BY seq",
+                (kb_id, source_file)
+            ).fetchall()
+
+    def delete_file(self, kb_id, source_file):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parents WHERE kb_id = ? AND source_file = ?", (kb_id, source_file))
+
+    def drop_kb(self, kb_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parents WHERE kb_id = ?", (kb_id,))
+
+    def replace_kb(self, kb_id, source):
+        """Replaces a KB's parents with the ones another ParentStore holds for it (a staging re-index)."""
+        with source._connect() as conn:
+            rows = conn.execute(
+                "SELECT parent_id, kb_id, source_file, page_number, seq, text FROM parents WHERE kb_id = ?", (kb_id,)
+            ).fetchall()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parents WHERE kb_id = ?", (kb_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO parents (parent_id, kb_id, source_file, page_number, seq, text)"
+                " VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def get_stats(self):
+        with self._connect() as conn:
+            count, chars = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(text)), 0) FROM parents").fetchone()
+        return {"parents": count, "chars": chars, "bytes_on_disk": os.path.getsize(self.db_path)}
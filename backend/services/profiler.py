@@ -0,0 +1,209 @@
+"""
+On-Demand Profiling
+Profiles one request or Celery task when an admin asks for it, without a
+redeploy. Two modes:
+- sample: a background thread samples the profiled threads' stacks every
+  interval_ms and writes collapsed stacks (<name>.folded), the input format of
+  flamegraph.pl, speedscope and inferno. Low overhead, safe in production.
+- cprofile: deterministic cProfile, written as pstats (<name>.prof) for
+  snakeviz / flameprof. Exact call counts, but slows the request noticeably.
+
+The thread that enters profile() is profiled; worker threads join with
+attach() (global_query's pool runs under tracing.bind, so the active profile
+is visible there). At most max_concurrent requests are profiled at once per
+process; further requests run unprofiled.
+Profiles are stored in DATA_FOLDER/profiles, named by request ID or task ID.
+"""
+import os
+import re
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter
+from services.logging_service import get_logger
+
+log = get_logger("profiler")
+
+DEFAULT_SETTINGS = {"max_concurrent": 2, "interval_ms": 5, "max_profiles": 200}
+MODES = ("sample", "cprofile")
+
+_active = contextvars.ContextVar("active_profile", default=None)
+_config = None
+_slots_lock = threading.Lock()
+_running = 0
+
+
+def configure(config):
+    global _config
+    _config = config
+
+
+def settings():
+    overrides = (_config.SETTINGS.get("profiling") or {}) if _config is not None else {}
+    return {**DEFAULT_SETTINGS, **overrides}
+
+
+def profiles_folder():
+    return os.path.join(_config.DATA_FOLDER if _config is not None else ".", "profiles")
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    def __init__(self, name, mode, interval):
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.path = None
+        self._threads = {}          # thread id -> cProfile.Profile (None in sample mode)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._finished_stats = []
+
+    def add_thread(self):
+        profiler = None
+        if self.mode == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        with self._lock:
+            self._threads[threading.get_ident()] = profiler
+
+    def remove_thread(self):
+        with self._lock:
+            profiler = self._threads.pop(threading.get_ident(), None)
+        if profiler is not None:
+            profiler.disable()
+            with self._lock:
+                self._finished_stats.append(profiler)
+
+    def start(self):
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.name}", daemon=True)
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self._threads)
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+                    self.sample_count += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        folder = profiles_folder()
+        os.makedirs(folder, exist_ok=True)
+        if self.mode == "sample":
+            self.path = os.path.join(folder, f"{self.name}.folded")
+            with open(self.path, "w", encoding="utf-8") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        elif self._finished_stats:
+            import pstats
+            stats = pstats.Stats(self._finished_stats[0])
+            for profiler in self._finished_stats[1:]:
+                stats.add(profiler)
+            self.path = os.path.join(folder, f"{self.name}.prof")
+            stats.dump_stats(self.path)
+        _prune(folder, int(settings()["max_profiles"]))
+
+
+def _prune(folder, keep):
+    """Keeps the newest `keep` profiles."""
+    entries = sorted((e for e in os.scandir(folder) if e.is_file()), key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class profile:
+    """
+    with profile(name, mode): ... — profiles the block (mode None: no-op).
+    Yields the Profile, or None when not profiling (no mode, or the
+    concurrency cap was reached).
+    """
+    def __init__(self, name, mode):
+        # Names come from request IDs / task IDs; keep them safe as file names
+        self.name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(name))[:100]
+        self.mode = mode if mode in MODES else ("sample" if mode else None)
+        self._profile = None
+        self._token = None
+
+    def __enter__(self):
+        global _running
+        if self.mode is None:
+            return None
+        config = settings()
+        with _slots_lock:
+            if _running >= int(config["max_concurrent"]):
+                log.info("profile_skipped", name=self.name, running=_running)
+                return None
+            _running += 1
+        self._profile = Profile(self.name, self.mode, float(config["interval_ms"]) / 1000)
+        self._profile.add_thread()
+        self._profile.start()
+        self._token = _active.set(self._profile)
+        return self._profile
+
+    def __exit__(self, exc_type, exc, tb):
+        global _running
+        if self._profile is None:
+            return False
+        try:
+            _active.reset(self._token)
+        except ValueError:
+            pass
+        self._profile.remove_thread()
+        try:
+            self._profile.stop()
+            log.info("profile_written", name=self.name, path=self._profile.path)
+        except Exception as e:
+            log.error("profile_write_failed", name=self.name, error=str(e))
+        finally:
+            with _slots_lock:
+                _running -= 1
+        return False
+
+
+class attach:
+    """Joins the current thread to the active profile, if any (for pool threads)."""
+    __slots__ = ("_profile",)
+
+    def __enter__(self):
+        self._profile = _active.get()
+        if self._profile is not None:
+            self._profile.add_thread()
+        return self._profile
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile is not None:
+            self._profile.remove_thread()
+        return False
+
+
+def list_profiles():
+    folder = profiles_folder()
+    if not os.path.isdir(folder):
+        return []
+    entries = sorted((e for e in os.scandir(folder) if e.is_file()), key=lambda e: e.stat().st_mtime, reverse=True)
+    return [{"name": e.name, "size": e.stat().st_size,
+             "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e.stat().st_mtime))} for e in entries]
@@ -0,0 +1,98 @@
+"""
+Structured Query Filters
+Request bodies may carry a "filters" object that is pushed down into the
+Weaviate hybrid search as a native where-filter, so scoped queries only
+consider matching chunks instead of over-retrieving and relying on the prompt.
+
+{
+  "tags": ["合同", "2024"],          # any of these tags
+  "file_types": ["pdf", "excel"],     # any of these types (see IngestionService.FILE_TYPES)
+  "source_files": ["a.pdf"],          # any of these files
+  "date_from": "2024-01-01",          # upload date range, inclusive ('%Y-%m-%d' or epoch seconds)
+  "date_to": "2024-06-30"
+}
+
+Dates filter on the chunks' upload_ts. Objects indexed before upload_ts existed
+are backfilled from their upload_date day when the property is added (see
+VectorDB._backfill_upload_ts), so they match by day; objects without any upload
+date get 0 and never match a date range.
+"""
+from datetime import datetime, timedelta
+
+FILTER_KEYS = ("tags", "file_types", "source_files", "date_from", "date_to")
+MAX_VALUES = 100
+
+
+def _string_list(key, value):
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(",")]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"Filter '{key}' must be a list of strings")
+    value = [v for v in value if v]
+    if len(value) > MAX_VALUES:
+        raise ValueError(f"Filter '{key}' accepts at most {MAX_VALUES} values")
+    return value
+
+
+def _timestamp(key, value, end_of_day=False):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        day = datetime.strptime(str(value), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Filter '{key}' must be a date (YYYY-MM-DD) or epoch seconds")
+    if end_of_day:
+        day += timedelta(days=1)
+    return day.timestamp() - (0.001 if end_of_day else 0)
+
+
+def parse_filters(raw):
+    """Validates a request's filters object. Returns a normalized dict (empty if none)."""
+    if not raw:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(raw) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+
+    filters = {}
+    for key in ("tags", "file_types", "source_files"):
+        if raw.get(key):
+            values = _string_list(key, raw[key])
+            if values:
+                filters[key] = values
+    if raw.get("date_from") not in (None, ""):
+        filters["ts_from"] = _timestamp("date_from", raw["date_from"])
+    if raw.get("date_to") not in (None, ""):
+        filters["ts_to"] = _timestamp("date_to", raw["date_to"], end_of_day=True)
+    if "ts_from" in filters and "ts_to" in filters and filters["ts_from"] > filters["ts_to"]:
+        raise ValueError("date_from must not be after date_to")
+    return filters
+
+
+def filters_from_args(args):
+    """Same filters from query-string parameters (GET endpoints); lists are comma-separated."""
+    return parse_filters({key: args.get(key) for key in FILTER_KEYS if args.get(key)})
+
+
+def build_where(filters):
+    """Weaviate filter for parse_filters() output, or None when unfiltered."""
+    if not filters:
+        return None
+    from weaviate.classes.query import Filter
+    clauses = []
+    if filters.get("tags"):
+        clauses.append(Filter.by_property("tags").contains_any(filters["tags"]))
+    if filters.get("file_types"):
+        clauses.append(Filter.by_property("file_type").contains_any(filters["file_types"]))
+    if filters.get("source_files"):
+        files = [Filter.by_property("source_file").equal(f) for f in filters["source_files"]]
+        clauses.append(files[0] if len(files) == 1 else Filter.any_of(files))
+    if "ts_from" in filters:
+        clauses.append(Filter.by_property("upload_ts").greater_or_equal(filters["ts_from"]))
+    if "ts_to" in filters:
+        clauses.append(Filter.by_property("upload_ts").less_or_equal(filters["ts_to"]))
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else Filter.all_of(clauses)
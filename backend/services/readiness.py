@@ -0,0 +1,58 @@
+"""
+Backend Readiness
+The API starts serving before its backends are reachable: /api/health answers
+as soon as the process is up, while a background warm-up connects each
+backend (Weaviate, Redis) and retries until it succeeds. /api/ready reports
+the per-backend state, so load balancers and orchestrators can wait for it.
+"""
+import time
+import threading
+from services.logging_service import get_logger
+
+log = get_logger("readiness")
+
+
+class Readiness:
+    def __init__(self, checks, retry_interval=2.0):
+        """checks: {name: callable}, each returns truthy (or doesn't raise) once the backend is usable."""
+        self.checks = checks
+        self.retry_interval = retry_interval
+        self._state = {name: {"ready": False, "error": "not checked yet", "checked_at": None} for name in checks}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Runs the warm-up in a daemon thread (once)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._warm_up, name="readiness-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def _warm_up(self):
+        pending = list(self.checks)
+        while pending:
+            pending = [name for name in pending if not self.check(name)]
+            if pending:
+                time.sleep(self.retry_interval)
+
+    def check(self, name):
+        started = time.time()
+        try:
+            ok, error = bool(self.checks[name]()), None
+            if not ok:
+                error = "check failed"
+        except Exception as e:
+            ok, error = False, str(e)
+        with self._lock:
+            self._state[name] = {"ready": ok, "error": error, "checked_at": started,
+                                 "duration_ms": round((time.time() - started) * 1000, 1)}
+        if ok:
+            log.info("backend_ready", backend=name, seconds=round(time.time() - started, 2))
+        return ok
+
+    def status(self):
+        """(all ready, {name: state})"""
+        with self._lock:
+            state = {name: dict(s) for name, s in self._state.items()}
+        return all(s["ready"] for s in state.values()), state
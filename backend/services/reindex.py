@@ -0,0 +1,58 @@
+"""
+Staging Re-index
+Changing a KB's collection settings (vector dims / quantizer) needs a new
+Weaviate collection. The KB is re-indexed into a staging collection with the
+pending settings while the live collection keeps serving search with its old
+ones; the staging collection is swapped in only when every file succeeded.
+"""
+import os
+import uuid
+
+from services.kb_service import load_kb_settings
+from services.logging_service import get_logger
+
+log = get_logger("reindex")
+
+# Passes over the file list before giving up on it settling down
+MAX_PASSES = 5
+
+
+def reindex_into_staging(kb_service, db, service, kb_id, pending):
+    """
+    Re-indexes every file of a KB into a staging collection built with the KB's
+    settings plus `pending`, then swaps it in and makes `pending` live.
+    Uploads and deletes are blocked while this runs (kb_service.begin_reindex),
+    but the file list is still re-read and diffed after each pass, so a file
+    that changed meanwhile (e.g. after a stale lock expired) is not lost by the
+    swap. Any failure drops the staging collection and raises; the live
+    collection, its side stores and the KB settings are then unchanged.
+    Returns the number of files indexed.
+    """
+    name = f"Reindex_{kb_id}_{uuid.uuid4().hex[:8]}"
+    db.use_staging_collection(name, {**load_kb_settings(kb_id), **pending})
+    indexed = {}
+    try:
+        for _ in range(MAX_PASSES):
+            current = {path: service.blob_store.upload_time(path) for path in kb_service.list_file_paths(kb_id)}
+            todo = [path for path, uploaded in current.items() if indexed.get(path) != uploaded]
+            gone = [path for path in indexed if path not in current]
+            if not todo and not gone:
+                break
+            for path in gone:
+                db.delete_document(os.path.basename(path))
+                del indexed[path]
+            for path in todo:
+                try:
+                    service.process_file(path)
+                except Exception as e:
+                    raise RuntimeError(f"Re-index of KB {kb_id} aborted at {os.path.basename(path)}: {e}; "
+                                       f"live collection unchanged") from e
+                indexed[path] = current[path]
+        else:
+            raise RuntimeError(f"Re-index of KB {kb_id} aborted: files kept changing; live collection unchanged")
+    except Exception:
+        db.drop_staging_collection()
+        raise
+    db.swap_in_staging_collection(on_swap=lambda: kb_service.apply_pending_settings(kb_id, pending))
+    log.info("reindex_swapped", kb_id=kb_id, files=len(indexed), settings=pending)
+    return len(indexed)
@@ -0,0 +1,104 @@
+"""
+Local Reranking
+Reranks retrieval candidates without a network call: BM25 over the candidate
+texts (bigram tokens) blended with cosine similarity between the query vector
+and the candidates' chunk vectors returned by the vector search.
+Used when the LLM provider has no rerank API, or as the fallback when it fails.
+"""
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from services.tokenizer import get_tokenizer
+
+
+class LocalReranker:
+    def __init__(self, vector_weight=0.5, k1=1.2, b=0.75):
+        self.vector_weight = vector_weight
+        self.k1, self.b = k1, b
+        self._tokenizer = get_tokenizer("bigram")
+
+    def bm25_scores(self, query, texts):
+        """
+        BM25 of the query's bigram tokens. Term frequencies are substring counts and
+        lengths are characters, so candidates are scanned without being tokenized.
+        """
+        docs = [t.lower() for t in texts]
+        lengths = np.array([len(d) for d in docs], dtype=np.float64)
+        avg_len = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_len)
+        scores = np.zeros(len(docs))
+        for term in set(self._tokenizer.tokenize(query.lower()).split()):
+            tf = np.array([d.count(term) for d in docs], dtype=np.float64)
+            df = np.count_nonzero(tf)
+            if not df:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            scores += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    @staticmethod
+    def cosine_scores(query_vector, vectors):
+        """Cosine per candidate; NaN where a candidate has no vector."""
+        scores = np.full(len(vectors), np.nan)
+        if query_vector is None:
+            return scores
+        q = np.asarray(query_vector, dtype=np.float32)
+        for i, v in enumerate(vectors):
+            if v is None or not len(v):
+                continue
+            v = np.asarray(v, dtype=np.float32)
+            # Truncated KBs store a prefix of the full embedding
+            qv = q[:len(v)] if len(q) > len(v) else q
+            denom = float(np.linalg.norm(qv) * np.linalg.norm(v))
+            scores[i] = float(qv @ v) / denom if denom else 0.0
+        return scores
+
+    def rerank(self, query, texts, top_n=5, query_vector=None, vectors=None):
+        """Returns candidate indices, best first."""
+        if not texts:
+            return []
+        lexical = self.bm25_scores(query, texts)
+        if lexical.max() > 0:
+            lexical = lexical / lexical.max()
+        combined = lexical
+        if vectors is not None:
+            cosine = self.cosine_scores(query_vector, vectors)
+            has_vec = ~np.isnan(cosine)
+            if has_vec.any():
+                combined = np.where(has_vec, self.vector_weight * np.nan_to_num(cosine) + (1 - self.vector_weight) * lexical, lexical)
+        # Stable: ties keep retrieval order
+        return np.argsort(-combined, kind="stable")[:top_n].tolist()
+
+
+def truncate_texts(texts, max_chars):
+    """Caps each text sent to a remote reranker (0 = unlimited)."""
+    if not max_chars:
+        return list(texts)
+    return [t if len(t) <= max_chars else t[:max_chars] for t in texts]
+
+
+class RerankCache:
+    """Thread-safe LRU of rerank results keyed by (provider, query, candidate ids, top_n, KB generations)."""
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+            self.misses += 1
+            return None
+
+    def put(self, key, indices):
+        with self._lock:
+            self._entries[key] = tuple(indices)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
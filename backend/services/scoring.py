@@ -0,0 +1,88 @@
+"""
+Post-Retrieval Scoring
+Vectorized (NumPy) helpers applied to retrieval candidates: recency boost,
+parent deduplication, cross-KB rank fusion and filename boosting.
+Weights come from Config.SETTINGS so they can be tuned at runtime.
+"""
+from datetime import datetime
+import numpy as np
+
+SECONDS_PER_DAY = 86400.0
+
+DEFAULT_WEIGHTS = {
+    "recency_boost": 0.1,        # max score added to a document uploaded just now
+    "recency_window_days": 30,   # boost decays linearly to 0 over this window
+    "filename_boost": 3.0,       # multiplier when the query names the file (global search)
+    "rrf_k": 60,                 # reciprocal rank fusion constant (global search)
+}
+
+
+class ScoringWeights:
+    def __init__(self, recency_boost, recency_window_days, filename_boost, rrf_k=60):
+        self.recency_boost = float(recency_boost)
+        self.recency_window_days = float(recency_window_days)
+        self.filename_boost = float(filename_boost)
+        self.rrf_k = float(rrf_k)
+
+    @classmethod
+    def from_settings(cls, settings):
+        scoring = {**DEFAULT_WEIGHTS, **(settings.get("scoring") or {})}
+        return cls(scoring["recency_boost"], scoring["recency_window_days"], scoring["filename_boost"], scoring["rrf_k"])
+
+
+_date_cache = {}
+
+def legacy_upload_ts(upload_date):
+    """Timestamp for objects indexed before upload_ts existed ('%Y-%m-%d' strings)."""
+    if not upload_date:
+        return 0.0
+    ts = _date_cache.get(upload_date)
+    if ts is None:
+        try:
+            ts = datetime.strptime(upload_date, '%Y-%m-%d').timestamp()
+        except ValueError:
+            ts = 0.0
+        if len(_date_cache) < 10000:
+            _date_cache[upload_date] = ts
+    return ts
+
+
+def recency_boost(upload_ts, now, weights):
+    """Linear boost for recent uploads; 0 for unknown timestamps (<= 0)."""
+    upload_ts = np.asarray(upload_ts, dtype=np.float64)
+    if weights.recency_window_days <= 0:
+        return np.zeros_like(upload_ts)
+    age_days = np.maximum(now - upload_ts, 0.0) / SECONDS_PER_DAY
+    boost = weights.recency_boost * (1.0 - age_days / weights.recency_window_days)
+    return np.where((upload_ts > 0) & (age_days <= weights.recency_window_days), boost, 0.0)
+
+
+def first_occurrence_mask(keys):
+    """True for the first occurrence of each non-empty key; empty keys are always kept."""
+    keys = np.asarray(keys, dtype=object)
+    mask = np.ones(len(keys), dtype=bool)
+    if len(keys) < 2:
+        return mask
+    has_key = keys != ""
+    keyed_idx = np.nonzero(has_key)[0]
+    if len(keyed_idx):
+        _, first = np.unique(keys[keyed_idx].astype(str), return_index=True)
+        mask[keyed_idx] = False
+        mask[keyed_idx[first]] = True
+    return mask
+
+
+def filename_matches(query_text, filenames):
+    """Boolean array: query names the file, or the file name contains the query."""
+    query_low = query_text.lower()
+    lookup = {}
+    for name in set(filenames):
+        low = name.lower()
+        lookup[name] = bool(low) and (low in query_low or query_low in low)
+    return np.fromiter((lookup[n] for n in filenames), dtype=bool, count=len(filenames))
+
+
+def rrf_scores(n, k):
+    """Reciprocal rank fusion weights 1 / (k + rank) for ranks 1..n."""
+    return 1.0 / (k + np.arange(1, n + 1, dtype=np.float64))
+
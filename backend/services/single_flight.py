@@ -0,0 +1,251 @@
+"""
+Single-Flight Query Coalescing
+Identical concurrent questions (same endpoint, KB, normalized query, history
+and filters) run the RAG pipeline once. The first request leads: its pipeline
+runs in a background thread and publishes every event (SSE chunks, or the one
+JSON response) to a flight. Identical requests that arrive while it runs
+subscribe, replay what was already published, then follow live. A client
+disconnecting does not cancel the flight for the others. A follower gives up
+(with the on_error event) when the leader publishes nothing for
+follower_timeout seconds; the leading request waits for its own pipeline.
+
+With SETTINGS["single_flight"]["redis"] flights are shared across worker
+processes: the leading process holds a Redis lease and appends events to a
+Redis list, waking remote followers through a pub/sub channel.
+"""
+import re
+import json
+import time
+import contextvars
+import uuid
+import hashlib
+import threading
+import unicodedata
+from services.logging_service import get_logger
+
+log = get_logger("single_flight")
+
+DEFAULT_SETTINGS = {"enabled": True, "redis": False, "lease_seconds": 180, "follower_timeout": 90}
+
+KEY_PREFIX = "single_flight:"
+END_EVENT = {"__flight_end__": True}
+REMOTE_LOG_TTL = 30  # seconds a finished flight's events stay readable for late remote followers
+
+# Deletes the lease only if this process still holds it
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def normalize_query(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'[\s?？。.!！]+$', '', text)
+
+
+def history_fingerprint(history):
+    turns = [(m.get("role"), m.get("content")) for m in history or []]
+    return hashlib.sha1(json.dumps(turns, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class Flight:
+    """Events of one pipeline run, replayable by any number of followers."""
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    def follow(self, timeout=None):
+        """Events so far, then live ones; TimeoutError after `timeout` seconds without one (None: wait)."""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.events) and not self.done:
+                    if not self._cond.wait(timeout):
+                        raise TimeoutError("single-flight leader produced no events")
+                batch = self.events[index:]
+                if not batch:
+                    return
+            index += len(batch)
+            yield from batch
+
+
+class SingleFlight:
+    def __init__(self, config, redis_client=None):
+        self.config = config
+        self._redis = redis_client
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.remote_followers = 0
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis(host=self.config.REDIS_HOST, port=self.config.REDIS_PORT)
+        return self._redis
+
+    def settings(self):
+        return {**DEFAULT_SETTINGS, **(self.config.SETTINGS.get("single_flight") or {})}
+
+    def key(self, mode, kb_id, query, history=None, **scope):
+        """Flight key; scope holds anything else that changes the answer (filters, global, pins)."""
+        payload = json.dumps([mode, kb_id, normalize_query(query), history_fingerprint(history), scope],
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _guarded(producer, on_error):
+        try:
+            yield from producer()
+        except Exception as e:
+            log.error("pipeline_failed", error=str(e))
+            yield on_error(e)
+
+    def subscribe(self, key, producer, on_error):
+        """
+        Iterator over the events of the flight for `key`, starting it with
+        producer() (a callable returning an event iterator) if none is running.
+        on_error(exception) -> final event for a failed pipeline.
+        """
+        settings = self.settings()
+        if not settings["enabled"]:
+            return self._guarded(producer, on_error)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if leader:
+            # The pipeline keeps the leading request's context (request ID for logs)
+            ctx = contextvars.copy_context()
+            threading.Thread(target=ctx.run, args=(self._run, key, flight, producer, on_error, settings),
+                             daemon=True).start()
+            return flight.follow()
+        return self._follow(flight, settings["follower_timeout"], on_error)
+
+    @staticmethod
+    def _follow(flight, timeout, on_error):
+        try:
+            yield from flight.follow(timeout)
+        except TimeoutError as e:
+            log.warning("follower_timeout", timeout=timeout)
+            yield on_error(e)
+
+    def call(self, key, fn, on_error):
+        """fn() run once for identical concurrent calls; every caller gets its result."""
+        result = None
+        for event in self.subscribe(key, lambda: iter([fn()]), on_error):
+            result = event
+        return result
+
+    def _run(self, key, flight, producer, on_error, settings):
+        try:
+            source = lambda: self._guarded(producer, on_error)
+            if settings["redis"]:
+                source = self._remote_source(key, source, on_error, settings)
+            for event in source():
+                flight.publish(event)
+        except Exception as e:
+            log.error("flight_failed", error=str(e))
+            flight.publish(on_error(e))
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.finish()
+
+    # ---- cross-process flights ----
+
+    def _remote_source(self, key, source, on_error, settings):
+        """Leads the flight for all processes, or follows the process that does."""
+        token = uuid.uuid4().hex
+        lease_key = f"{KEY_PREFIX}lease:{key}"
+        try:
+            if self.redis.set(lease_key, token, nx=True, px=int(settings["lease_seconds"] * 1000)):
+                return lambda: self._lead_remote(key, token, source, settings)
+            leader_token = self.redis.get(lease_key)
+        except Exception as e:
+            log.warning("redis_unavailable", error=str(e), fallback="in-process coalescing")
+            return source
+        if leader_token is None:
+            # The remote flight just ended
+            return source
+        with self._lock:
+            self.remote_followers += 1
+        leader_token = leader_token.decode() if isinstance(leader_token, bytes) else leader_token
+        return lambda: self._guarded(lambda: self._follow_remote(key, leader_token, settings), on_error)
+
+    def _lead_remote(self, key, token, source, settings):
+        log_key = f"{KEY_PREFIX}log:{key}:{token}"
+        channel = f"{KEY_PREFIX}events:{key}:{token}"
+        healthy = [True]
+
+        def push(event, ttl):
+            if not healthy[0]:
+                return
+            try:
+                pipe = self.redis.pipeline()
+                pipe.rpush(log_key, json.dumps(event, ensure_ascii=False))
+                pipe.expire(log_key, ttl)
+                pipe.publish(channel, 1)
+                pipe.execute()
+            except Exception as e:
+                log.warning("remote_publish_failed", error=str(e))
+                healthy[0] = False
+
+        try:
+            for event in source():
+                push(event, int(settings["lease_seconds"]))
+                yield event
+        finally:
+            push(END_EVENT, REMOTE_LOG_TTL)
+            try:
+                self.redis.eval(RELEASE_SCRIPT, 1, f"{KEY_PREFIX}lease:{key}", token)
+            except Exception as e:
+                log.warning("lease_release_failed", error=str(e))
+
+    def _follow_remote(self, key, token, settings):
+        log_key = f"{KEY_PREFIX}log:{key}:{token}"
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        # Subscribe before the first read so no wake-up is missed
+        pubsub.subscribe(f"{KEY_PREFIX}events:{key}:{token}")
+        try:
+            index, last_progress = 0, time.time()
+            while True:
+                entries = self.redis.lrange(log_key, index, -1)
+                for raw in entries:
+                    event = json.loads(raw)
+                    if event == END_EVENT:
+                        return
+                    yield event
+                index += len(entries)
+                if entries:
+                    last_progress = time.time()
+                elif time.time() - last_progress > settings["follower_timeout"]:
+                    raise TimeoutError("remote single-flight leader produced no events")
+                pubsub.get_message(timeout=1.0)
+        finally:
+            pubsub.close()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "active": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "remote_followers": self.remote_followers,
+                "settings": self.settings(),
+            }
@@ -0,0 +1,167 @@
+"""
+Ingestion Task Router
+Routes upload processing tasks to Celery queues by estimated cost and keeps
+per-KB backlog counters so one knowledge base cannot starve the others.
+"""
+import os
+import time
+from services.logging_service import get_logger
+
+log = get_logger("task_router")
+
+# Relative processing cost per MB, by extension.
+# PPT rendering and VLM calls dominate; plain text is nearly free.
+COST_WEIGHTS = {
+    'ppt': 8.0, 'pptx': 8.0,
+    'png': 6.0, 'jpg': 6.0, 'jpeg': 6.0,
+    'pdf': 4.0,
+    'docx': 2.0, 'xlsx': 2.0, 'xls': 2.0, 'csv': 1.5,
+    'svg': 1.0, 'txt': 1.0, 'md': 1.0,
+}
+DEFAULT_COST_WEIGHT = 2.0
+# Duplicate content reuses extraction/embedding checkpoints and only upserts
+CACHED_COST_FACTOR = 0.05
+
+# Redis list suffix separator Celery uses for priority sub-queues
+PRIORITY_SEP = '\x06\x16'
+PRIORITY_STEPS = list(range(10))
+
+PENDING_KEY = "ingest:pending"
+WAIT_KEY_PREFIX = "ingest:wait:"
+RUN_KEY_PREFIX = "ingest:run:"
+LATENCY_SAMPLES = 200
+
+
+class IngestionRouter:
+    def __init__(self, config, redis_client=None):
+        self.config = config
+        self._redis = redis_client
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+            from redis.retry import Retry
+            from redis.backoff import NoBackoff
+            # On the upload path: backlog tracking is advisory, so fail fast instead of retrying with backoff
+            self._redis = redis.Redis(host=self.config.REDIS_HOST, port=self.config.REDIS_PORT,
+                                      socket_connect_timeout=0.5, socket_timeout=0.5,
+                                      retry=Retry(NoBackoff(), 0))
+        return self._redis
+
+    @property
+    def queues(self):
+        return [
+            self.config.INGEST_QUEUE_INTERACTIVE,
+            self.config.INGEST_QUEUE_DEFAULT,
+            self.config.INGEST_QUEUE_BULK,
+        ]
+
+    def estimate_cost(self, filename, size_bytes):
+        """Estimated processing cost: file type weight x size in MB."""
+        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        weight = COST_WEIGHTS.get(ext, DEFAULT_COST_WEIGHT)
+        size_mb = max(size_bytes, 0) / (1024 * 1024)
+        return weight * max(size_mb, 0.01)
+
+    def select_queue(self, cost):
+        if cost <= self.config.INGEST_INTERACTIVE_MAX_COST:
+            return self.config.INGEST_QUEUE_INTERACTIVE
+        if cost <= self.config.INGEST_BULK_MIN_COST:
+            return self.config.INGEST_QUEUE_DEFAULT
+        return self.config.INGEST_QUEUE_BULK
+
+    def route(self, file_path, kb_id, cached=False):
+        """
+        Returns apply_async routing options for a file:
+        {"queue": str, "priority": int, "cost": float}
+        Interactive files always get top priority. Other lanes are ordered
+        by the KB's current backlog, so a KB with hundreds of pending files
+        sinks behind KBs that only queued a few.
+        cached: content was ingested before, so only the vector upsert remains.
+        """
+        filename = os.path.basename(file_path)
+        try:
+            size_bytes = os.path.getsize(file_path)
+        except OSError:
+            size_bytes = 0
+        cost = self.estimate_cost(filename, size_bytes)
+        if cached:
+            cost *= CACHED_COST_FACTOR
+        queue = self.select_queue(cost)
+
+        priority = 0
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(PENDING_KEY, kb_id, 1)
+            # Slots leaked by crashed workers clear once ingestion has been idle for the TTL
+            pipe.expire(PENDING_KEY, self.config.INGEST_PENDING_TTL)
+            pending = int(pipe.execute()[0]) - 1
+            if queue != self.config.INGEST_QUEUE_INTERACTIVE:
+                # Redis transport: lower number = served first
+                priority = min(PRIORITY_STEPS[-1], 1 + pending // self.config.INGEST_FAIRNESS_STEP)
+        except Exception as e:
+            log.warning("backlog_tracking_unavailable", error=str(e))
+
+        return {"queue": queue, "priority": priority, "cost": round(cost, 3)}
+
+    def task_started(self, queue, enqueued_at):
+        """Record queue wait time for a task that just started."""
+        if not enqueued_at:
+            return
+        self._push_sample(WAIT_KEY_PREFIX + queue, time.time() - enqueued_at)
+
+    def task_finished(self, queue, kb_id, run_seconds):
+        """Record run time and release the KB backlog slot."""
+        self.record_run(queue, run_seconds)
+        self.release(kb_id)
+
+    def record_run(self, queue, run_seconds):
+        self._push_sample(RUN_KEY_PREFIX + queue, run_seconds)
+
+    def release(self, kb_id):
+        """Release the KB backlog slot taken by route()."""
+        try:
+            if int(self.redis.hincrby(PENDING_KEY, kb_id, -1)) <= 0:
+                self.redis.hdel(PENDING_KEY, kb_id)
+            self.redis.expire(PENDING_KEY, self.config.INGEST_PENDING_TTL)
+        except Exception as e:
+            log.warning("backlog_release_failed", kb=kb_id, error=str(e))
+
+    def _push_sample(self, key, value):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.lpush(key, f"{value:.4f}")
+            pipe.ltrim(key, 0, LATENCY_SAMPLES - 1)
+            pipe.execute()
+        except Exception as e:
+            log.warning("latency_record_failed", key=key, error=str(e))
+
+    def queue_depth(self, queue):
+        """Pending messages across all priority sub-lists of a queue."""
+        names = [queue] + [f"{queue}{PRIORITY_SEP}{p}" for p in PRIORITY_STEPS[1:]]
+        pipe = self.redis.pipeline()
+        for name in names:
+            pipe.llen(name)
+        return sum(pipe.execute())
+
+    def _latency_summary(self, key):
+        samples = sorted(float(v) for v in self.redis.lrange(key, 0, -1))
+        if not samples:
+            return {"count": 0, "p50": None, "p95": None, "max": None}
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 3)
+        return {"count": len(samples), "p50": pct(0.5), "p95": pct(0.95), "max": round(samples[-1], 3)}
+
+    def get_metrics(self):
+        """Depth and latency statistics per queue, plus per-KB backlog."""
+        queues = {}
+        for queue in self.queues:
+            queues[queue] = {
+                "depth": self.queue_depth(queue),
+                "wait_seconds": self._latency_summary(WAIT_KEY_PREFIX + queue),
+                "run_seconds": self._latency_summary(RUN_KEY_PREFIX + queue),
+            }
+        backlog = {k.decode() if isinstance(k, bytes) else k: int(v)
+                   for k, v in self.redis.hgetall(PENDING_KEY).items()}
+        return {"queues": queues, "kb_backlog": backlog}
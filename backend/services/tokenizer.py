@@ -0,0 +1,91 @@
+"""
+CJK Tokenization for BM25
+Weaviate's whitespace tokenizer cannot split Chinese, so text is pre-tokenized
+by inserting spaces before indexing and querying. The same mode must be used for
+a KB's documents and its queries.
+
+Modes:
+- unigram: one token per Han character (legacy behaviour, largest index)
+- bigram:  overlapping character bigrams; single-character runs stay unigrams
+- word:    dictionary word segmentation via jieba (optional; KB settings reject the
+           mode without it, a tokenizer created anyway falls back to bigrams)
+"""
+import re
+import threading
+from services.logging_service import get_logger
+
+log = get_logger("tokenizer")
+
+MODES = ("unigram", "bigram", "word")
+DEFAULT_MODE = "unigram"
+
+# CJK Unified Ideographs
+HAN_START, HAN_END = 0x4e00, 0x9fff
+_HAN_RUN = re.compile(r'[\u4e00-\u9fff]+')
+_WHITESPACE = re.compile(r'\s+')
+
+# Precompiled translation table: each Han character -> " c "
+_UNIGRAM_TABLE = {cp: f" {chr(cp)} " for cp in range(HAN_START, HAN_END + 1)}
+
+
+class CJKTokenizer:
+    def __init__(self, mode=DEFAULT_MODE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown tokenizer mode: {mode}")
+        self.mode = mode
+        self._segment = None
+        if mode == "word":
+            try:
+                import jieba
+                jieba.setLogLevel(60)
+                self._segment = jieba.lcut
+            except ImportError:
+                log.warning("jieba_missing", tokenizer="word", fallback="bigram")
+
+    def tokenize(self, text):
+        """Returns whitespace-separated tokens. Example (unigram): "你好123" -> "你 好 123" """
+        if not text:
+            return ""
+        if self.mode == "unigram":
+            spaced = text.translate(_UNIGRAM_TABLE)
+        elif self._segment is not None:
+            spaced = _HAN_RUN.sub(self._words, text)
+        else:
+            spaced = _HAN_RUN.sub(self._bigrams, text)
+        return _WHITESPACE.sub(' ', spaced).strip()
+
+    @staticmethod
+    def _bigrams(match):
+        run = match.group(0)
+        if len(run) == 1:
+            return f" {run} "
+        return " " + " ".join([run[i:i + 2] for i in range(len(run) - 1)]) + " "
+
+    def _words(self, match):
+        return " " + " ".join(self._segment(match.group(0))) + " "
+
+
+_SPACE_AROUND_HAN = re.compile(r'(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])')
+
+def detokenize(text, mode=None):
+    """
+    Best-effort inverse of tokenize() for text read back from the index:
+    unigram and word output get their inserted spaces between Han characters
+    removed ("知 识 库" -> "知识库"). Bigram output is kept: re-tokenizing it
+    with bigrams yields the same tokens.
+    """
+    if not text or (mode or DEFAULT_MODE) == "bigram":
+        return text or ""
+    return _SPACE_AROUND_HAN.sub('', text)
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+def get_tokenizer(mode=None):
+    """Shared tokenizer instance per mode (jieba dictionary loads once)."""
+    mode = mode or DEFAULT_MODE
+    with _tokenizers_lock:
+        if mode not in _tokenizers:
+            _tokenizers[mode] = CJKTokenizer(mode)
+        return _tokenizers[mode]
@@ -0,0 +1,315 @@
+"""
+Request Tracing
+Lightweight spans for debugging individual slow requests. Every metrics.timed()
+stage also opens a span while a trace is active, so the pipeline needs no extra
+instrumentation. Trace context (W3C traceparent) is carried:
+- from the Flask request into the query pipeline thread and Celery tasks
+  (passed explicitly as a traceparent string)
+- into global_query's thread pool (bind())
+
+Finished traces are exported by a background thread to a local JSONL file
+(DATA_FOLDER/traces/spans-YYYY-MM-DD.jsonl) or an OTLP/HTTP JSON collector
+endpoint, per SETTINGS["tracing"]. Spans are recorded for every active trace;
+sample_rate only decides what is exported (by default one request in ten).
+JSONL files are kept for retention_days and capped at max_file_mb per day
+(see services/daily_files.py).
+"""
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+from services import daily_files
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "sample_rate": 0.1,
+    "exporter": "jsonl",        # jsonl | otlp | none
+    "endpoint": "",             # OTLP/HTTP traces URL, e.g. http://otel-collector:4318/v1/traces
+    "service_name": "dls-rag",
+    "retention_days": 7,        # jsonl: older daily files are deleted (0 = keep all)
+    "max_file_mb": 200,         # jsonl: spans beyond this size per day are dropped (0 = no cap)
+}
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH = 256
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_config = None
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def configure(config):
+    """Called once per process (API and workers) before traces are started."""
+    global _config
+    _config = config
+
+
+def settings():
+    overrides = (_config.SETTINGS.get("tracing") or {}) if _config is not None else {}
+    return {**DEFAULT_SETTINGS, **overrides}
+
+
+class Trace:
+    """Spans of one process-local segment of a distributed trace."""
+    def __init__(self, trace_id, sampled):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "error", "_token")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.error = None
+        self.start = time.time()
+        self.end = None
+        self._token = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+
+def _parse_traceparent(value):
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+def start_span(name, **attributes):
+    """Child of the current span, or None when no trace is active."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    child._token = _current_span.set(child)
+    return child
+
+
+def end_span(span, error=None):
+    span.end = time.time()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    try:
+        _current_span.reset(span._token)
+    except ValueError:
+        # Ended in another context (e.g. a generator resumed elsewhere)
+        pass
+    span.trace.add(span)
+
+
+class span:
+    """with span("name", key=value): ... — no-op outside a trace."""
+    __slots__ = ("name", "attributes", "_span")
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._span = start_span(self.name, **self.attributes)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            end_span(self._span, exc)
+        return False
+
+
+class trace:
+    """
+    Starts a trace segment: the root span of this process's part of a request.
+    parent: incoming traceparent string (continues that trace) or None.
+    force: record even when tracing is disabled (e.g. a request asked for timings).
+    """
+    __slots__ = ("name", "parent", "force", "attributes", "_span")
+
+    def __init__(self, name, parent=None, force=False, **attributes):
+        self.name = name
+        self.parent = parent
+        self.force = force
+        self.attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        config = settings()
+        if not (config["enabled"] or self.force):
+            return None
+        incoming = _parse_traceparent(self.parent)
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < float(config["sample_rate"])
+        sampled = sampled and config["enabled"] and config["exporter"] != "none"
+        root = Span(Trace(trace_id, sampled), self.name, parent_id, self.attributes)
+        root.trace.root = root
+        root._token = _current_span.set(root)
+        self._span = root
+        return root
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            end_span(self._span, exc)
+            if self._span.trace.sampled:
+                _get_exporter().submit(self._span.trace.spans)
+        return False
+
+
+def current_traceparent():
+    """traceparent of the current span, to hand to another thread, process or Celery task."""
+    current = _current_span.get()
+    return current.traceparent() if current is not None else None
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def bind(fn):
+    """fn running in the caller's trace context (for thread pools)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def timings():
+    """
+    {span name: total ms} of the current segment's finished spans (summed, so
+    parallel KB searches can add up to more than wall time), plus total_ms so far.
+    """
+    current = _current_span.get()
+    if current is None:
+        return {}
+    segment = current.trace
+    with segment._lock:
+        spans = [s for s in segment.spans if s is not segment.root]
+    totals = {}
+    for s in spans:
+        totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+    result = {name: round(ms, 1) for name, ms in sorted(totals.items(), key=lambda kv: -kv[1])}
+    result["total_ms"] = round(segment.root.duration_ms, 1)
+    return result
+
+
+# ---- export ----
+
+class SpanExporter:
+    """Background writer; never blocks a request (spans are dropped when the queue is full)."""
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.dropped = 0
+        self.exported = 0
+        self._pruned_day = None
+        threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+
+    def submit(self, spans):
+        for s in spans:
+            try:
+                self._queue.put_nowait(s)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < EXPORT_BATCH:
+                    batch.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                pass
+            config = settings()
+            try:
+                if config["exporter"] == "otlp" and config["endpoint"]:
+                    self._export_otlp(batch, config)
+                elif config["exporter"] == "jsonl" and not self._export_jsonl(batch, config):
+                    self.dropped += len(batch)
+                    continue
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                # Imported here: the logging service itself imports this module
+                from services.logging_service import get_logger
+                get_logger("tracing").warning("span_export_failed", spans=len(batch), error=str(e))
+
+    def _export_jsonl(self, batch, config):
+        """Appends the batch to today's file; False when that file is at its size cap."""
+        folder = os.path.join(_config.DATA_FOLDER if _config is not None else ".", "traces")
+        os.makedirs(folder, exist_ok=True)
+        path = daily_files.day_path(folder, "spans")
+        if self._pruned_day != path:
+            daily_files.prune(folder, "spans", config["retention_days"])
+            self._pruned_day = path
+        if os.path.exists(path) and daily_files.over_cap(os.path.getsize(path), config["max_file_mb"]):
+            return False
+        with open(path, "a", encoding="utf-8") as f:
+            for s in batch:
+                f.write(json.dumps({
+                    "service": config["service_name"],
+                    "trace_id": s.trace.trace_id,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "name": s.name,
+                    "start": round(s.start, 6),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "attributes": s.attributes,
+                    "error": s.error,
+                }, ensure_ascii=False, default=str) + "\n")
+        return True
+
+    @staticmethod
+    def _export_otlp(batch, config):
+        import requests
+        spans = []
+        for s in batch:
+            item = {
+                "traceId": s.trace.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(s.start * 1e9)),
+                "endTimeUnixNano": str(int((s.end or s.start) * 1e9)),
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                item["parentSpanId"] = s.parent_id
+            spans.append(item)
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": config["service_name"]}}]},
+            "scopeSpans": [{"scope": {"name": "dls_rag.tracing"}, "spans": spans}],
+        }]}
+        resp = requests.post(config["endpoint"], json=payload, timeout=5)
+        resp.raise_for_status()
+
+
+def _get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = SpanExporter()
+        return _exporter
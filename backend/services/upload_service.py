@@ -0,0 +1,274 @@
+"""
+Chunked / Resumable Upload Service
+Protocol: init -> put chunk (any order, retryable) -> complete (idempotent).
+Chunks are written straight into a preallocated file and hashed as they arrive
+in order, so completing an upload needs no extra pass over the data and
+memory stays flat regardless of file size.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+class UploadError(ValueError):
+    pass
+
+class _HashState:
+    """In-process running SHA-256 over the contiguous prefix of received chunks."""
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.next_index = 0
+        self.busy = False
+        self.lock = threading.Lock()
+
+class ChunkedUploadService:
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, config, blob_store):
+        self.config = config
+        self.blob_store = blob_store
+        self.root = os.path.join(config.DATA_FOLDER, "uploads")
+        os.makedirs(self.root, exist_ok=True)
+        self._states = {}
+        self._states_lock = threading.Lock()
+
+    # ---- session files ----
+
+    def _dir(self, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Invalid upload id")
+        return os.path.join(self.root, upload_id)
+
+    def _data_path(self, upload_id):
+        return os.path.join(self._dir(upload_id), "data.part")
+
+    def _marker_path(self, upload_id, index):
+        return os.path.join(self._dir(upload_id), "chunks", str(index))
+
+    def _load_manifest(self, upload_id):
+        path = os.path.join(self._dir(upload_id), "manifest.json")
+        if not os.path.exists(path):
+            raise UploadError("Upload session not found")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, upload_id, manifest):
+        path = os.path.join(self._dir(upload_id), "manifest.json")
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _state(self, upload_id):
+        with self._states_lock:
+            if upload_id not in self._states:
+                self._states[upload_id] = _HashState()
+            return self._states[upload_id]
+
+    def _chunk_length(self, manifest, index):
+        start = index * manifest["chunk_size"]
+        return min(manifest["chunk_size"], manifest["total_size"] - start)
+
+    # ---- protocol ----
+
+    def init(self, filename, kb_id, total_size, chunk_size=None):
+        """Creates an upload session and preallocates the target file."""
+        self.cleanup_expired()
+        filename = os.path.basename(filename or "")
+        if not filename:
+            raise UploadError("Filename is required")
+        if total_size < 0:
+            raise UploadError("Invalid file size")
+        chunk_size = int(chunk_size or self.config.UPLOAD_CHUNK_SIZE)
+        if chunk_size <= 0 or chunk_size > self.config.UPLOAD_MAX_CHUNK_SIZE:
+            raise UploadError("Invalid chunk size")
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self._dir(upload_id), "chunks"))
+        with open(self._data_path(upload_id), 'wb') as f:
+            f.truncate(total_size)
+        manifest = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "kb_id": kb_id,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": max(1, -(-total_size // chunk_size)),
+            "created_at": time.time(),
+            "result": None,
+        }
+        self._save_manifest(upload_id, manifest)
+        return manifest
+
+    def put_chunk(self, upload_id, index, stream):
+        """Writes one chunk at its offset, streaming from `stream`. Safe to retry."""
+        manifest = self._load_manifest(upload_id)
+        if manifest["result"]:
+            return self.status(upload_id)
+        if manifest.get("stored"):
+            raise UploadError("Upload is being completed; chunks can no longer change")
+        if index < 0 or index >= manifest["total_chunks"]:
+            raise UploadError(f"Chunk index {index} out of range")
+        expected = self._chunk_length(manifest, index)
+
+        state = self._state(upload_id)
+        marker = self._marker_path(upload_id, index)
+        with state.lock:
+            if os.path.exists(marker):
+                # A rewrite: the chunk counts as missing until it is complete again,
+                # and a running hash that already covers it restarts from disk
+                os.remove(marker)
+                if index < state.next_index:
+                    state.hasher = hashlib.sha256()
+                    state.next_index = 0
+            hash_inline = index == state.next_index and not state.busy
+            if hash_inline:
+                state.busy = True
+
+        written = 0
+        try:
+            with open(self._data_path(upload_id), 'r+b') as f:
+                f.seek(index * manifest["chunk_size"])
+                while written < expected:
+                    block = stream.read(min(self.BLOCK_SIZE, expected - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    if hash_inline:
+                        state.hasher.update(block)
+                    written += len(block)
+            if written != expected or stream.read(1):
+                raise UploadError(f"Chunk {index} must be exactly {expected} bytes")
+        except Exception:
+            if hash_inline:
+                # The running hash now includes a partial chunk; restart it from disk later
+                with state.lock:
+                    state.hasher = hashlib.sha256()
+                    state.next_index = 0
+                    state.busy = False
+            raise
+
+        with open(marker, 'w') as f:
+            f.write(str(written))
+
+        with state.lock:
+            if hash_inline:
+                state.next_index = index + 1
+                state.busy = False
+            if not state.busy:
+                self._advance_hash(upload_id, manifest, state)
+        return self.status(upload_id)
+
+    def _advance_hash(self, upload_id, manifest, state):
+        """Feeds chunks that arrived out of order once the prefix reaches them."""
+        with open(self._data_path(upload_id), 'rb') as f:
+            while state.next_index < manifest["total_chunks"] and \
+                    os.path.exists(self._marker_path(upload_id, state.next_index)):
+                f.seek(state.next_index * manifest["chunk_size"])
+                remaining = self._chunk_length(manifest, state.next_index)
+                while remaining > 0:
+                    block = f.read(min(self.BLOCK_SIZE, remaining))
+                    state.hasher.update(block)
+                    remaining -= len(block)
+                state.next_index += 1
+
+    def status(self, upload_id):
+        manifest = self._load_manifest(upload_id)
+        chunk_dir = os.path.join(self._dir(upload_id), "chunks")
+        received = sorted(int(n) for n in os.listdir(chunk_dir)) if os.path.isdir(chunk_dir) else []
+        return {
+            "upload_id": upload_id,
+            "filename": manifest["filename"],
+            "kb_id": manifest["kb_id"],
+            "total_chunks": manifest["total_chunks"],
+            "chunk_size": manifest["chunk_size"],
+            "received": received,
+            "missing": sorted(set(range(manifest["total_chunks"])) - set(received)),
+            "result": manifest["result"],
+        }
+
+    def complete(self, upload_id, dest_dir, on_complete):
+        """
+        Finalizes the upload: checks all chunks arrived, finishes the hash, moves
+        the file into the blob store and calls on_complete(file_path, file_hash, is_duplicate),
+        whose return value (e.g. the queued task info) is stored.
+        Calling complete again returns the stored result without re-enqueueing.
+        The hash and whether the content was a duplicate are saved before the move,
+        so a retry after a failed on_complete finds its own blob and reports it as new.
+        """
+        manifest = self._load_manifest(upload_id)
+        if manifest["result"]:
+            return manifest["result"]
+
+        lock_path = os.path.join(self._dir(upload_id), "complete.lock")
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+        except FileExistsError:
+            return self._wait_for_result(upload_id)
+
+        try:
+            stored = manifest.get("stored")
+            if stored is None:
+                missing = self.status(upload_id)["missing"]
+                if missing:
+                    raise UploadError(f"Missing chunks: {missing[:20]}")
+
+                state = self._state(upload_id)
+                with state.lock:
+                    # Chunks handled by another worker process are hashed from disk here
+                    self._advance_hash(upload_id, manifest, state)
+                    file_hash = state.hasher.hexdigest()
+                stored = {"file_hash": file_hash,
+                          "is_duplicate": os.path.exists(self.blob_store.blob_path(file_hash))}
+                manifest["stored"] = stored
+                self._save_manifest(upload_id, manifest)
+
+            # Idempotent: a retry re-links the blob this upload already moved into the store
+            file_path = os.path.join(dest_dir, manifest["filename"])
+            self.blob_store.add_file(self._data_path(upload_id), file_path, stored["file_hash"])
+            result = on_complete(file_path, stored["file_hash"], stored["is_duplicate"])
+            manifest["result"] = result
+            manifest["completed_at"] = time.time()
+            self._save_manifest(upload_id, manifest)
+            self._discard_data(upload_id)
+            return result
+        finally:
+            if os.path.exists(lock_path):
+                os.remove(lock_path)
+
+    def _wait_for_result(self, upload_id, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            manifest = self._load_manifest(upload_id)
+            if manifest["result"]:
+                return manifest["result"]
+            if not os.path.exists(os.path.join(self._dir(upload_id), "complete.lock")):
+                break
+            time.sleep(0.2)
+        raise UploadError("Upload completion is in progress; retry shortly")
+
+    def _discard_data(self, upload_id):
+        """Keeps only the manifest (for idempotent completes) once the file is stored."""
+        with self._states_lock:
+            self._states.pop(upload_id, None)
+        data_path = self._data_path(upload_id)
+        if os.path.exists(data_path):
+            os.remove(data_path)
+        shutil.rmtree(os.path.join(self._dir(upload_id), "chunks"), ignore_errors=True)
+
+    def cleanup_expired(self):
+        """Removes sessions older than UPLOAD_SESSION_TTL_HOURS."""
+        cutoff = time.time() - self.config.UPLOAD_SESSION_TTL_HOURS * 3600
+        for upload_id in os.listdir(self.root):
+            session_dir = os.path.join(self.root, upload_id)
+            try:
+                if os.path.getmtime(session_dir) < cutoff:
+                    shutil.rmtree(session_dir, ignore_errors=True)
+                    with self._states_lock:
+                        self._states.pop(upload_id, None)
+            except OSError:
+                continue
@@ -0,0 +1,106 @@
+"""
+Vector Storage Codecs
+Per-KB settings trade recall for memory and disk:
+- vector_dims:        keep the first N dimensions and re-normalize (0 = full size)
+- vector_compression: "none"    float32 everywhere
+                      "float16" local vector copies (checkpoints) stored as float16
+                      "int8"    Weaviate scalar quantization (int8 in the HNSW index,
+                                float32 rescoring of the top candidates); checkpoints
+                                stay float32, since rescoring uses the vectors we upload
+Weaviate has no half-precision index, so "float16" keeps float32 in Weaviate.
+Checkpoints are keyed by the embedding alone, so switching modes re-encodes
+instead of re-embedding. encode()/decode() also model the int8 index encoding
+(see benchmarks/bench_vector_codec.py).
+"""
+import threading
+import numpy as np
+
+COMPRESSION_MODES = ("none", "float16", "int8")
+MIN_DIMS = 64
+
+
+class VectorCodec:
+    def __init__(self, compression="none", dims=0):
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown vector compression: {compression}")
+        self.compression = compression
+        self.dims = int(dims or 0)
+
+    @property
+    def name(self):
+        """Identifies the encoding (dims are applied at upsert, not stored)."""
+        return {"none": "float32", "float16": "float16", "int8": "int8"}[self.compression]
+
+    @property
+    def checkpoint_lossy(self):
+        """Whether local checkpoint copies may be stored below float32 precision."""
+        return self.compression == "float16"
+
+    @property
+    def needs_float32(self):
+        """Whether the index rescores with the uploaded vectors (lossy checkpoints must not feed it)."""
+        return self.compression == "int8"
+
+    def prepare(self, vectors):
+        """Vectors as sent to Weaviate: truncated and re-normalized if vector_dims is set."""
+        if vectors is None:
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        single = matrix.ndim == 1
+        if single:
+            matrix = matrix[None, :]
+        if self.dims and matrix.shape[1] > self.dims:
+            matrix = matrix[:, :self.dims]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix[0].tolist() if single else matrix.tolist()
+
+    # ---- local storage encodings ----
+
+    def encode(self, vectors):
+        """Dict of arrays to store (see decode)."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.compression == "float16":
+            return {"data": matrix.astype(np.float16)}
+        if self.compression == "int8":
+            scale = np.abs(matrix).max(axis=1) / 127.0
+            scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+            data = np.clip(np.rint(matrix / scale[:, None]), -127, 127).astype(np.int8)
+            return {"data": data, "scale": scale}
+        return {"data": matrix}
+
+    @staticmethod
+    def decode(arrays):
+        data = np.asarray(arrays["data"])
+        if "scale" in arrays:
+            return data.astype(np.float32) * np.asarray(arrays["scale"], dtype=np.float32)[:, None]
+        return data.astype(np.float32)
+
+    def bytes_per_vector(self, dim):
+        dim = min(dim, self.dims) if self.dims else dim
+        if self.compression == "int8":
+            return dim + 4
+        if self.compression == "float16":
+            return dim * 2
+        return dim * 4
+
+    # ---- Weaviate index ----
+
+    def quantizer(self, rescore_limit):
+        """Quantizer config for collection creation, or None for uncompressed HNSW."""
+        if self.compression != "int8":
+            return None
+        from weaviate.classes.config import Configure
+        return Configure.VectorIndex.Quantizer.sq(rescore_limit=rescore_limit)
+
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+def get_codec(settings):
+    """Shared codec for a KB's settings dict (vector_compression, vector_dims)."""
+    key = (settings.get("vector_compression") or "none", int(settings.get("vector_dims") or 0))
+    with _codecs_lock:
+        if key not in _codecs:
+            _codecs[key] = VectorCodec(*key)
+        return _codecs[key]
@@ -1,42 +1,91 @@
+import os
 import time
 import uuid
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-import weaviate
-import weaviate.classes.config as wvc
-from weaviate.classes.query import MetadataQuery
+import shutil
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from services.tokenizer import get_tokenizer
+from services.kb_router import KBRouter
+from services.parent_store import ParentStore
+from services.vector_codec import get_codec
+from services.query_filters import build_where
+from services.answer_cache import KBGenerations
+from services.metrics import timed, timed_method
+from services.tracing import bind
+from services.logging_service import get_logger
+from services import profiler
+from services.scoring import ScoringWeights, legacy_upload_ts, recency_boost, first_occurrence_mask, filename_matches, rrf_scores
+
+log = get_logger("vector_db")
+
+
+class _StagingGenerations:
+    """Generations of a staging run: queries can't see its writes, so there is nothing to invalidate."""
+    def get(self, kb_ids):
+        return ()
+
+    def bump(self, kb_id):
+        pass
+
 
 class VectorDB:
-    def __init__(self, config, embedding_fn=None, kb_id="default"):
+    def __init__(self, config, embedding_fn=None, kb_id="default", client=None):
+        """client: an already connected Weaviate client (e.g. the benchmarks' in-memory stand-in)."""
         self.config = config
         self.embedding_fn = embedding_fn
         self.kb_id = kb_id
         self.collection_name = f"KB_{kb_id}"
+        self.client = client if client is not None else self._connect()
+        # Set while building a staging collection (see use_staging_collection)
+        self._staging_settings = None
+        self._staging_folder = None
         
-        # Connect with retry
+        self._ensure_collection()
+        self.kb_router = KBRouter(config)
+        self.parent_store = ParentStore(config)
+        # Invalidates cached answers of a KB whenever its content changes
+        self.generations = KBGenerations(config)
+
+    def _connect(self):
+        """Connects to Weaviate, retrying while it starts up."""
+        import weaviate
         max_retries = 10
         for i in range(max_retries):
             try:
-                self.client = weaviate.connect_to_local(
+                client = weaviate.connect_to_local(
                     host=self.config.WEAVIATE_HOST,
                     port=self.config.WEAVIATE_PORT,
                     grpc_port=self.config.WEAVIATE_GRPC_PORT
                 )
-                if self.client.is_live():
-                    break
+                if client.is_live():
+                    return client
             except Exception as e:
                 if i == max_retries - 1:
                     raise e
-                print(f"Waiting for Weaviate... ({i+1}/{max_retries})")
-                time.sleep(3)
-        
-        self._ensure_collection()
+            log.info("weaviate_waiting", attempt=i + 1, max_retries=max_retries)
+            time.sleep(3)
+        raise ConnectionError("Weaviate is not live")
+
+    def codec(self, kb_id=None):
+        """Vector storage codec from the KB's settings (compression, truncation)."""
+        if self._staging_settings is not None and kb_id in (None, self.kb_id):
+            return get_codec(self._staging_settings)
+        from services.kb_service import load_kb_settings
+        return get_codec(load_kb_settings(kb_id or self.kb_id))
 
     def _ensure_collection(self):
+        import weaviate.classes.config as wvc
         if not self.client.collections.exists(self.collection_name):
+            quantizer = self.codec().quantizer(self.config.VECTOR_RESCORE_LIMIT)
             self.client.collections.create(
                 name=self.collection_name,
                 vectorizer_config=None, # Use manual vectors
+                # ACORN keeps filtered (scoped) vector searches fast when filters are restrictive
+                vector_index_config=wvc.Configure.VectorIndex.hnsw(
+                    quantizer=quantizer, filter_strategy=wvc.VectorFilterStrategy.ACORN
+                ),
                 properties=[
                     # Use whitespace tokenizer to support our Chinese char-level hack
                     wvc.Property(
@@ -45,38 +94,71 @@ class VectorDB:
                         tokenization=wvc.Tokenization.WHITESPACE
                     ),
                     wvc.Property(name="source_file", data_type=wvc.DataType.TEXT, skip_vectorization=True),
-                    wvc.Property(name="file_type", data_type=wvc.DataType.TEXT, skip_vectorization=True),
+                    wvc.Property(name="file_type", data_type=wvc.DataType.TEXT, skip_vectorization=True,
+                                 tokenization=wvc.Tokenization.FIELD),
                     wvc.Property(name="chunk_id", data_type=wvc.DataType.INT, skip_vectorization=True),
                     wvc.Property(name="doc_id", data_type=wvc.DataType.TEXT, skip_vectorization=True),
                     wvc.Property(name="upload_date", data_type=wvc.DataType.TEXT, skip_vectorization=True),
-                    wvc.Property(name="tags", data_type=wvc.DataType.TEXT_ARRAY, skip_vectorization=True),
+                    wvc.Property(name="upload_ts", data_type=wvc.DataType.NUMBER, skip_vectorization=True,
+                                 index_range_filters=True),
+                    wvc.Property(name="tags", data_type=wvc.DataType.TEXT_ARRAY, skip_vectorization=True,
+                                 tokenization=wvc.Tokenization.FIELD),
                     # Small-to-Big metadata
                     wvc.Property(name="is_parent", data_type=wvc.DataType.BOOL, skip_vectorization=True),
                     wvc.Property(name="parent_id", data_type=wvc.DataType.TEXT, skip_vectorization=True),
                 ]
             )
         self.collection = self.client.collections.get(self.collection_name)
+        self._migrate_schema()
+
+    # Properties added after collections were first created: (name, data type, extra Property kwargs)
+    ADDED_PROPERTIES = [("upload_ts", "NUMBER", {"index_range_filters": True})]
+    _migrated_collections = set()
+
+    def _migrate_schema(self):
+        """Adds properties introduced later to existing collections (once per process)."""
+        if self.collection_name in VectorDB._migrated_collections:
+            return
+        import weaviate.classes.config as wvc
+        try:
+            existing = {p.name for p in self.collection.config.get().properties}
+            for name, data_type, extra in self.ADDED_PROPERTIES:
+                if name not in existing:
+                    self.collection.config.add_property(
+                        wvc.Property(name=name, data_type=getattr(wvc.DataType, data_type), skip_vectorization=True, **extra)
+                    )
+            if "upload_ts" not in existing:
+                self._backfill_upload_ts()
+            VectorDB._migrated_collections.add(self.collection_name)
+        except Exception as e:
+            log.warning("schema_migration_skipped", collection=self.collection_name, error=str(e))
     
-    def _preprocess_chinese(self, text):
+    def _backfill_upload_ts(self):
+        """
+        Gives objects indexed before upload_ts existed the start of their upload_date
+        day, so date filters (range filters on upload_ts) still match them.
         """
-        Hack for Chinese support in Weaviate BM25/Hybrid search:
-        Inserts spaces between Chinese characters to treat them as individual tokens
-        with the 'whitespace' tokenizer.
-        Example: "你好123" -> "你 好 123"
+        updated = 0
+        for obj in self.collection.iterator(return_properties=["upload_ts", "upload_date"]):
+            if obj.properties.get("upload_ts") is None:
+                self.collection.data.update(
+                    uuid=obj.uuid, properties={"upload_ts": legacy_upload_ts(obj.properties.get("upload_date", ""))}
+                )
+                updated += 1
+        if updated:
+            # Filtered answers cached before the backfill missed these objects
+            KBGenerations(self.config).bump(self.kb_id)
+            log.info("upload_ts_backfilled", collection=self.collection_name, objects=updated)
+
+    def _preprocess_chinese(self, text, kb_id=None):
+        """
+        Pre-tokenizes text for Weaviate's whitespace BM25 tokenizer, using the
+        tokenizer mode configured for the KB (unigram by default).
+        Example (unigram): "你好123" -> "你 好 123"
         """
-        if not text:
-            return ""
-        import re
-        # Insert space between Chinese characters
-        # \u4e00-\u9fff is the range for CJK Unified Ideographs
-        processed = ""
-        for char in text:
-            if re.match(r'[\u4e00-\u9fff]', char):
-                processed += f" {char} "
-            else:
-                processed += char
-        # Clean up double spaces
-        return re.sub(r'\s+', ' ', processed).strip()
+        from services.kb_service import load_kb_settings
+        mode = load_kb_settings(kb_id or self.kb_id)["tokenizer"]
+        return get_tokenizer(mode).tokenize(text)
 
     
     def switch_kb(self, kb_id):
@@ -98,7 +180,7 @@ class VectorDB:
             collections = self.client.collections.list_all()
             return [name for name in collections.keys() if name.startswith("KB_")]
         except Exception as e:
-            print(f"Error listing KBs: {e}")
+            log.error("list_kbs_failed", error=str(e))
             return []
     
     def delete_kb(self, kb_id):
@@ -107,26 +189,31 @@ class VectorDB:
             coll_name = f"KB_{kb_id}"
             if self.client.collections.exists(coll_name):
                 self.client.collections.delete(coll_name)
+                self.kb_router.drop_kb(kb_id)
+                self.parent_store.drop_kb(kb_id)
+                self.generations.bump(kb_id)
                 return True
             return False
         except Exception as e:
-            print(f"Error deleting KB {kb_id}: {e}")
+            log.error("delete_kb_failed", kb=kb_id, error=str(e))
             return False
 
-    def add_documents(self, documents, metadatas, ids=None):
+    @timed_method("vector_db", "upsert")
+    def add_documents(self, documents, metadatas, ids=None, vectors=None):
         """
         Batch import documents.
         documents: list of strings (text content)
         metadatas: list of dicts
         ids: list of strings (optional, but recommended for Weaviate UUIDs)
+        vectors: precomputed embeddings aligned with documents (optional)
         """
         if not documents:
             return
 
         # Fetch vectors if not provided
-        vectors = None
-        if self.embedding_fn:
+        if vectors is None and self.embedding_fn:
             vectors = self.embedding_fn(documents)
+        vectors = self.codec().prepare(vectors)
 
         with self.collection.batch.dynamic() as batch:
             for i, doc in enumerate(documents):
@@ -140,6 +227,7 @@ class VectorDB:
                     "chunk_id": int(meta.get("page_number", 0)), 
                     "doc_id": ids[i] if ids and i < len(ids) else str(uuid.uuid4()),
                     "upload_date": meta.get("upload_date", ""),
+                    "upload_ts": float(meta.get("upload_ts", 0)),
                     "is_parent": meta.get("is_parent", False),
                     "parent_id": meta.get("parent_id", "")
                 }
@@ -155,185 +243,312 @@ class VectorDB:
                     uuid=generated_id
                 )
         
-        if self.collection.batch.failed_objects:
-            print(f"Failed to import {len(self.collection.batch.failed_objects)} objects")
-            for fail in self.collection.batch.failed_objects[:2]:
-                 print(f"Error: {fail.message}")
+        self.generations.bump(self.kb_id)
+        failed = self.collection.batch.failed_objects
+        if failed:
+            # Raise, so the ingest task fails (and retries) instead of reporting success
+            raise RuntimeError(f"Failed to import {len(failed)} of {len(documents)} objects into "
+                               f"{self.collection_name}: {failed[0].message}")
 
-    def query(self, query_text, n_results=5, alpha=None, target_collection=None):
+    @timed_method("vector_db", "query")
+    def query(self, query_text, n_results=5, alpha=None, target_collection=None, vector=None, filters=None,
+              include_vector=False):
         """
         Hybrid search (Vector + BM25).
         alpha: 0 = BM25 only, 1 = Vector only, 0.5 = Equal weight.
         If alpha is None, uses value from Config.SETTINGS.
         target_collection: If provided, use this collection instead of self.collection (for thread safety).
+        vector: Precomputed query embedding (global search embeds once for all KBs).
+        filters: parse_filters() output (tags, file types, files, upload date range), applied inside Weaviate.
+        include_vector: also return each hit's chunk vector (result["vector"]) for local reranking.
         """
-        # DEBUG LOG
-        log_path = r"f:\DLS_RAG\backend\query_debug.log"
-        active_kb = self.kb_id
         current_coll = target_collection or self.collection
         coll_name = current_coll.name if current_coll else "Unknown"
-        
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now()}] QUERY | KB: {active_kb} | Collection: {coll_name} | Query: {query_text}\n")
+        log.debug("query", kb=self.kb_id, collection=coll_name, query=query_text)
             
         if alpha is None:
-            from config import Config
-            alpha = Config.SETTINGS.get("hybrid_alpha", 0.5)
+            alpha = self.config.SETTINGS.get("hybrid_alpha", 0.5)
         
-        # 1. Preprocess query text for Chinese BM25 matching
-        processed_query = self._preprocess_chinese(query_text)
+        # 1. Preprocess query text for Chinese BM25 matching (same tokenizer as the KB's index)
+        processed_query = self._preprocess_chinese(query_text, kb_id=coll_name.replace("KB_", "", 1))
         
         # 2. Manual vectorization if needed for hybrid search in Weaviate
-        vector = None
-        if alpha > 0 and self.embedding_fn:
+        if vector is None and alpha > 0 and self.embedding_fn:
             vector = self.embedding_fn(query_text) # Use original text for vectorization
+        if vector is not None:
+            # Match the KB's stored dimensions (global search passes the full vector)
+            vector = self.codec(coll_name.replace("KB_", "", 1)).prepare(vector)
 
         if not current_coll:
-            print(f"ERROR: No collection available for query")
+            log.error("query_no_collection", collection=self.collection_name)
             return []
 
-        response = current_coll.query.hybrid(
-            query=processed_query,
-            vector=vector,
-            query_properties=["text", "source_file"],
-            limit=n_results,
-            alpha=alpha,
-            return_metadata=MetadataQuery(score=True, distance=True)
+        from weaviate.classes.query import MetadataQuery
+        with timed("vector_db", "hybrid_search"):
+            response = current_coll.query.hybrid(
+                query=processed_query,
+                vector=vector,
+                query_properties=["text", "source_file"],
+                limit=n_results,
+                alpha=alpha,
+                filters=build_where(filters),
+                include_vector=include_vector,
+                return_metadata=MetadataQuery(score=True, distance=True)
+            )
+        objects = response.objects
+        if not objects:
+            return []
+        
+        # Vectorized post-processing: recency boost + parent dedup in one pass
+        props = [obj.properties for obj in objects]
+        weights = ScoringWeights.from_settings(self.config.SETTINGS)
+        scores = np.fromiter((obj.metadata.score or 0.0 for obj in objects), dtype=np.float64, count=len(objects))
+        upload_ts = np.fromiter(
+            (p.get("upload_ts") or legacy_upload_ts(p.get("upload_date", "")) for p in props),
+            dtype=np.float64, count=len(props)
         )
+        scores += recency_boost(upload_ts, time.time(), weights)
+        # Deduplicate by parent_id if multiple small chunks hit the same parent
+        keep = np.nonzero(first_occurrence_mask([p.get("parent_id") or "" for p in props]))[0]
+        
+        # Small-to-Big: resolve all parents in one side-store lookup
+        with timed("vector_db", "parent_fetch"):
+            parent_texts = self.parent_store.get_many(props[i].get("parent_id") for i in keep)
         
         results = []
-        for obj in response.objects:
-            text = obj.properties.get("text", "")
-            parent_id = obj.properties.get("parent_id")
-            source_file = obj.properties.get("source_file", "Unknown")
+        for i in keep:
+            p = props[i]
+            text = p.get("text", "")
+            parent_id = p.get("parent_id")
             
-            # Small-to-Big: If this is a small chunk, fetch its parent for richer context
             if parent_id:
-                parent_text = self.fetch_parent(parent_id)
+                # Collections indexed before the side store still hold parents as objects
+                parent_text = parent_texts.get(parent_id) or self.fetch_parent(parent_id, collection=current_coll)
                 if parent_text:
                     text = parent_text
             
-            upload_date_str = obj.properties.get("upload_date", "")
-            
-            # Recency Boost calculation
-            recency_score = 0.0
-            if upload_date_str:
-                try:
-                    upload_dt = datetime.strptime(upload_date_str, '%Y-%m-%d')
-                    days_diff = (datetime.now() - upload_dt).days
-                    # Linear boost for items from the last 30 days
-                    if days_diff <= 30:
-                        recency_score = 0.1 * (1 - days_diff/30.0)
-                except:
-                    pass
-
             results.append({
                 "text": text,
+                "vector": self._object_vector(objects[i]) if include_vector else None,
                 "metadata": {
-                    "source_file": source_file,
-                    "score": obj.metadata.score + recency_score,
-                    "chunk_id": obj.properties.get("chunk_id", 0),
+                    "doc_id": p.get("doc_id", ""),
+                    "source_file": p.get("source_file", "Unknown"),
+                    "file_type": p.get("file_type", ""),
+                    "tags": p.get("tags") or [],
+                    "score": float(scores[i]),
+                    "chunk_id": p.get("chunk_id", 0),
                     "parent_id": parent_id,
-                    "upload_date": upload_date_str,
-                    "page_number": obj.properties.get("page_number", 1),
-                    "text_snippet": obj.properties.get("text", "")[:200] # First 200 chars for matching
+                    "upload_date": p.get("upload_date", ""),
+                    "upload_ts": float(upload_ts[i]),
+                    "page_number": p.get("page_number", 1),
+                    "text_snippet": p.get("text", "")[:200] # First 200 chars for matching
                 }
             })
             
-        # Optional: Deduplicate by parent_id if multiple small chunks hit the same parent
-        if len(results) > 1:
-            seen_parents = set()
-            dedup_results = []
-            for r in results:
-                p_id = r["metadata"]["parent_id"]
-                if p_id:
-                    if p_id not in seen_parents:
-                        seen_parents.add(p_id)
-                        dedup_results.append(r)
-                else:
-                    dedup_results.append(r)
-            return dedup_results
-            
         return results
 
-    def global_query(self, query_text, n_results=5, alpha=None):
+    @staticmethod
+    def _object_vector(obj):
+        vector = obj.vector
+        if isinstance(vector, dict):
+            vector = vector.get("default")
+        return vector or None
+
+    # Shared fan-out pool for global search (created on first use, lives for the process)
+    _fanout_executor = None
+    _fanout_lock = threading.Lock()
+
+    @classmethod
+    def _get_fanout_executor(cls, max_workers):
+        with cls._fanout_lock:
+            if cls._fanout_executor is None:
+                cls._fanout_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-fanout")
+            return cls._fanout_executor
+
+    @timed_method("vector_db", "global_query")
+    def global_query(self, query_text, n_results=5, alpha=None, stats=None, pinned=None, filters=None,
+                     include_vector=False):
         """
         Search across all knowledge base collections in parallel.
+        Each KB is ranked independently and results are combined with reciprocal rank
+        fusion in a bounded heap as KBs finish. KBs that exceed GLOBAL_QUERY_KB_TIMEOUT
+        are skipped, so the answer is built from the healthy KBs only.
+        With many KBs, only the top kb_routing.top_m KBs by routing score are searched,
+        plus pinned KBs (the `pinned` ids and KBs with the "pinned" setting).
+        filters: parse_filters() output, applied inside every KB's search.
+        stats: optional dict filled with {"kbs", "searched", "timed_out", "failed"}.
         """
-        log_path = r"f:\DLS_RAG\backend\query_debug.log"
+        stats = stats if stats is not None else {}
         try:
             kb_names = self.list_all_kbs()
-            with open(log_path, "a", encoding="utf-8") as f:
-                f.write(f"[{datetime.now()}] PARALLEL GLOBAL QUERY START | query: {query_text}\n")
+            stats.update({"kbs": len(kb_names), "timed_out": [], "failed": []})
+            log.debug("global_query_start", query=query_text, kbs=len(kb_names))
+            if not kb_names:
+                return []
                 
-            all_results = []
+            if alpha is None:
+                alpha = self.config.SETTINGS.get("hybrid_alpha", 0.5)
+            # Embed once instead of once per KB
+            vector = self.embedding_fn(query_text) if alpha > 0 and self.embedding_fn else None
+            
+            # Route: skip KBs whose summary does not match the query
+            from services.kb_service import load_kb_settings
+            kb_ids = [name.replace("KB_", "", 1) for name in kb_names]
+            pinned = set(pinned or ()) | {k for k in kb_ids if load_kb_settings(k).get("pinned")}
+            top_m = int(self.config.SETTINGS.get("kb_routing", {}).get("top_m", 0))
+            try:
+                with timed("vector_db", "route"):
+                    selected, _ = self.kb_router.select(query_text, vector, kb_ids, top_m, pinned)
+                kb_names = [f"KB_{k}" for k in selected]
+            except Exception as route_e:
+                log.warning("kb_routing_failed", error=str(route_e), fallback="all KBs")
+            stats["searched"] = len(kb_names)
+            
+            weights = ScoringWeights.from_settings(self.config.SETTINGS)
+            timeout = self.config.GLOBAL_QUERY_KB_TIMEOUT
+            started = {}
             
             def query_kb_task(kb_name):
-                kb_id = kb_name.replace("KB_", "")
-                try:
-                    # Get collection object without changing global state
-                    kb_coll = self.client.collections.get(kb_name)
-                    res = self.query(query_text, n_results=n_results * 2, alpha=alpha, target_collection=kb_coll)
-                    
-                    if not res:
-                        return []
-                        
-                    # 1. Normalize scores (Local Max-Min)
-                    max_kb_score = max(r["metadata"].get("score", 0) for r in res)
-                    min_kb_score = min(r["metadata"].get("score", 0) for r in res)
-                    score_range = max_kb_score - min_kb_score if max_kb_score > min_kb_score else 1.0
-                    
-                    processed_res = []
-                    query_low = query_text.lower()
+                started[kb_name] = time.monotonic()
+                # Get collection object without changing global state
+                kb_coll = self.client.collections.get(kb_name)
+                # With rank fusion a single KB can contribute at most n_results hits
+                with profiler.attach():
+                    return self.query(query_text, n_results=n_results, alpha=alpha, target_collection=kb_coll, vector=vector,
+                                      filters=filters, include_vector=include_vector)
+
+            executor = self._get_fanout_executor(self.config.GLOBAL_QUERY_MAX_WORKERS)
+            futures = {executor.submit(bind(query_kb_task), name): name for name in kb_names}
+            pending = set(futures)
+            # Hard stop for KBs still waiting for a free worker
+            hard_deadline = time.monotonic() + timeout * 2
+            
+            heap = []  # min-heap of (fused score, tiebreak, result), size <= n_results
+            tiebreak = 0
+            while pending:
+                now = time.monotonic()
+                # Each running KB gets `timeout` seconds from when it actually started
+                deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                wait_until = min(deadlines + [hard_deadline])
+                done, pending = wait(pending, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    kb_name = futures[future]
+                    try:
+                        res_list = future.result()
+                    except Exception as inner_e:
+                        log.error("kb_query_failed", kb=kb_name, error=str(inner_e))
+                        stats["failed"].append(kb_name)
+                        continue
                     
-                    for r in res:
-                        r_copy = r.copy()
-                        r_copy["metadata"] = r["metadata"].copy()
-                        r_copy["metadata"]["kb_id"] = kb_id
-                        
-                        raw_score = r_copy["metadata"].get("score", 0)
-                        norm_score = (raw_score - min_kb_score) / score_range if score_range > 0 else 0.5
-                        
-                        # Filename Boost
-                        source_file = r_copy["metadata"].get("source_file", "").lower()
-                        boost = 1.0
-                        if source_file and (source_file in query_low or query_low in source_file):
-                            boost = 3.0
-                            
-                        r_copy["metadata"]["global_score"] = norm_score * boost
-                        processed_res.append(r_copy)
-                    return processed_res
-                except Exception as inner_e:
-                    print(f"Error querying KB {kb_name}: {inner_e}")
-                    return []
-
-            # Execute in parallel
-            with ThreadPoolExecutor(max_workers=min(len(kb_names), 8)) as executor:
-                future_results = executor.map(query_kb_task, kb_names)
+                    fused = rrf_scores(len(res_list), weights.rrf_k)
+                    matches = filename_matches(query_text, [r["metadata"].get("source_file", "") for r in res_list])
+                    fused = np.where(matches, fused * weights.filename_boost, fused)
+                    for r, score in zip(res_list, fused.tolist()):
+                        tiebreak -= 1  # earlier-finished KBs win ties
+                        entry = (score, tiebreak, kb_name, r)
+                        if len(heap) < n_results:
+                            heapq.heappush(heap, entry)
+                        elif entry[:2] > heap[0][:2]:
+                            heapq.heapreplace(heap, entry)
                 
-            for res_list in future_results:
-                all_results.extend(res_list)
+                now = time.monotonic()
+                for future in list(pending):
+                    kb_name = futures[future]
+                    expired = now >= hard_deadline or (kb_name in started and now >= started[kb_name] + timeout)
+                    if expired:
+                        future.cancel()
+                        pending.discard(future)
+                        stats["timed_out"].append(kb_name)
             
-            # Sort by global_score descending
-            all_results.sort(key=lambda x: x["metadata"].get("global_score", 0), reverse=True)
+            all_results = []
+            for score, _, kb_name, r in sorted(heap, key=lambda e: e[:2], reverse=True):
+                r["metadata"]["kb_id"] = kb_name.replace("KB_", "", 1)
+                r["metadata"]["global_score"] = score
+                all_results.append(r)
             
-            with open(log_path, "a", encoding="utf-8") as f:
-                f.write(f"[{datetime.now()}] PARALLEL GLOBAL QUERY END | Total results: {len(all_results)}\n")
-                if all_results:
-                    top = all_results[0]
-                    f.write(f"  - Top global hit: {top['metadata'].get('source_file')} (Global Score: {top['metadata'].get('global_score', 0):.4f})\n")
+            top = all_results[0]["metadata"] if all_results else {}
+            log.info("global_query_end", results=len(all_results), searched=stats["searched"], kbs=stats["kbs"],
+                     timed_out=stats["timed_out"], failed=stats["failed"],
+                     top_file=top.get("source_file"), top_score=top.get("global_score"))
                 
-            return all_results[:n_results]
+            return all_results
         except Exception as e:
-            with open(log_path, "a", encoding="utf-8") as f:
-                f.write(f"[{datetime.now()}] CRITICAL ERROR in parallel global_query: {str(e)}\n")
+            log.error("global_query_failed", query=query_text, error=str(e))
             return []
 
     def delete_collection(self):
         """Clear all data in current knowledge base."""
         self.client.collections.delete(self.collection_name)
+        self.kb_router.drop_kb(self.kb_id)
+        self.parent_store.drop_kb(self.kb_id)
+        self.generations.bump(self.kb_id)
+        self._ensure_collection()
+
+    def use_staging_collection(self, name, settings):
+        """
+        Points this instance at a fresh staging collection built with `settings`
+        (the KB's settings with its pending collection settings applied). The
+        staging run gets its own parent store and routing index under
+        DATA_FOLDER/staging and bumps no generations, so nothing it writes
+        reaches the live KB before swap_in_staging_collection().
+        Names must not start with "KB_" (not listed as a KB).
+        """
+        self._staging_settings = dict(settings)
+        self._staging_folder = os.path.join(self.config.DATA_FOLDER, "staging", name)
+        shutil.rmtree(self._staging_folder, ignore_errors=True)
+        self.parent_store = ParentStore(self.config, folder=self._staging_folder)
+        self.kb_router = KBRouter(self.config, folder=self._staging_folder)
+        self.generations = _StagingGenerations()
+        self.client.collections.delete(name)
+        self.collection_name = name
         self._ensure_collection()
 
+    def _leave_staging(self):
+        """Points the side stores and codec back at the live KB and removes the staging files."""
+        self._staging_settings = None
+        self.parent_store = ParentStore(self.config)
+        self.kb_router = KBRouter(self.config)
+        self.generations = KBGenerations(self.config)
+        shutil.rmtree(self._staging_folder, ignore_errors=True)
+        self._staging_folder = None
+
+    def drop_staging_collection(self):
+        """Discards the staging collection and its side stores; the live KB was never touched."""
+        self.client.collections.delete(self.collection_name)
+        self._leave_staging()
+        self.collection_name = f"KB_{self.kb_id}"
+        self._ensure_collection()
+
+    def swap_in_staging_collection(self, on_swap=None):
+        """
+        Replaces the live KB with the staging one: the live collection is recreated
+        with the staging settings, on_swap() runs (e.g. to make those settings
+        live), the staged objects are copied over with their vectors and IDs, and
+        the staged parents and a routing summary of the new collection replace
+        the live ones. Search is only disrupted for the copy, not the re-index.
+        """
+        staging, staging_name, staging_parents = self.collection, self.collection_name, self.parent_store
+        self.collection_name = f"KB_{self.kb_id}"
+        self.client.collections.delete(self.collection_name)
+        self._ensure_collection()
+        if on_swap:
+            on_swap()
+        live_generations = KBGenerations(self.config)
+        with self.collection.batch.dynamic() as batch:
+            for obj in staging.iterator(include_vector=True):
+                batch.add_object(properties=obj.properties, vector=self._object_vector(obj), uuid=obj.uuid)
+        live_generations.bump(self.kb_id)
+        failed = self.collection.batch.failed_objects
+        if failed:
+            # Keep the staging collection and its side stores, so the copy can be redone from them
+            raise RuntimeError(f"{len(failed)} objects failed to copy from {staging_name} "
+                               f"({failed[0].message}); staging collection kept")
+        ParentStore(self.config).replace_kb(self.kb_id, staging_parents)
+        KBRouter(self.config).rebuild_kb(self.kb_id, self.collection)
+        self._leave_staging()
+        self.client.collections.delete(staging_name)
+
     def get_all_filenames(self):
         """
         Retrieves all unique source filenames.
@@ -353,7 +568,7 @@ class VectorDB:
                         filenames.append(group.grouped_by.value)
             return sorted(filenames)
         except Exception as e:
-            print(f"Error getting filenames: {e}")
+            log.error("get_filenames_failed", collection=self.collection_name, error=str(e))
             return []
     
     def get_file_content(self, filename):
@@ -370,20 +585,32 @@ class VectorDB:
              # Our ingestor uses: f"{filename}_{sheet}_chunk_{page}" or similar string
              # Best effort sort
              chunks = sorted(response.objects, key=lambda x: x.properties.get('chunk_id', ''))
+             texts = [obj.properties['text'] for obj in chunks]
+             
+             # Side-stored parents hold the full text; add indexed childless parents by page
+             side_parents = self.parent_store.get_file(self.kb_id, filename)
+             if side_parents:
+                 own = [(obj.properties.get('chunk_id') or 0, obj.properties['text'])
+                        for obj in chunks if obj.properties.get('is_parent')]
+                 texts = [text for _, text in sorted(side_parents + own, key=lambda x: x[0] or 0)]
              
              # Concatenate text
-             full_text = "\n\n".join([obj.properties['text'] for obj in chunks])
+             full_text = "\n\n".join(texts)
              return full_text if full_text else "暂无预览内容 (未索引或纯图片文件)"
              
         except Exception as e:
-            print(f"Error fetching file content: {e}")
+            log.error("get_file_content_failed", file=filename, error=str(e))
             return f"Error loading preview: {str(e)}"
     
-    def fetch_parent(self, parent_id):
+    @timed_method("vector_db", "parent_fetch_weaviate")
+    def fetch_parent(self, parent_id, collection=None):
         """Fetches the content of a parent chunk by its ID."""
+        stored = self.parent_store.get_many([parent_id])
+        if parent_id in stored:
+            return stored[parent_id]
         try:
              from weaviate.classes.query import Filter
-             response = self.collection.query.fetch_objects(
+             response = (collection or self.collection).query.fetch_objects(
                 filters=Filter.by_property("doc_id").equal(parent_id),
                 limit=1
              )
@@ -391,7 +618,7 @@ class VectorDB:
                  return response.objects[0].properties.get("text")
              return None
         except Exception as e:
-            print(f"Error fetching parent {parent_id}: {e}")
+            log.error("fetch_parent_failed", parent_id=parent_id, error=str(e))
             return None
 
     def delete_document(self, filename):
@@ -404,18 +631,45 @@ class VectorDB:
             result = self.collection.data.delete_many(
                 where=Filter.by_property("source_file").equal(filename)
             )
-            print(f"Deleted {result.successful} objects for {filename} from Weaviate.")
+            log.info("document_deleted", file=filename, kb=self.kb_id, objects=result.successful)
+            self.kb_router.remove_file(self.kb_id, filename)
+            self.parent_store.delete_file(self.kb_id, filename)
+            self.generations.bump(self.kb_id)
             return True
         except Exception as e:
-            print(f"Error deleting document {filename}: {e}")
+            log.error("delete_document_failed", file=filename, kb=self.kb_id, error=str(e))
             return False
 
+    def delete_objects(self, ids):
+        """Deletes objects by UUID (no-op for IDs that do not exist)."""
+        if not ids:
+            return 0
+        from weaviate.classes.query import Filter
+        result = self.collection.data.delete_many(where=Filter.by_id().contains_any(ids))
+        return result.successful
+
+    def delete_stale_objects(self, filename, keep_ids):
+        """Deletes a file's objects whose UUID is not in keep_ids (left over from an earlier version or chunking)."""
+        from weaviate.classes.query import Filter
+        keep = {str(i) for i in keep_ids}
+        response = self.collection.query.fetch_objects(
+            filters=Filter.by_property("source_file").equal(filename),
+            limit=10000,
+            return_properties=["source_file"]
+        )
+        stale = [str(obj.uuid) for obj in response.objects if str(obj.uuid) not in keep]
+        deleted = self.delete_objects(stale)
+        if deleted:
+            self.generations.bump(self.kb_id)
+        return deleted
+
     def update_document_tags(self, filename, tags):
         """Update tags for all chunks of a document."""
+        from weaviate.classes.query import Filter
         try:
             # 1. Find all objects for this file
             response = self.collection.query.fetch_objects(
-                filters=weaviate.classes.query.Filter.by_property("source_file").equal(filename),
+                filters=Filter.by_property("source_file").equal(filename),
                 limit=1000 # Assume file doesn't have > 1000 chunks
             )
             
@@ -427,14 +681,15 @@ class VectorDB:
                 )
             return True
         except Exception as e:
-            print(f"Error updating tags for {filename}: {e}")
+            log.error("update_tags_failed", file=filename, error=str(e))
             return False
 
     def get_document_tags(self, filename):
         """Get tags for a document (extracting from first chunk)."""
+        from weaviate.classes.query import Filter
         try:
             response = self.collection.query.fetch_objects(
-                filters=weaviate.classes.query.Filter.by_property("source_file").equal(filename),
+                filters=Filter.by_property("source_file").equal(filename),
                 limit=1,
                 return_properties=["tags"]
             )
@@ -442,7 +697,7 @@ class VectorDB:
                 return response.objects[0].properties.get("tags") or []
             return []
         except Exception as e:
-            print(f"Error getting tags for {filename}: {e}")
+            log.error("get_tags_failed", file=filename, error=str(e))
             return []
 
     def get_all_docs_stats(self):
@@ -471,7 +726,7 @@ class VectorDB:
                 
             return stats
         except Exception as e:
-            print(f"Error getting batch stats: {e}")
+            log.error("docs_stats_failed", collection=self.collection_name, error=str(e))
             return {}
 
     def get_count(self):
@@ -480,7 +735,7 @@ class VectorDB:
              # .total_count returns int
              return self.collection.aggregate.over_all(total_count=True).total_count
         except Exception as e:
-            print(f"Error getting count: {e}")
+            log.error("count_failed", collection=self.collection_name, error=str(e))
             return 0
     
     def close(self):
@@ -1,11 +1,22 @@
 import os
 import sys
-from celery import Celery
+import time
+from celery import Celery, Task, states
+from celery.signals import worker_init, task_revoked
+from kombu import Queue
 from config import Config
 from services.vector_db import VectorDB
 from services.llm_service import LLMService
 from services.ingestion_service import IngestionService
-from services.kb_service import KnowledgeBaseService
+from services.kb_service import KnowledgeBaseService, load_kb_settings
+from services.reindex import reindex_into_staging
+from services.task_router import IngestionRouter, PRIORITY_STEPS
+from services.ingestion.chunker import Chunker
+from services.metrics import enable_shared_sink
+from services import tracing
+from services import logging_service
+from services import profiler
+from services.logging_service import get_logger
 
 # Add parent directory to path to ensure imports work when running as a module
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -13,12 +24,24 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Load and Initialize Config
 config = Config()
 config.init_app()
+tracing.configure(config)
+logging_service.configure(config)
+profiler.configure(config)
+log = get_logger("worker")
 
 # Initialize shared services for worker
 llm_service = LLMService(config)
-# KnowledgeBaseService requires a vector_db instance for its constructor
-base_db = VectorDB(config, embedding_fn=llm_service.get_embedding, kb_id="default")
-kb_service = KnowledgeBaseService(config, base_db)
+ingestion_router = IngestionRouter(config)
+# Created on first use: the API imports this module and must not wait for Weaviate at startup
+kb_service = None
+
+def get_kb_service():
+    global kb_service
+    if kb_service is None:
+        # KnowledgeBaseService requires a vector_db instance for its constructor
+        base_db = VectorDB(config, embedding_fn=llm_service.get_embedding, kb_id="default")
+        kb_service = KnowledgeBaseService(config, base_db)
+    return kb_service
 
 def create_celery():
     celery = Celery(
@@ -26,37 +49,148 @@ def create_celery():
         broker=config.CELERY_BROKER_URL,
         backend=config.CELERY_RESULT_BACKEND
     )
+    celery.conf.task_queues = [
+        Queue(config.INGEST_QUEUE_INTERACTIVE),
+        Queue(config.INGEST_QUEUE_DEFAULT),
+        Queue(config.INGEST_QUEUE_BULK),
+    ]
+    celery.conf.task_default_queue = config.INGEST_QUEUE_DEFAULT
+    # Priority sub-queues on the Redis broker (lower number = served first)
+    celery.conf.broker_transport_options = {
+        'priority_steps': PRIORITY_STEPS,
+        'queue_order_strategy': 'priority',
+    }
+    # Don't let a worker hoard long bulk tasks while interactive ones wait
+    celery.conf.worker_prefetch_multiplier = 1
+    celery.conf.task_always_eager = config.CELERY_TASK_ALWAYS_EAGER
     return celery
 
 celery_app = create_celery()
 
-@celery_app.task(name="process_file_task", bind=True, max_retries=3)
-def process_file_task(self, file_path, kb_id):
+@worker_init.connect
+def init_worker_metrics(**kwargs):
+    # Worker stage timings are rendered by the API's /metrics (pool processes inherit this)
+    enable_shared_sink(config)
+
+def enqueue_file(file_path, kb_id, file_hash=None, cached=False, profile=None):
+    """
+    Submit a file for processing on the queue matching its estimated cost.
+    profile: profiler mode ("sample" / "cprofile") to profile the task with.
+    """
+    route = ingestion_router.route(file_path, kb_id, cached=cached)
+    task = process_file_task.apply_async(
+        args=(file_path, kb_id),
+        kwargs={"queue": route["queue"], "enqueued_at": time.time(), "file_hash": file_hash,
+                "trace_parent": tracing.current_traceparent(), "profile": profile},
+        queue=route["queue"],
+        priority=route["priority"],
+    )
+    return task, route
+
+class IngestionTask(Task):
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        # Success or final failure (retries come back later): always give the KB's backlog slot back
+        if status != states.RETRY:
+            ingestion_router.release(args[1] if len(args) > 1 else kwargs.get("kb_id"))
+
+@task_revoked.connect
+def release_revoked_task(request=None, **kwargs):
+    # Revoked before it ran (or terminated): after_return never runs for it
+    if request is not None and request.task == "process_file_task":
+        args, task_kwargs = request.args or (), request.kwargs or {}
+        ingestion_router.release(args[1] if len(args) > 1 else task_kwargs.get("kb_id"))
+
+@celery_app.task(name="process_file_task", bind=True, max_retries=3, base=IngestionTask)
+def process_file_task(self, file_path, kb_id, queue=None, enqueued_at=None, file_hash=None, trace_parent=None,
+                      profile=None):
     """
     Background task to process an uploaded file.
     """
     filename = os.path.basename(file_path)
-    print(f"[*] Task started: Processing {filename} for KB: {kb_id}")
+    queue = queue or config.INGEST_QUEUE_DEFAULT
+    log.info("task_started", file=filename, kb=kb_id, queue=queue, retry=self.request.retries)
+    if self.request.retries == 0:
+        ingestion_router.task_started(queue, enqueued_at)
+    start_time = time.time()
     
-    try:
-        # Initialize specialized DB and Ingestion service for this task
-        # Note: VectorDB connection is established per-task/per-worker
-        db = VectorDB(config, embedding_fn=llm_service.get_embedding, kb_id=kb_id)
-        service = IngestionService(config, db)
+    # Continues the uploading request's trace; profiled (stored as task-<id>) if asked
+    with profiler.profile(f"task-{self.request.id}", profile), \
+            tracing.trace("celery.process_file", parent=trace_parent, kb_id=kb_id, file=filename):
+    
+        try:
+            # Initialize specialized DB and Ingestion service for this task
+            # Note: VectorDB connection is established per-task/per-worker
+            db = VectorDB(config, embedding_fn=llm_service.get_embedding, kb_id=kb_id)
+            service = IngestionService(config, db)
         
-        result = service.process_file(file_path)
+            result = service.process_file(file_path, file_hash=file_hash)
         
-        # Update knowledge base file count
-        kb_service.update_file_count(kb_id)
+            # Update knowledge base file count
+            get_kb_service().update_file_count(kb_id)
         
-        print(f"[+] Task success: {filename} processed.")
-        return result
-    except Exception as e:
-        print(f"[-] Task error for {filename}: {e}")
-        # Retry after 60 seconds if it's a transient error
-        raise self.retry(exc=e, countdown=60)
+            log.info("task_succeeded", file=filename, kb=kb_id, seconds=round(time.time() - start_time, 2))
+            ingestion_router.record_run(queue, time.time() - start_time)
+            return result
+        except Exception as e:
+            log.error("task_failed", file=filename, kb=kb_id, retry=self.request.retries, error=str(e))
+            if self.request.retries >= self.max_retries:
+                ingestion_router.record_run(queue, time.time() - start_time)
+            # Retry after 60 seconds if it's a transient error
+            raise self.retry(exc=e, countdown=60)
+
+@celery_app.task(name="rechunk_kb_task", bind=True)
+def rechunk_kb_task(self, kb_id, chunk_size=None, chunk_overlap=None, semantic_threshold=None, recreate=False,
+                    trace_parent=None, profile=None):
+    """
+    Re-chunks and re-indexes every file of a KB, by default with the KB's stored
+    chunk settings (explicit parameters override them for this run only).
+    Extraction is reused from checkpoints, so files are not re-parsed.
+    recreate: the collection itself must change (the KB has pending vector dims /
+    quantizer settings). The KB is re-indexed into a staging collection and swapped
+    in only when every file succeeded (see services.reindex); the first failure
+    aborts and leaves the live collection and settings untouched.
+    """
+    with profiler.profile(f"task-{self.request.id}", profile), \
+            tracing.trace("celery.rechunk_kb", parent=trace_parent, kb_id=kb_id):
+        kb_service = get_kb_service()
+        pending = (kb_service.get(kb_id) or {}).get("pending_settings") or {}
+        recreate = recreate or bool(pending)
+        db = VectorDB(config, embedding_fn=llm_service.get_embedding, kb_id=kb_id)
+        chunker = None
+        if (chunk_size, chunk_overlap, semantic_threshold) != (None, None, None):
+            settings = load_kb_settings(kb_id)
+            chunker = Chunker(chunk_size=chunk_size or settings["chunk_size"],
+                              chunk_overlap=settings["chunk_overlap"] if chunk_overlap is None else chunk_overlap,
+                              embedding_fn=llm_service.get_embedding,
+                              semantic_threshold=semantic_threshold or settings["semantic_threshold"])
+        service = IngestionService(config, db, chunker=chunker)
+
+        if recreate:
+            try:
+                processed = reindex_into_staging(kb_service, db, service, kb_id, pending)
+            finally:
+                db.close()
+                kb_service.end_reindex(kb_id)
+            return {"processed": processed, "failed": []}
+
+        processed, failed = 0, []
+        for file_path in kb_service.list_file_paths(kb_id):
+            filename = os.path.basename(file_path)
+            try:
+                # Upserts over the file's deterministic IDs, then drops leftovers: a failure keeps the old chunks
+                service.process_file(file_path)
+                processed += 1
+            except Exception as e:
+                log.error("rechunk_file_failed", file=filename, kb=kb_id, error=str(e))
+                failed.append(filename)
+        db.close()
+        log.info("rechunk_finished", kb=kb_id, processed=processed, failed=len(failed))
+        return {"processed": processed, "failed": failed}
 
 if __name__ == '__main__':
     # This allows running the worker directly for debug, 
-    # but normally should be started via: celery -A worker.celery_app worker --loglevel=info
+    # but normally should be started via:
+    #   celery -A worker.celery_app worker -Q ingest_interactive,ingest_default,ingest_bulk --loglevel=info
+    # A dedicated worker for small interactive uploads keeps them fast under bulk load:
+    #   celery -A worker.celery_app worker -Q ingest_interactive --loglevel=info
     celery_app.start()
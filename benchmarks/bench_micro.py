@@ -0,0 +1,252 @@
+"""
+Micro-benchmarks of the ingestion hot functions, with regression checks
+against a stored baseline.
+
+Usage:
+    python benchmarks/bench_micro.py [--filter chunker] [--rounds 7] [--min-time 0.3]
+                                     [--save-baseline benchmarks/baselines/micro.json]
+                                     [--baseline benchmarks/baselines/micro.json --threshold 0.2]
+                                     [--json out.json]
+
+Each case runs one realistic unit of work (a page, a chunk, a sheet, a file)
+built from fixtures.TextFactory Chinese/English text:
+- TextCleaner.clean               one extracted page with PDF-style whitespace noise
+- Chunker.split_sentences         one page
+- Chunker.semantic_split          one page; embeddings are precomputed, so only the split is timed
+- VectorDB._preprocess_chinese    one chunk (the KB's BM25 pre-tokenization)
+- ExcelProcessor._process_dataframe  a 200-row mixed-type sheet
+- WordProcessor.process           a 12-section .docx file (parsing included)
+
+ops/s is the median of --rounds rounds of at least --min-time seconds each.
+Allocations come from separate tracemalloc passes over single calls: peak KiB
+allocated during the call and the number of allocated blocks still live after
+it (smallest of 3 calls).
+
+ops/s depends on the machine, so every round of a case is paired with a round
+of a fixed pure-Python calibration loop of the same length, run right before
+it. The relative score is the median of the per-round ratios, and cv is their
+coefficient of variation. --baseline compares relative scores (and peak
+allocations) and exits with status 1 when a case is slower, or allocates more,
+than the baseline by more than --threshold (--mem-threshold). A noisy case gets
+a wider limit, NOISE_FACTOR times the larger cv of the run and the baseline.
+A baseline entry may carry its own "threshold".
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from config import Config
+from services.ingestion.text_cleaner import TextCleaner
+from services.ingestion.chunker import Chunker
+from services.ingestion.excel_processor import ExcelProcessor
+from services.ingestion.word_processor import WordProcessor
+from services.vector_db import VectorDB
+from fixtures import TextFactory, ZH_WORDS, EN_WORDS
+from corpus import write_docx
+from fake_models import embed
+from fake_weaviate import FakeWeaviateClient
+
+
+def make_config(data_folder):
+    class BenchConfig(Config):
+        DATA_FOLDER = data_folder
+        SETTINGS = dict(Config.SETTINGS)
+    return BenchConfig
+
+
+def noisy_page(factory, rng):
+    """A page as PDF extraction returns it: stray tabs, runs of spaces, zero-width chars, blank lines."""
+    lines = []
+    for paragraph in factory.document(paragraphs=6).split("\n\n"):
+        for start in range(0, len(paragraph), 38):
+            line = paragraph[start:start + 38]
+            if rng.random() < 0.2:
+                line = line.replace("，", "，\t  ", 1)
+            if rng.random() < 0.05:
+                line += "\u200b"
+            lines.append(line)
+        lines.append("\n" * rng.randint(1, 4))
+    return "\n".join(lines)
+
+
+def make_sheet(rng, rows=200):
+    return pd.DataFrame({
+        "编号": range(1, rows + 1),
+        "项目": [rng.choice(ZH_WORDS) + rng.choice(ZH_WORDS) for _ in range(rows)],
+        "组件": [rng.choice(EN_WORDS) for _ in range(rows)],
+        "数值": [round(rng.uniform(0, 10000), 2) for _ in range(rows)],
+        "备注": [TextFactory(seed=i).sentence() for i in range(rows)],
+    })
+
+
+def build_cases(tmp):
+    """{name: callable running one unit of work}"""
+    rng = random.Random(42)
+    factory = TextFactory(seed=7)
+    page = noisy_page(factory, rng)
+    clean_page = TextCleaner.clean(page)
+    chunk = factory.paragraph(8)
+
+    sentences = Chunker().split_sentences(clean_page)
+    vectors = {s: embed(s) for s in sentences}
+    chunker = Chunker(embedding_fn=lambda texts: [vectors[t] for t in texts])
+
+    db = VectorDB(make_config(os.path.join(tmp, "data")), kb_id="bench", client=FakeWeaviateClient())
+
+    excel = ExcelProcessor(None)
+    sheet = make_sheet(rng)
+
+    docx_path = os.path.join(tmp, "sections.docx")
+    write_docx(docx_path, [factory.document(paragraphs=3) for _ in range(12)])
+    word = WordProcessor(None)
+
+    return {
+        "TextCleaner.clean": lambda: TextCleaner.clean(page),
+        "Chunker.split_sentences": lambda: chunker.split_sentences(clean_page),
+        "Chunker.semantic_split": lambda: chunker.semantic_split(clean_page),
+        "VectorDB._preprocess_chinese": lambda: db._preprocess_chinese(chunk),
+        "ExcelProcessor._process_dataframe": lambda: excel._process_dataframe(sheet, "bench.xlsx", "数据"),
+        "WordProcessor.process": lambda: word.process(docx_path),
+    }
+
+
+def calibration():
+    """Fixed pure-Python workload (string and dict work, like the cases) for normalizing across machines."""
+    counts = {}
+    for i in range(2000):
+        key = str(i % 97) + "键"
+        counts[key] = counts.get(key, 0) + len(key.split("键"))
+    return counts
+
+
+# A case's slowdown limit is at least this many times its measured cv
+NOISE_FACTOR = 2
+
+
+def batch_size(fn, min_time):
+    """Calls of fn that take about min_time seconds (after a warm-up call for imports and caches)."""
+    fn()
+    start, n = time.perf_counter(), 0
+    while time.perf_counter() - start < min_time / 10:
+        fn()
+        n += 1
+    return max(1, int(min_time / ((time.perf_counter() - start) / n)))
+
+
+def timed_rate(fn, batch):
+    start = time.perf_counter()
+    for _ in range(batch):
+        fn()
+    return batch / (time.perf_counter() - start)
+
+
+def measure(fn, rounds, min_time):
+    """
+    (median ops/s, median calibration ops/s, median relative score, cv of the relative scores).
+    Each round times the calibration loop and then fn for min_time each, so both
+    see the same machine state and load drifts cancel out in their ratio.
+    """
+    calibration_batch, batch = batch_size(calibration, min_time), batch_size(fn, min_time)
+    rates, calibration_rates, relative = [], [], []
+    for _ in range(rounds):
+        calibration_rates.append(timed_rate(calibration, calibration_batch))
+        rates.append(timed_rate(fn, batch))
+        relative.append(rates[-1] / calibration_rates[-1])
+    return (statistics.median(rates), statistics.median(calibration_rates), statistics.median(relative),
+            statistics.pstdev(relative) / statistics.mean(relative))
+
+
+def allocations(fn, calls=3):
+    """(peak KiB during one call, allocated blocks still live after it), the smallest of `calls` calls."""
+    peaks, lives = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            del result
+            peaks.append((peak - base) / 1024)
+            lives.append(sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0))
+    finally:
+        tracemalloc.stop()
+    return min(peaks), min(lives)
+
+
+def compare(results, baseline, threshold, mem_threshold):
+    regressions = []
+    for name, current in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if not before:
+            continue
+        limit = max(before.get("threshold", threshold), NOISE_FACTOR * max(current["cv"], before.get("cv", 0)))
+        if current["relative"] < before["relative"] * (1 - limit):
+            regressions.append(f"{name}: {before['relative']:.4f} -> {current['relative']:.4f} relative ops/s "
+                               f"({current['relative'] / before['relative'] - 1:+.1%}, limit -{limit:.0%})")
+        if before.get("peak_kib") and current["peak_kib"] > before["peak_kib"] * (1 + mem_threshold):
+            regressions.append(f"{name}: peak {before['peak_kib']:.1f} -> {current['peak_kib']:.1f} KiB "
+                               f"(limit +{mem_threshold:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only run cases whose name contains this (case-insensitive)")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.3, help="seconds per round")
+    parser.add_argument("--baseline", help="compare with this baseline; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--mem-threshold", type=float, default=0.25, help="allowed relative peak memory growth")
+    parser.add_argument("--save-baseline", help="write this run as the baseline")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_cases(tmp)
+        if args.filter:
+            cases = {k: v for k, v in cases.items() if args.filter.lower() in k.lower()}
+        results = {"cases": {}}
+        print(f"{'case':<36} {'ops/s':>12} {'±cv':>7} {'relative':>10} {'peak KiB':>10} {'live blocks':>12}")
+        for name, fn in cases.items():
+            ops, calibration_ops, relative, cv = measure(fn, args.rounds, args.min_time)
+            peak_kib, live = allocations(fn)
+            results["cases"][name] = {"ops_per_s": round(ops, 2), "cv": round(cv, 4),
+                                      "calibration_ops_per_s": round(calibration_ops, 1),
+                                      "relative": round(relative, 6),
+                                      "peak_kib": round(peak_kib, 1), "live_blocks": live}
+            print(f"{name:<36} {ops:>12,.1f} {cv:>7.1%} {relative:>10.4f} {peak_kib:>10.1f} {live:>12}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold, args.mem_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.baseline}:")
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print(f"\nNo regressions vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
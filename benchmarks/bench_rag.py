@@ -0,0 +1,270 @@
+"""
+Offline end-to-end RAG benchmark: ingest a synthetic corpus, then run the golden
+queries through the same pipeline as /api/query. No network or services needed.
+
+Usage:
+    python benchmarks/bench_rag.py [--docs 50] [--kbs 1] [--embed-ms 0] [--rerank-ms 0] [--llm-ms 0]
+                                   [--token-ms 0] [--stream] [--rerank dashscope|local]
+                                   [--json out.json] [--compare baseline.json --max-regression 0.2]
+
+Stand-ins (see fake_models.py / fake_weaviate.py):
+- embedding, rerank and chat models: a local HTTP server speaking the DashScope
+  and OpenAI-compatible APIs, so the SDK/requests code paths are the real ones
+- Weaviate: an in-memory client passed to VectorDB(client=...)
+- slide rendering: PPTX text only when aspose-slides is missing (fake_slides.py)
+Model latencies are 0 by default, so the numbers are the pipeline's own cost;
+set the --*-ms flags to model a deployment.
+
+Reported: ingest throughput and per-stage times, per-stage query latency
+percentiles (from the request trace, as stats.timings), and recall@k of the
+golden source file for retrieval and after rerank, per query kind.
+--compare exits with status 1 when a latency got slower, or a recall lower, than
+the baseline by more than --max-regression (relative).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from services import tracing
+from services.llm_service import LLMService
+from services.vector_db import VectorDB
+from services.ingestion_service import IngestionService
+from corpus import generate_corpus, FORMATS
+from fake_models import FakeModelServer
+from fake_weaviate import FakeWeaviateClient
+from fake_slides import use_text_only_slides
+from bench_tokenizer import percentile
+
+RECALL_KS = (1, 5, 10, 20)
+RETRIEVE_N = 20
+RERANK_TOP_N = 5
+
+
+def make_config(data_folder, rerank_provider):
+    class BenchConfig(Config):
+        DATA_FOLDER = data_folder
+        PROCESSED_FOLDER = os.path.join(data_folder, "processed")
+        SLIDES_FOLDER = os.path.join(data_folder, "processed", "slides")
+        SETTINGS = {**Config.SETTINGS,
+                    "tracing": {**Config.SETTINGS["tracing"], "exporter": "none"},
+                    "rerank": {**Config.SETTINGS["rerank"], "provider": rerank_provider}}
+    for folder in (BenchConfig.PROCESSED_FOLDER, BenchConfig.SLIDES_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+    return BenchConfig
+
+
+def summarize(samples):
+    """{stage: [ms, ...]} -> {stage: {p50, p95, p99, mean, n}}"""
+    return {stage: {"p50": round(percentile(v, 0.50), 2), "p95": round(percentile(v, 0.95), 2),
+                    "p99": round(percentile(v, 0.99), 2), "mean": round(sum(v) / len(v), 2), "n": len(v)}
+            for stage, v in sorted(samples.items()) if v}
+
+
+def ingest(cfg, db, files_dir, files, n_kbs):
+    """Ingests every file under its own trace; returns the ingest report and {filename: kb_id}."""
+    service = use_text_only_slides(IngestionService(cfg, db))
+    stages, placement = defaultdict(list), {}
+    failures, chunks = defaultdict(list), 0
+    start = time.perf_counter()
+    for i, entry in enumerate(files):
+        kb_id = f"bench{i % n_kbs}" if n_kbs > 1 else "bench"
+        if db.kb_id != kb_id:
+            db.switch_kb(kb_id)
+        with tracing.trace("bench.ingest", force=True, file=entry["file"]):
+            try:
+                result = service.process_file(os.path.join(files_dir, entry["file"]))
+                chunks += result.get("total_chunks", 0)
+                if result.get("status") != "success":
+                    failures[entry["format"]].append(f"{entry['file']}: {result.get('message')}")
+            except Exception as e:
+                failures[entry["format"]].append(f"{entry['file']}: {e}")
+            for stage, ms in tracing.timings().items():
+                stages[stage].append(ms)
+        placement[entry["file"]] = kb_id
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "docs_per_s": round(len(files) / elapsed, 2) if elapsed else 0.0,
+        "failures": dict(failures),
+        "stages_ms": summarize(stages),
+    }, placement
+
+
+def run_query(llm, db, query_text, global_search, stream):
+    """The /api/query pipeline (app.answer_query, without the answer cache); returns (retrieved, reranked) files."""
+    search_query = llm.rewrite_query(query_text, [])
+    intent = llm.detect_intent(query_text)
+    alpha, n_results = None, RETRIEVE_N
+    if intent == "FILE_QUERY":
+        alpha, n_results = 0.3, 30
+    elif intent == "SUMMARY":
+        alpha, n_results = 0.7, 40
+    local_rerank = llm.rerank_provider() == "local"
+    if global_search:
+        results = db.global_query(search_query, n_results=n_results, alpha=alpha, include_vector=local_rerank)
+    else:
+        results = db.query(search_query, n_results=n_results, alpha=alpha, include_vector=local_rerank)
+    retrieved = [r["metadata"].get("source_file") for r in results]
+    if not results:
+        return retrieved, []
+    order = llm.rerank(search_query, [r["text"] for r in results], top_n=RERANK_TOP_N,
+                       ids=[f"{r['metadata'].get('kb_id', '')}/{r['metadata'].get('doc_id', '')}/"
+                            f"{r['metadata'].get('parent_id', '')}" for r in results],
+                       vectors=[r.get("vector") for r in results] if local_rerank else None)
+    context_docs = [f"【文件：{results[i]['metadata'].get('source_file')}】\n{results[i]['text']}" for i in order]
+    context_docs, history, _ = llm.pack_context(query_text, context_docs, [])
+    if stream:
+        for _ in llm.generate_stream(query_text, context_docs, history=history):
+            pass
+    else:
+        llm.generate_response(query_text, context_docs, history=history)
+    return retrieved, [results[i]["metadata"].get("source_file") for i in order]
+
+
+def first_rank(files, target):
+    return files.index(target) + 1 if target in files else None
+
+
+def run_queries(llm, db, queries, global_search, stream):
+    stages = defaultdict(list)
+    ranks = defaultdict(list)  # kind -> [(retrieval rank, rerank rank)]
+    start = time.perf_counter()
+    for q in queries:
+        with tracing.trace("bench.query", force=True, kind=q["kind"]):
+            retrieved, reranked = run_query(llm, db, q["query"], global_search, stream)
+            for stage, ms in tracing.timings().items():
+                stages[stage].append(ms)
+        ranks[q["kind"]].append((first_rank(retrieved, q["source_file"]), first_rank(reranked, q["source_file"])))
+    elapsed = time.perf_counter() - start
+
+    recall = {}
+    for kind, pairs in sorted(ranks.items()) + [("all", [p for v in ranks.values() for p in v])]:
+        row = {f"@{k}": round(sum(1 for r, _ in pairs if r and r <= k) / len(pairs), 4) for k in RECALL_KS}
+        row[f"rerank@{RERANK_TOP_N}"] = round(sum(1 for _, r in pairs if r) / len(pairs), 4)
+        row["queries"] = len(pairs)
+        recall[kind] = row
+    return {
+        "queries": len(queries),
+        "seconds": round(elapsed, 3),
+        "qps": round(len(queries) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(stages),
+        "recall": recall,
+    }
+
+
+def compare(result, baseline, max_regression):
+    """Regressions of result vs baseline: slower p50/p95 per query stage (and total), lower recall."""
+    regressions = []
+    for stage, current in result["query"]["latency_ms"].items():
+        before = baseline.get("query", {}).get("latency_ms", {}).get(stage)
+        for p in ("p50", "p95"):
+            # Ignore sub-millisecond stages; their noise dwarfs any real change
+            if before and before[p] >= 1.0 and current[p] > before[p] * (1 + max_regression):
+                regressions.append(f"latency {stage} {p}: {before[p]} -> {current[p]} ms")
+    ingest_before = baseline.get("ingest", {}).get("docs_per_s")
+    if ingest_before and result["ingest"]["docs_per_s"] < ingest_before * (1 - max_regression):
+        regressions.append(f"ingest docs/s: {ingest_before} -> {result['ingest']['docs_per_s']}")
+    for kind, current in result["query"]["recall"].items():
+        before = baseline.get("query", {}).get("recall", {}).get(kind, {})
+        for metric, value in current.items():
+            if metric != "queries" and metric in before and value < before[metric] * (1 - max_regression):
+                regressions.append(f"recall {kind} {metric}: {before[metric]} -> {value}")
+    return regressions
+
+
+def print_report(result):
+    ingest_report, query_report = result["ingest"], result["query"]
+    print(f"\nIngest: {ingest_report['files']} files, {ingest_report['chunks']} chunks in "
+          f"{ingest_report['seconds']}s ({ingest_report['docs_per_s']} docs/s)")
+    for fmt, errors in ingest_report["failures"].items():
+        print(f"  {fmt}: {len(errors)} failed, e.g. {errors[0]}")
+    print(f"{'ingest stage':<32} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for stage, s in ingest_report["stages_ms"].items():
+        print(f"{stage:<32} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['mean']:>9.1f}")
+
+    print(f"\nQuery: {query_report['queries']} queries in {query_report['seconds']}s ({query_report['qps']} qps)")
+    print(f"{'query stage (ms)':<32} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for stage, s in query_report["latency_ms"].items():
+        print(f"{stage:<32} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['mean']:>9.1f}")
+
+    metrics = [f"@{k}" for k in RECALL_KS] + [f"rerank@{RERANK_TOP_N}"]
+    print(f"\n{'recall':<10} " + " ".join(f"{m:>10}" for m in metrics))
+    for kind, row in query_report["recall"].items():
+        print(f"{kind:<10} " + " ".join(f"{row[m]:>10.3f}" for m in metrics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--corpus-dir", help="reuse (or keep) the generated corpus here instead of a temp dir")
+    parser.add_argument("--kbs", type=int, default=1, help="split the corpus over N KBs and use global search")
+    parser.add_argument("--embed-ms", type=float, default=0.0)
+    parser.add_argument("--rerank-ms", type=float, default=0.0)
+    parser.add_argument("--llm-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--rerank", choices=("dashscope", "local"), default="dashscope")
+    parser.add_argument("--stream", action="store_true", help="generate answers with the streaming API")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --json run")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or os.path.join(tmp, "corpus")
+        golden_path = os.path.join(corpus_dir, "golden.json")
+        if os.path.exists(golden_path):
+            with open(golden_path, encoding="utf-8") as f:
+                golden = json.load(f)
+        else:
+            golden = generate_corpus(corpus_dir, args.docs, args.seed, tuple(args.formats.split(",")))
+
+        cfg = make_config(os.path.join(tmp, "data"), args.rerank)
+        tracing.configure(cfg)
+        with FakeModelServer(args.embed_ms, args.rerank_ms, args.llm_ms, args.token_ms) as server:
+            server.configure(cfg)
+            # The rerank provider must survive the server's settings update
+            cfg.SETTINGS["rerank"]["provider"] = args.rerank
+            llm = LLMService(cfg)
+            db = VectorDB(cfg, embedding_fn=llm.get_embedding, kb_id="bench", client=FakeWeaviateClient())
+
+            ingest_report, placement = ingest(cfg, db, os.path.join(corpus_dir, "files"), golden["files"], args.kbs)
+            queries = [q for q in golden["queries"] if q["source_file"] in placement]
+            query_report = run_queries(llm, db, queries, args.kbs > 1, args.stream)
+            calls = dict(server.calls)
+
+    result = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "corpus_dir")},
+        "ingest": ingest_report,
+        "query": query_report,
+        "model_calls": calls,
+    }
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.compare}:")
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print(f"\nNo regressions vs {args.compare} (threshold {args.max_regression:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+KB routing benchmark: recall vs fan-out, and routing cost vs number of KBs.
+
+Usage:
+    python benchmarks/bench_routing.py [--kbs 32] [--docs-per-kb 60] [--queries 200] [--top-n 10] [--json out.json]
+
+Each synthetic KB has its own topic (a reshuffled Zipf vocabulary). Ground truth
+is BM25 top-n over the union of all documents. A search runs BM25 top-n inside
+each selected KB and fuses the lists with reciprocal rank fusion, as
+VectorDB.global_query does; top_m = number of KBs is the unrouted baseline.
+"source_hit" is how often the KB the query was drawn from was selected.
+Embeddings are hashed bag-of-bigrams projections, so no model or Weaviate is needed.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.kb_router import KBRouter
+from services.tokenizer import CJKTokenizer
+from fixtures import make_documents, make_queries
+from bench_tokenizer import BM25Index, percentile
+
+DIM = 128
+RRF_K = 60
+
+
+class BenchConfig:
+    def __init__(self, data_folder, vector_weight):
+        self.DATA_FOLDER = data_folder
+        self.SETTINGS = {"kb_routing": {"vector_weight": vector_weight}}
+
+
+class HashEmbedder:
+    """Deterministic stand-in for an embedding model: sum of per-token random vectors."""
+    def __init__(self, tokenize):
+        self.tokenize = tokenize
+        self._cache = {}
+
+    def _token_vector(self, token):
+        vec = self._cache.get(token)
+        if vec is None:
+            vec = np.random.default_rng(zlib.crc32(token.encode('utf-8'))).standard_normal(DIM).astype(np.float32)
+            self._cache[token] = vec
+        return vec
+
+    def __call__(self, text):
+        vec = np.zeros(DIM, dtype=np.float32)
+        for token in self.tokenize(text).split():
+            vec += self._token_vector(token)
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+
+def fused_top(indexes, kb_ids, tokens, top_n):
+    """Global top-n (kb_id, doc_idx) by RRF over the per-KB BM25 rankings."""
+    candidates = []
+    for kb_id in kb_ids:
+        hits, _ = indexes[kb_id].search(tokens, k=top_n)
+        candidates.extend((1.0 / (RRF_K + rank), kb_id, doc) for rank, (doc, _) in enumerate(hits, 1))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    return {(kb_id, doc) for _, kb_id, doc in candidates[:top_n]}
+
+
+def build(n_kbs, docs_per_kb, router, embed, tokenize):
+    indexes, union, union_keys = {}, [], []
+    for k in range(n_kbs):
+        kb_id = f"kb{k:03d}"
+        docs = make_documents(docs_per_kb, seed=1000 + k, topic=k)
+        tokenized = [tokenize(d).split() for d in docs]
+        indexes[kb_id] = BM25Index(tokenized)
+        union.extend(tokenized)
+        union_keys.extend((kb_id, i) for i in range(len(docs)))
+        # One "file" per 10 documents, mirroring incremental ingest
+        for start in range(0, docs_per_kb, 10):
+            batch = docs[start:start + 10]
+            router.add_file(kb_id, f"file{start}.txt", batch, [embed(d) for d in batch])
+    return indexes, BM25Index(union), union_keys
+
+
+def run(args, fanouts):
+    tokenizer = CJKTokenizer("bigram")
+    embed = HashEmbedder(tokenizer.tokenize)
+    with tempfile.TemporaryDirectory() as tmp:
+        router = KBRouter(BenchConfig(tmp, args.vector_weight))
+        t0 = time.perf_counter()
+        indexes, global_index, global_keys = build(args.kbs, args.docs_per_kb, router, embed, tokenizer.tokenize)
+        build_s = time.perf_counter() - t0
+        kb_ids = sorted(indexes)
+
+        # Queries are drawn from the topics of random KBs
+        rng = np.random.default_rng(3)
+        topics = [int(t) for t in rng.integers(args.kbs, size=args.queries)]
+        queries = [make_queries(1, seed=i, topic=t)[0] for i, t in enumerate(topics)]
+        truths = [{global_keys[doc] for doc, _ in global_index.search(tokenizer.tokenize(q).split(), k=args.top_n)[0]}
+                  for q in queries]
+        vectors = [embed(q) for q in queries]
+
+        results = []
+        for m in fanouts:
+            recalls, searched, hits, route_ms, search_ms = [], [], [], [], []
+            for q, vec, truth, topic in zip(queries, vectors, truths, topics):
+                t0 = time.perf_counter()
+                selected, _ = router.select(q, vec, kb_ids, m)
+                route_ms.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                found = fused_top(indexes, selected, tokenizer.tokenize(q).split(), args.top_n)
+                search_ms.append((time.perf_counter() - t0) * 1000)
+                searched.append(len(selected))
+                hits.append(kb_ids[topic] in selected)
+                if truth:
+                    recalls.append(len(found & truth) / len(truth))
+            results.append({
+                "top_m": m,
+                "kbs_searched": round(sum(searched) / len(searched), 1),
+                "recall_at_n": round(sum(recalls) / max(1, len(recalls)), 4),
+                "source_hit": round(sum(hits) / len(hits), 4),
+                "route_p50_ms": round(percentile(route_ms, 0.5), 3),
+                "search_p50_ms": round(percentile(search_ms, 0.5), 3),
+            })
+        return build_s, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kbs", type=int, default=32)
+    parser.add_argument("--docs-per-kb", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--vector-weight", type=float, default=0.6)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    fanouts = sorted({m for m in (1, 2, 4, 8, 16) if m < args.kbs} | {args.kbs})
+    build_s, results = run(args, fanouts)
+    print(f"{args.kbs} KBs x {args.docs_per_kb} docs, {args.queries} queries, top-n={args.top_n} "
+          f"(routing index built in {build_s:.1f}s)\n")
+    header = ["top_m", "kbs_searched", "recall_at_n", "source_hit", "route_p50_ms", "search_p50_ms"]
+    print("  ".join(f"{h:>14}" for h in header))
+    for r in results:
+        print("  ".join(f"{str(r[h]):>14}" for h in header))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"config": vars(args), "build_s": build_s, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
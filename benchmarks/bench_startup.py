@@ -0,0 +1,172 @@
+"""
+Startup time and memory of the API and the Celery worker modules, with budgets.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--max-seconds 2.0] [--max-rss-mb 120]
+                                       [--no-serve] [--json out.json]
+
+Every run is a fresh interpreter, so nothing is cached in memory between runs
+(bytecode caches on disk are, as in a deployment):
+- import app / import worker   wall time of the import (config, services,
+                                Flask routes), peak RSS of the process, and
+                                which heavy libraries got imported. None of
+                                them should be: Weaviate, DashScope, pandas,
+                                langchain and the document parsers load on
+                                first use.
+- serve                         process spawn until GET /api/health answers
+                                200, with the startup warm-up on and no
+                                Weaviate or Redis reachable: health must not
+                                wait for backends (/api/ready reports 503).
+Paths point at a temporary data dir, so runs don't touch the repo's data.
+
+Medians over --runs are reported. The exit status is 1 when a median import or
+serve time is over --max-seconds, or a peak RSS over --max-rss-mb. The default
+budgets leave headroom on a slow machine but fail once a heavy library is
+imported eagerly again (Weaviate or pandas alone add ~1 s and 40-80 MB).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, '..', 'backend')
+sys.path.append(HERE)
+
+from load_test import free_port
+
+HEAVY_MODULES = ("weaviate", "dashscope", "pandas", "langchain_text_splitters", "pdfplumber", "pptx", "docx",
+                 "aspose", "PIL", "openai", "torch", "sentence_transformers")
+
+# Runs in the child: redirect data paths, time the import, report as JSON on the last line
+CHILD = """
+import os, sys, json, time, resource
+start = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from config import Config
+from services import kb_service
+data_dir = {data_dir!r}
+Config.DATA_FOLDER = os.path.join(data_dir, "data")
+Config.PROCESSED_FOLDER = os.path.join(Config.DATA_FOLDER, "processed")
+Config.SLIDES_FOLDER = os.path.join(Config.PROCESSED_FOLDER, "slides")
+Config.UPLOAD_FOLDER = os.path.join(data_dir, "file")
+Config.USERS_FILE = os.path.join(data_dir, "users.json")
+Config.CONFIG_FILE = os.path.join(data_dir, "config.json")
+Config.SETTINGS["tracing"] = {{**Config.SETTINGS["tracing"], "exporter": "none"}}
+kb_service.KB_FILE = os.path.join(data_dir, "knowledge_bases.json")
+import {module} as target
+seconds = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_mb, "modules": len(sys.modules), "heavy": heavy}}), flush=True)
+if {port!r}:
+    target.app.run(host="127.0.0.1", port={port!r}, threaded=True, use_reloader=False)
+"""
+
+
+def child_env(warmup):
+    env = dict(os.environ, STARTUP_WARMUP="1" if warmup else "0",
+               # Unreachable backends: startup must not depend on them
+               WEAVIATE_HOST="127.0.0.1", WEAVIATE_PORT=str(free_port()), REDIS_HOST="127.0.0.1",
+               REDIS_PORT=str(free_port()))
+    env.pop("CELERY_TASK_ALWAYS_EAGER", None)
+    return env
+
+
+def measure_import(module, data_dir):
+    code = CHILD.format(backend=BACKEND, data_dir=data_dir, module=module, heavy=HEAVY_MODULES, port=None)
+    out = subprocess.run([sys.executable, "-c", code], env=child_env(warmup=False), cwd=data_dir,
+                         capture_output=True, text=True, timeout=120)
+    if out.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure_serve(data_dir, timeout=60):
+    """Seconds from spawn to the first 200 from /api/health, and /api/ready's status code at that moment."""
+    port = free_port()
+    code = CHILD.format(backend=BACKEND, data_dir=data_dir, module="app", heavy=HEAVY_MODULES, port=port)
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", code], env=child_env(warmup=True), cwd=data_dir,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise SystemExit("API process exited during startup")
+            try:
+                if requests.get(f"{url}/api/health", timeout=1).status_code == 200:
+                    seconds = time.perf_counter() - start
+                    return seconds, requests.get(f"{url}/api/ready", timeout=5).status_code
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise SystemExit(f"/api/health did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def median(values):
+    return round(statistics.median(values), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-serve", action="store_true", help="skip the time-to-/api/health measurement")
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="budget for median import and serve times")
+    parser.add_argument("--max-rss-mb", type=float, default=120, help="budget for peak RSS after import")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for module in ("app", "worker"):
+            runs = [measure_import(module, tmp) for _ in range(args.runs)]
+            results[f"import {module}"] = {
+                "seconds": median([r["seconds"] for r in runs]),
+                "rss_mb": round(max(r["rss_mb"] for r in runs), 1),
+                "modules": runs[-1]["modules"],
+                "heavy": sorted({m for r in runs for m in r["heavy"]}),
+            }
+        if not args.no_serve:
+            serves = [measure_serve(tmp) for _ in range(args.runs)]
+            results["serve"] = {"seconds": median([s for s, _ in serves]),
+                                "ready_status": sorted({status for _, status in serves})}
+
+    print(f"{'':<16} {'median s':>9} {'peak RSS MB':>12} {'modules':>8}  heavy libraries loaded")
+    for name, r in results.items():
+        if name == "serve":
+            print(f"{'serve (health)':<16} {r['seconds']:>9.3f} {'':>12} {'':>8}  "
+                  f"/api/ready at that point: {', '.join(map(str, r['ready_status']))}")
+        else:
+            print(f"{name:<16} {r['seconds']:>9.3f} {r['rss_mb']:>12.1f} {r['modules']:>8}  "
+                  f"{', '.join(r['heavy']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+    over = []
+    for name, r in results.items():
+        if r["seconds"] > args.max_seconds:
+            over.append(f"{name}: {r['seconds']:.3f}s > {args.max_seconds}s")
+        if r.get("rss_mb", 0) > args.max_rss_mb:
+            over.append(f"{name}: {r['rss_mb']:.1f} MB > {args.max_rss_mb} MB")
+    if over:
+        print(f"\n{len(over)} over budget:")
+        for line in over:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nWithin budget ({args.max_seconds}s, {args.max_rss_mb} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Tokenizer benchmark: index size and BM25 query latency per tokenizer mode.
+
+Usage:
+    python benchmarks/bench_tokenizer.py [--docs 2000] [--queries 500] [--corpus-dir DIR] [--json out.json]
+
+Compares the legacy per-character _preprocess_chinese implementation with the
+unigram / bigram / word modes of services.tokenizer. The BM25 index is a small
+in-memory inverted index, so numbers isolate tokenization effects from Weaviate.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.tokenizer import CJKTokenizer, MODES
+from fixtures import make_documents, make_queries
+
+
+def legacy_preprocess(text):
+    """The original VectorDB._preprocess_chinese, kept for comparison."""
+    if not text:
+        return ""
+    processed = ""
+    for char in text:
+        if re.match(r'[\u4e00-\u9fff]', char):
+            processed += f" {char} "
+        else:
+            processed += char
+    return re.sub(r'\s+', ' ', processed).strip()
+
+
+class BM25Index:
+    def __init__(self, tokenized_docs, k1=1.2, b=0.75):
+        self.k1, self.b = k1, b
+        self.postings = defaultdict(dict)
+        self.doc_len = []
+        for doc_id, tokens in enumerate(tokenized_docs):
+            self.doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term][doc_id] = tf
+        self.n_docs = len(tokenized_docs)
+        self.avg_len = sum(self.doc_len) / max(1, self.n_docs)
+
+    def search(self, tokens, k=10):
+        scores = defaultdict(float)
+        for term in set(tokens):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / self.avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+        return top, len(scores)
+
+    @property
+    def n_postings(self):
+        return sum(len(d) for d in self.postings.values())
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def run_mode(name, tokenize, docs, queries):
+    start = time.perf_counter()
+    tokenized = [tokenize(d).split() for d in docs]
+    tokenize_s = time.perf_counter() - start
+    total_chars = sum(len(d) for d in docs)
+
+    index = BM25Index(tokenized)
+    latencies, candidates = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, n_candidates = index.search(tokenize(q).split())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        candidates.append(n_candidates)
+
+    return {
+        "mode": name,
+        "tokenize_chars_per_s": round(total_chars / tokenize_s),
+        "tokens_total": sum(len(t) for t in tokenized),
+        "vocabulary": len(index.postings),
+        "postings": index.n_postings,
+        "query_p50_ms": round(percentile(latencies, 0.5), 3),
+        "query_p95_ms": round(percentile(latencies, 0.95), 3),
+        "avg_candidates": round(sum(candidates) / max(1, len(candidates)), 1),
+    }
+
+
+def load_corpus_dir(path):
+    docs = []
+    for root, _, files in os.walk(path):
+        for f in files:
+            if f.lower().endswith(('.txt', '.md')):
+                with open(os.path.join(root, f), 'r', encoding='utf-8', errors='ignore') as fh:
+                    docs.append(fh.read())
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--corpus-dir", help="Use .txt/.md files from this directory instead of synthetic text")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    docs = load_corpus_dir(args.corpus_dir) if args.corpus_dir else make_documents(args.docs)
+    queries = make_queries(args.queries)
+    print(f"Corpus: {len(docs)} docs, {sum(len(d) for d in docs)} chars; {len(queries)} queries\n")
+
+    results = [run_mode("legacy", legacy_preprocess, docs, queries)]
+    for mode in MODES:
+        results.append(run_mode(mode, CJKTokenizer(mode).tokenize, docs, queries))
+
+    header = ["mode", "tokenize_chars_per_s", "vocabulary", "postings", "query_p50_ms", "query_p95_ms", "avg_candidates"]
+    print("  ".join(f"{h:>20}" for h in header))
+    for r in results:
+        print("  ".join(f"{str(r[h]):>20}" for h in header))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"docs": len(docs), "queries": len(queries), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Vector storage benchmark: recall and size per compression mode and dimension count.
+
+Usage:
+    python benchmarks/bench_vector_codec.py [--checkpoints DIR] [--queries 200] [--k 10]
+                                            [--dims 1024,768,512,256] [--rescore 200] [--json out.json]
+
+Vectors come from the ingestion checkpoints (DATA_FOLDER/checkpoints), i.e. the
+embeddings of our own documents; held-out vectors serve as queries. With fewer
+than --min-vectors real vectors, clustered synthetic vectors are used instead.
+Ground truth is exact float32 cosine top-k at full dimension. "int8+rescore"
+re-ranks the top --rescore int8 candidates with float32 vectors, as Weaviate's
+SQ quantizer does with rescore_limit. Latency is brute-force scoring in NumPy,
+so compare it between rows rather than with HNSW query times.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.vector_codec import VectorCodec
+from bench_tokenizer import percentile
+
+
+def load_checkpoint_vectors(root):
+    blocks = []
+    for path in glob.glob(os.path.join(root, "*", "*", "vectors*.np[yz]")):
+        try:
+            if path.endswith(".npz"):
+                with np.load(path) as arrays:
+                    blocks.append(VectorCodec.decode(arrays))
+            else:
+                blocks.append(np.load(path).astype(np.float32))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    dims = {b.shape[1] for b in blocks if b.ndim == 2 and len(b)}
+    if len(dims) > 1:
+        # Several embedding models; keep the most common dimension
+        common = max(dims, key=lambda d: sum(len(b) for b in blocks if b.shape[1] == d))
+        blocks = [b for b in blocks if b.shape[1] == common]
+    return np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+
+
+def synthetic_vectors(n, dim=1536, clusters=50, seed=0):
+    """Clustered unit vectors with a decaying spectrum, roughly like text embeddings."""
+    rng = np.random.default_rng(seed)
+    spectrum = 1.0 / np.sqrt(np.arange(1, dim + 1))
+    centers = rng.standard_normal((clusters, dim)) * spectrum
+    assign = rng.integers(clusters, size=n)
+    vectors = centers[assign] + 0.6 * rng.standard_normal((n, dim)) * spectrum
+    return vectors.astype(np.float32)
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(corpus, queries, k):
+    scores = queries @ corpus.T
+    idx = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.take_along_axis(scores, idx, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def evaluate(name, codec, corpus, queries, truth, k, rescore=0):
+    stored = np.asarray(codec.prepare(corpus), dtype=np.float32)
+    query_vecs = np.asarray(codec.prepare(queries), dtype=np.float32)
+    searched = codec.decode(codec.encode(stored))
+
+    latencies, recalls = [], []
+    for q, expected in zip(query_vecs, truth):
+        t0 = time.perf_counter()
+        if rescore:
+            candidates = top_k(searched, q[None, :], min(rescore, len(searched) - 1))[0]
+            found = candidates[top_k(stored[candidates], q[None, :], k)[0]]
+        else:
+            found = top_k(searched, q[None, :], k)[0]
+        latencies.append((time.perf_counter() - t0) * 1000)
+        recalls.append(len(set(found.tolist()) & set(expected.tolist())) / k)
+
+    per_vector = codec.bytes_per_vector(corpus.shape[1])
+    return {
+        "mode": name,
+        "dims": stored.shape[1],
+        "bytes_per_vector": per_vector,
+        "corpus_mb": round(per_vector * len(corpus) / 1e6, 2),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "query_p50_ms": round(percentile(latencies, 0.5), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoints", help="Checkpoint directory (default: <DATA_FOLDER>/checkpoints)")
+    parser.add_argument("--min-vectors", type=int, default=1000)
+    parser.add_argument("--synthetic", type=int, default=20000, help="Synthetic corpus size if needed")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dims", default="1024,768,512,256")
+    parser.add_argument("--rescore", type=int, default=200)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    root = args.checkpoints
+    if root is None:
+        from config import Config
+        root = os.path.join(Config.DATA_FOLDER, "checkpoints")
+    vectors = load_checkpoint_vectors(root) if os.path.isdir(root) else np.zeros((0, 0))
+    source = f"checkpoints ({root})"
+    if len(vectors) < args.min_vectors:
+        print(f"Only {len(vectors)} vectors in {root}; using {args.synthetic} synthetic vectors")
+        vectors, source = synthetic_vectors(args.synthetic), "synthetic"
+
+    vectors = normalize(vectors)
+    rng = np.random.default_rng(1)
+    held_out = rng.choice(len(vectors), size=min(args.queries, len(vectors) // 10), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    corpus, queries = vectors[mask], vectors[held_out]
+    truth = top_k(corpus, queries, args.k)
+    print(f"Source: {source}; corpus {corpus.shape[0]} x {corpus.shape[1]}, {len(queries)} queries, k={args.k}\n")
+
+    full = corpus.shape[1]
+    dims_list = [0] + [int(d) for d in args.dims.split(",") if d and int(d) < full]
+    results = []
+    for dims in dims_list:
+        for compression in ("none", "float16", "int8"):
+            codec = VectorCodec(compression, dims)
+            name = "float32" if compression == "none" else compression
+            results.append(evaluate(name, codec, corpus, queries, truth, args.k))
+            if compression == "int8" and args.rescore:
+                results.append(evaluate("int8+rescore", codec, corpus, queries, truth, args.k, args.rescore))
+
+    header = ["mode", "dims", "bytes_per_vector", "corpus_mb", "recall_at_k", "query_p50_ms"]
+    print("  ".join(f"{h:>16}" for h in header))
+    for r in results:
+        print("  ".join(f"{str(r[h]):>16}" for h in header))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"source": source, "corpus": list(corpus.shape), "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Synthetic multilingual benchmark corpus: PDF, DOCX, XLSX, PPTX and Markdown
+files plus a golden query set.
+
+Usage:
+    python benchmarks/corpus.py OUT_DIR [--docs 50] [--seed 42]
+
+Text comes from fixtures.TextFactory (Zipf-distributed Chinese with English
+terms). Every document also carries an "anchor" sentence built from words
+drawn uniformly from the whole vocabulary plus a unique project code, so each
+golden query has exactly one right source file:
+- lexical queries contain the project code (exact keyword match)
+- topical queries use only the anchor's words (no code), which tests ranking
+  on shared vocabulary
+PDFs are written directly (CJK text in the Adobe STSong-Light font), so no PDF
+library is needed; the other formats use python-docx, openpyxl and python-pptx.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import TextFactory, ZH_WORDS
+
+FORMATS = ("pdf", "docx", "xlsx", "pptx", "md")
+PDF_LINE_CHARS = 40
+
+
+def _wrap(text, width):
+    return [text[i:i + width] for i in range(0, len(text), width)] or [""]
+
+
+def write_pdf(path, pages):
+    """pages: list of page texts. One text object per page, lines wrapped at PDF_LINE_CHARS."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    descriptor = add(b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 4 /FontBBox [0 -200 1000 900]"
+                     b" /ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 80 >>")
+    font = add(b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H"
+               b" /DescendantFonts [<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light"
+               b" /CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >>"
+               b" /FontDescriptor %d 0 R /DW 1000 >>] >>" % descriptor)
+    contents = []
+    for text in pages:
+        ops = ["BT", "/F1 11 Tf", "14 TL", "40 800 Td"]
+        for paragraph in text.split("\n"):
+            for line in _wrap(paragraph, PDF_LINE_CHARS):
+                ops.append("<" + line.encode("utf-16-be").hex().upper() + "> Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("ascii")
+        contents.append(add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+    pages_id = len(objects) + len(contents) + 1
+    kids = [add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 %d 0 R >> >>"
+                b" /Contents %d 0 R >>" % (pages_id, font, content)) for content in contents]
+    add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def write_docx(path, pages):
+    import docx
+    document = docx.Document()
+    for i, text in enumerate(pages):
+        document.add_heading(f"第{i + 1}节", level=2)
+        for paragraph in text.split("\n\n"):
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_xlsx(path, pages):
+    from openpyxl import Workbook
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "数据"
+    sheet.append(["编号", "章节", "内容"])
+    row = 1
+    for i, text in enumerate(pages):
+        for sentence in text.replace("\n", "").split("。"):
+            if sentence.strip():
+                sheet.append([row, i + 1, sentence.strip() + "。"])
+                row += 1
+    workbook.save(path)
+
+
+def write_pptx(path, pages):
+    from pptx import Presentation
+    presentation = Presentation()
+    for i, text in enumerate(pages):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"第{i + 1}页"
+        slide.placeholders[1].text = text
+    presentation.save(path)
+
+
+def write_md(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, text in enumerate(pages):
+            f.write(f"## 第{i + 1}节\n\n{text}\n\n")
+
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "xlsx": write_xlsx, "pptx": write_pptx, "md": write_md}
+
+
+def generate_corpus(out_dir, n_docs=50, seed=42, formats=FORMATS, pages_per_doc=3):
+    """
+    Writes n_docs files (formats round-robin) into out_dir/files and the golden
+    set to out_dir/golden.json; returns the golden dict:
+    {"files": [...], "queries": [{"query", "kind", "source_file"}]}.
+    """
+    files_dir = os.path.join(out_dir, "files")
+    os.makedirs(files_dir, exist_ok=True)
+    rng = random.Random(seed)
+    files, queries = [], []
+    for i in range(n_docs):
+        ext = formats[i % len(formats)]
+        factory = TextFactory(seed=seed * 1000 + i, topic=i % 8)
+        pages = [factory.document(paragraphs=2) for _ in range(pages_per_doc)]
+
+        code = f"KX{i:04d}"
+        anchor_words = rng.sample(ZH_WORDS, 4)
+        anchor = f"{code} 项目的{anchor_words[0]}{anchor_words[1]}方案采用{anchor_words[2]}与{anchor_words[3]}联动设计。"
+        page = rng.randrange(pages_per_doc)
+        pages[page] = pages[page] + "\n\n" + anchor
+
+        filename = f"doc_{i:04d}.{ext}"
+        WRITERS[ext](os.path.join(files_dir, filename), pages)
+        files.append({"file": filename, "format": ext, "anchor_page": page + 1})
+        queries.append({"query": f"{code} {anchor_words[0]}{anchor_words[1]}方案", "kind": "lexical",
+                        "source_file": filename})
+        queries.append({"query": f"{anchor_words[0]}{anchor_words[1]}{anchor_words[2]}{anchor_words[3]}联动",
+                        "kind": "topical", "source_file": filename})
+
+    golden = {"seed": seed, "files": files, "queries": queries}
+    with open(os.path.join(out_dir, "golden.json"), "w", encoding="utf-8") as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+    return golden
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    args = parser.parse_args()
+    golden = generate_corpus(args.out_dir, args.docs, args.seed, tuple(args.formats.split(",")))
+    print(f"Wrote {len(golden['files'])} files and {len(golden['queries'])} golden queries to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
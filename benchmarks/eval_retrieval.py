@@ -0,0 +1,227 @@
+"""
+Retrieval tuning sweep: quality vs latency over alpha, n_results and chunking.
+
+Usage:
+    python benchmarks/eval_retrieval.py [--docs 50] [--alphas 0,0.3,0.5,0.7,1] [--n-results 10,20,30,40]
+                                        [--chunk-sizes 400,800,1200] [--thresholds 0.85] [--top-n 5]
+                                        [--corpus-dir DIR] [--live] [--json out.json]
+
+For every chunking config (chunk_size x semantic_threshold) the corpus is
+ingested into its own KB; every (alpha, n_results) pair then runs the labeled
+queries through retrieval (VectorDB.query: embedding, hybrid search, parent
+fetch) and rerank (LLMService.rerank, uncached), as /api/query does. Answer
+generation does not depend on these settings and is left out.
+
+Per config it reports recall@1/5/10 and MRR of the labeled source file, both
+for the retrieved list and after rerank, the rerank payload (candidates and
+characters sent, i.e. rerank cost) and p50/p95 latency. The Pareto frontier
+marks configs that no other config beats on both quality (--quality, default
+rerank recall@5) and latency (--latency, default p95 ms). "current" marks the
+settings the app uses today (alpha 0.5, n_results 20, Chunker defaults).
+
+The labeled set is corpus.py's golden.json (--corpus-dir reuses one, also a
+hand-labeled {"queries": [{"query", "source_file"}]} file next to files/).
+By default embedding and rerank come from fake_models.py, whose hashed
+embeddings say little about semantic_threshold; pass --live to use the models
+configured in config.json instead (Weaviate stays in memory).
+"""
+import os
+import sys
+import json
+import time
+import itertools
+import argparse
+import tempfile
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from services import tracing
+from services.llm_service import LLMService
+from services.vector_db import VectorDB
+from services.ingestion_service import IngestionService
+from services.ingestion.chunker import Chunker
+from services.reranker import truncate_texts
+from corpus import generate_corpus
+from fake_models import FakeModelServer
+from fake_weaviate import FakeWeaviateClient
+from fake_slides import use_text_only_slides
+from bench_tokenizer import percentile
+from bench_rag import make_config, first_rank
+
+CURRENT = {"alpha": 0.5, "n_results": 20, "chunk_size": 800, "threshold": 0.85}
+QUALITY_METRICS = ("recall@1", "recall@5", "recall@10", "mrr", "rerank_recall@1", "rerank_recall@<top-n>", "rerank_mrr")
+LATENCY_METRICS = ("p50_ms", "p95_ms", "mean_ms")
+
+
+def floats(text):
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def ingest_variant(cfg, db, files_dir, files, chunker, kb_id):
+    db.switch_kb(kb_id)
+    service = use_text_only_slides(IngestionService(cfg, db, chunker=chunker))
+    chunks = 0
+    for entry in files:
+        try:
+            chunks += service.process_file(os.path.join(files_dir, entry["file"])).get("total_chunks", 0)
+        except Exception as e:
+            print(f"  {entry['file']}: {e}")
+    return chunks
+
+
+def evaluate(llm, db, queries, alpha, n_results, top_n, max_chars):
+    """Quality, rerank cost and latency of one (alpha, n_results) setting on the current KB."""
+    retrieval_ranks, rerank_ranks, latencies = [], [], []
+    stages = defaultdict(float)
+    candidates = chars = 0
+    for q in queries:
+        with tracing.trace("eval.query", force=True):
+            start = time.perf_counter()
+            results = db.query(q["query"], n_results=n_results, alpha=alpha)
+            order = []
+            if results:
+                documents = [r["text"] for r in results]
+                candidates += len(documents)
+                chars += sum(len(t) for t in truncate_texts(documents, max_chars))
+                # No ids: bypass the rerank cache, every setting pays its own rerank
+                order = llm.rerank(q["query"], documents, top_n=top_n)
+            latencies.append((time.perf_counter() - start) * 1000)
+            for stage, ms in tracing.timings().items():
+                if stage != "total_ms":
+                    stages[stage] += ms
+        files = [r["metadata"].get("source_file") for r in results]
+        retrieval_ranks.append(first_rank(files, q["source_file"]))
+        rerank_ranks.append(first_rank([files[i] for i in order], q["source_file"]))
+
+    n = len(queries)
+
+    def recall(ranks, k):
+        return round(sum(1 for r in ranks if r and r <= k) / n, 4)
+
+    def mrr(ranks):
+        return round(sum(1 / r for r in ranks if r) / n, 4)
+
+    return {
+        "recall@1": recall(retrieval_ranks, 1), "recall@5": recall(retrieval_ranks, 5),
+        "recall@10": recall(retrieval_ranks, 10), "mrr": mrr(retrieval_ranks),
+        "rerank_recall@1": recall(rerank_ranks, 1), f"rerank_recall@{top_n}": recall(rerank_ranks, top_n),
+        "rerank_mrr": mrr(rerank_ranks),
+        "rerank_candidates": round(candidates / n, 1),
+        "rerank_chars": round(chars / n),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "mean_ms": round(sum(latencies) / n, 2),
+        "stages_mean_ms": {stage: round(total / n, 2) for stage, total in sorted(stages.items())},
+    }
+
+
+def pareto_front(rows, quality, latency):
+    """Rows no other row beats on both quality (higher) and latency (lower)."""
+    front = []
+    for row in rows:
+        dominated = any(
+            other[quality] >= row[quality] and other[latency] <= row[latency]
+            and (other[quality] > row[quality] or other[latency] < row[latency])
+            for other in rows
+        )
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda r: r[latency])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus-dir", help="use (or keep) the corpus and labeled queries here")
+    parser.add_argument("--alphas", type=floats, default=floats("0,0.3,0.5,0.7,1"))
+    parser.add_argument("--n-results", type=ints, default=ints("10,20,30,40"))
+    parser.add_argument("--chunk-sizes", type=ints, default=ints("400,800,1200"))
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--thresholds", type=floats, default=floats("0.85"))
+    parser.add_argument("--top-n", type=int, default=5, help="reranked results kept, as in /api/query")
+    parser.add_argument("--quality", help=f"one of {', '.join(QUALITY_METRICS)} (default: rerank_recall@<top-n>)")
+    parser.add_argument("--latency", default="p95_ms", choices=LATENCY_METRICS)
+    parser.add_argument("--embed-ms", type=float, default=0.0)
+    parser.add_argument("--rerank-ms", type=float, default=0.0)
+    parser.add_argument("--live", action="store_true", help="use the models configured in config.json")
+    parser.add_argument("--json", help="write all results and the frontier to this file")
+    args = parser.parse_args()
+    args.quality = args.quality or f"rerank_recall@{args.top_n}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or os.path.join(tmp, "corpus")
+        golden_path = os.path.join(corpus_dir, "golden.json")
+        if os.path.exists(golden_path):
+            with open(golden_path, encoding="utf-8") as f:
+                golden = json.load(f)
+        else:
+            golden = generate_corpus(corpus_dir, args.docs, args.seed)
+        files_dir = os.path.join(corpus_dir, "files")
+        files = golden.get("files") or [{"file": name} for name in sorted(os.listdir(files_dir))]
+        queries = golden["queries"]
+
+        cfg = make_config(os.path.join(tmp, "data"), "dashscope")
+        tracing.configure(cfg)
+        server = None
+        if args.live:
+            Config.load_settings()
+            cfg.SETTINGS = {**Config.SETTINGS, "tracing": cfg.SETTINGS["tracing"]}
+            cfg.DASH_SCOPE_API_KEY = Config.DASH_SCOPE_API_KEY
+        else:
+            server = FakeModelServer(args.embed_ms, args.rerank_ms).start()
+            server.configure(cfg)
+        try:
+            llm = LLMService(cfg)
+            db = VectorDB(cfg, embedding_fn=llm.get_embedding, kb_id="eval", client=FakeWeaviateClient())
+            max_chars = {**Config.SETTINGS["rerank"], **(cfg.SETTINGS.get("rerank") or {})}["max_chars"]
+
+            rows = []
+            for chunk_size, threshold in itertools.product(args.chunk_sizes, args.thresholds):
+                chunker = Chunker(chunk_size, args.chunk_overlap, llm.get_embedding, threshold)
+                started = time.perf_counter()
+                chunks = ingest_variant(cfg, db, files_dir, files, chunker, f"eval_s{chunk_size}_t{threshold}")
+                print(f"chunk_size={chunk_size} threshold={threshold}: {chunks} chunks "
+                      f"({time.perf_counter() - started:.1f}s)")
+                for alpha, n_results in itertools.product(args.alphas, args.n_results):
+                    params = {"alpha": alpha, "n_results": n_results, "chunk_size": chunk_size, "threshold": threshold}
+                    row = {**params, "chunks": chunks,
+                           **evaluate(llm, db, queries, alpha, n_results, args.top_n, max_chars)}
+                    row["current"] = params == CURRENT
+                    rows.append(row)
+        finally:
+            if server is not None:
+                server.stop()
+
+    front = pareto_front(rows, args.quality, args.latency)
+    on_front = {id(r) for r in front}
+    columns = ["alpha", "n_results", "chunk_size", "threshold", "recall@5", "mrr",
+               f"rerank_recall@{args.top_n}", "rerank_mrr", "rerank_candidates", "rerank_chars", "p50_ms", "p95_ms"]
+    print(f"\n{len(queries)} queries; * = Pareto frontier ({args.quality} vs {args.latency}), "
+          f"c = current settings\n")
+    print("   " + " ".join(f"{c:>12}" for c in columns))
+    for row in sorted(rows, key=lambda r: (-r[args.quality], r[args.latency])):
+        mark = ("*" if id(row) in on_front else " ") + ("c" if row["current"] else " ")
+        print(f"{mark} " + " ".join(f"{row[c]:>12}" for c in columns))
+
+    print("\nFrontier (fastest first):")
+    for row in front:
+        print(f"  alpha={row['alpha']} n_results={row['n_results']} chunk_size={row['chunk_size']} "
+              f"threshold={row['threshold']}: {args.quality}={row[args.quality]}, {args.latency}={row[args.latency]}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": {k: v for k, v in vars(args).items() if k != "json"}, "queries": len(queries),
+                       "results": rows, "frontier": front}, f, ensure_ascii=False, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Deterministic local stand-ins for the model APIs, served over HTTP so the real
+client code paths (DashScope SDK, requests) are exercised:
+- DashScope text embedding:  POST /api/v1/services/embeddings/text-embedding/text-embedding
+- DashScope rerank:          POST /api/v1/services/rerank/text-rerank/text-rerank
+- OpenAI-compatible chat:    POST /v1/chat/completions (also stream=true SSE)
+
+Embeddings are signed hashed bag-of-features vectors (CJK unigrams + bigrams,
+lowercased Latin words), so similar texts get similar vectors without a model.
+Rerank scores are feature overlap. The chat model answers the intent and
+query-rewrite prompts like the real one would and otherwise returns a fixed
+length answer derived from the prompt. Latencies are configurable, so model
+time can be modeled or left out (default: 0).
+
+    with FakeModelServer(embed_ms=20) as server:
+        server.configure(config)   # points LLMService at the server
+
+or in its own process: python benchmarks/fake_models.py [--port 0] [--llm-ms 0] ...
+"""
+import re
+import json
+import argparse
+import time
+import zlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+DIM = 1536
+_LATIN = re.compile(r'[a-z0-9_]+')
+_CJK = re.compile(r'[一-鿿]')
+
+
+def features(text):
+    text = (text or "").lower()
+    chars = _CJK.findall(text)
+    return _LATIN.findall(text) + chars + [a + b for a, b in zip(chars, chars[1:])]
+
+
+def embed(text, dim=DIM):
+    vector = np.zeros(dim, dtype=np.float32)
+    # Punctuation-only text still gets a (non-zero) vector, as from a real model
+    for feature in features(text) or [text or " "]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    return (vector / norm if norm else vector).tolist()
+
+
+def configure(config, url):
+    """Points DashScope (embedding, rerank) and the OpenAI-compatible LLM at a fake model server."""
+    import dashscope
+    dashscope.base_http_api_url = f"{url}/api/v1"
+    config.DASH_SCOPE_API_KEY = "bench"
+    config.SETTINGS.update({
+        "llm_provider": "openai", "base_url": f"{url}/v1", "api_key": "bench", "model_name": "bench-llm",
+        "rerank": {**(config.SETTINGS.get("rerank") or {}), "provider": "dashscope"},
+    })
+
+
+def overlap(query, document):
+    q = set(features(query))
+    return len(q & set(features(document))) / len(q) if q else 0.0
+
+
+class FakeModelServer:
+    def __init__(self, embed_ms=0.0, rerank_ms=0.0, llm_ms=0.0, token_ms=0.0, answer_chars=200, dim=DIM, port=0):
+        self.latency = {"embed": embed_ms / 1000, "rerank": rerank_ms / 1000, "llm": llm_ms / 1000,
+                        "token": token_ms / 1000}
+        self.answer_chars = answer_chars
+        self.dim = dim
+        self.calls = {"embed": 0, "embed_texts": 0, "rerank": 0, "chat": 0, "chat_stream": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-models", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def configure(self, config):
+        configure(config, self.url)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.calls[name] += amount
+
+    # ---- responses ----
+
+    def answer(self, messages):
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        prompt = messages[-1]["content"] if messages else ""
+        if "intent classifier" in system:
+            return "FACTOID"
+        if "query corrector" in system:
+            match = re.search(r'用户原始输入：(.*)', prompt)
+            return match.group(1).strip() if match else prompt
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        words = [w for w in features(prompt) if len(w) > 1][:50] or ["答案"]
+        parts, i = ["根据资料[1]，"], seed
+        while sum(map(len, parts)) < self.answer_chars:
+            parts.append(words[(i >> 8) % len(words)])
+            i = (i * 1103515245 + 12345) & 0x7fffffff
+        return "".join(parts)[:self.answer_chars] + "。"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, delayed ACKs add ~40 ms per call
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/text-embedding/text-embedding"):
+                    self._embedding(request)
+                elif self.path.endswith("/text-rerank/text-rerank"):
+                    self._rerank(request)
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(request)
+                else:
+                    self._json(404, {"code": "NotFound", "message": self.path})
+
+            def _embedding(self, request):
+                texts = request["input"]["texts"]
+                texts = [texts] if isinstance(texts, str) else texts
+                server._count("embed")
+                server._count("embed_texts", len(texts))
+                time.sleep(server.latency["embed"])
+                self._json(200, {
+                    "request_id": "bench",
+                    "output": {"embeddings": [{"text_index": i, "embedding": embed(t, server.dim)}
+                                              for i, t in enumerate(texts)]},
+                    "usage": {"total_tokens": sum(len(t) for t in texts)},
+                })
+
+            def _rerank(self, request):
+                query, documents = request["input"]["query"], request["input"]["documents"]
+                top_n = request.get("parameters", {}).get("top_n") or len(documents)
+                server._count("rerank")
+                time.sleep(server.latency["rerank"])
+                scored = sorted(((overlap(query, d), i) for i, d in enumerate(documents)), key=lambda s: (-s[0], s[1]))
+                self._json(200, {
+                    "request_id": "bench",
+                    "output": {"results": [{"index": i, "relevance_score": s} for s, i in scored[:top_n]]},
+                    "usage": {"total_tokens": len(query) + sum(len(d) for d in documents)},
+                })
+
+            def _chat(self, request):
+                messages = request.get("messages", [])
+                answer = server.answer(messages)
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 2
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer),
+                         "total_tokens": prompt_tokens + len(answer)}
+                time.sleep(server.latency["llm"])
+                if not request.get("stream"):
+                    server._count("chat")
+                    self._json(200, {"choices": [{"message": {"role": "assistant", "content": answer}}], "usage": usage})
+                    return
+                server._count("chat_stream")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for start in range(0, len(answer), 4):
+                    if start:
+                        time.sleep(server.latency["token"])
+                    delta = {"choices": [{"delta": {"content": answer[start:start + 4]}}]}
+                    self.wfile.write(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    """Serves the fake models in their own process (load_test.py); prints the URL once listening."""
+    parser = argparse.ArgumentParser(description="Deterministic local model server for benchmarks")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--embed-ms", type=float, default=0.0)
+    parser.add_argument("--rerank-ms", type=float, default=0.0)
+    parser.add_argument("--llm-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeModelServer(args.embed_ms, args.rerank_ms, args.llm_ms, args.token_ms, port=args.port)
+    print(server.url, flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
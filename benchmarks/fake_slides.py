@@ -0,0 +1,30 @@
+"""
+Stand-in for slide rendering. PPTProcessor renders slide images with
+aspose-slides; where it is not installed the benchmarks ingest PPTX text only
+(python-pptx), so the corpus keeps its PPTX documents. Production ingestion is
+unchanged: without aspose-slides a PPT upload fails there.
+
+    use_text_only_slides(service)   # after IngestionService(...)
+"""
+import importlib.util
+from services.ingestion.ppt_processor import PPTProcessor
+
+
+class TextOnlyPPTProcessor(PPTProcessor):
+    """Slides' text per page, without slide images."""
+    def process(self, file_path):
+        from pptx import Presentation
+        prs = Presentation(file_path)
+        return [{
+            "page_number": i + 1,
+            "text_content": self._extract_text_from_slide(slide),
+            "image_url": None,
+            "slide_layout": slide.slide_layout.name if slide.slide_layout else "unknown"
+        } for i, slide in enumerate(prs.slides)]
+
+
+def use_text_only_slides(service):
+    """Swaps the IngestionService's PPT processor for the stand-in when aspose-slides is missing."""
+    if importlib.util.find_spec("aspose") is None:
+        service.ppt_processor = TextOnlyPPTProcessor(service.config)
+    return service
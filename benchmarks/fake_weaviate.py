@@ -0,0 +1,269 @@
+"""
+In-memory stand-in for the Weaviate v4 client, covering the calls VectorDB,
+KBRouter and the ingestion path make. Pass it to VectorDB(client=...) to run
+the real pipeline without a Weaviate server:
+
+    db = VectorDB(config, embedding_fn=llm.get_embedding, kb_id="bench", client=FakeWeaviateClient())
+
+Hybrid search follows Weaviate's relativeScoreFusion: BM25 over the
+whitespace-tokenized query properties and cosine similarity over the vectors
+are each min-max normalized, then mixed with alpha. Search is brute force, so
+latency grows linearly with the collection; compare numbers between runs of
+the harness, not with a real HNSW index.
+"""
+import math
+import uuid
+import threading
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+import numpy as np
+
+VECTOR_CANDIDATES = 100  # vector sub-search depth before fusion
+
+
+class FakeObject:
+    __slots__ = ("uuid", "properties", "vector", "metadata")
+
+    def __init__(self, object_id, properties, vector=None, score=None, distance=None):
+        self.uuid = object_id
+        self.properties = properties
+        self.vector = {"default": vector} if vector is not None else {}
+        self.metadata = SimpleNamespace(score=score, distance=distance)
+
+
+def _matches(flt, object_id, properties):
+    """Evaluates a weaviate.classes.query.Filter against one object."""
+    if flt is None:
+        return True
+    if hasattr(flt, "filters"):
+        results = (_matches(f, object_id, properties) for f in flt.filters)
+        return all(results) if type(flt).__name__ == "_FilterAnd" else any(results)
+    operator = flt.operator.value
+    value = str(object_id) if flt.target == "_id" else properties.get(flt.target)
+    expected = flt.value
+    if operator == "Equal":
+        return value == expected
+    if operator == "NotEqual":
+        return value != expected
+    if operator == "IsNull":
+        return (value is None) == expected
+    if operator in ("ContainsAny", "ContainsAll", "ContainsNone"):
+        have = set(value) if isinstance(value, (list, tuple)) else {value}
+        want = {str(v) for v in expected} if flt.target == "_id" else set(expected)
+        if operator == "ContainsAny":
+            return bool(have & want)
+        if operator == "ContainsAll":
+            return want <= have
+        return not (have & want)
+    if value is None:
+        return False
+    return {"LessThan": value < expected, "LessThanEqual": value <= expected,
+            "GreaterThan": value > expected, "GreaterThanEqual": value >= expected}.get(operator, False)
+
+
+def _minmax(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    span = high - low
+    return {k: (v - low) / span if span else 1.0 for k, v in scores.items()}
+
+
+class _Batch:
+    def __init__(self, collection):
+        self._collection = collection
+        self.failed_objects = []
+
+    def dynamic(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_object(self, properties, vector=None, uuid=None):
+        self._collection._put(uuid, properties, vector)
+
+
+class _Query:
+    def __init__(self, collection):
+        self._c = collection
+
+    def hybrid(self, query, vector=None, query_properties=None, limit=10, alpha=0.5, filters=None,
+               include_vector=False, return_metadata=None, **kwargs):
+        c = self._c
+        with c._lock:
+            ids = [i for i, o in c._objects.items() if _matches(filters, i, o["properties"])]
+            bm25 = c._bm25(query, ids, query_properties or ["text"]) if alpha < 1 else {}
+            similarity = {}
+            if vector is not None and alpha > 0:
+                q = np.asarray(vector, dtype=np.float32)
+                q /= (np.linalg.norm(q) or 1.0)
+                with_vectors = [i for i in ids if c._objects[i]["vector"] is not None]
+                if with_vectors:
+                    matrix = np.stack([c._objects[i]["vector"] for i in with_vectors])
+                    sims = matrix @ q
+                    top = np.argsort(-sims)[:max(limit, VECTOR_CANDIDATES)]
+                    similarity = {with_vectors[j]: float(sims[j]) for j in top}
+            keyword, semantic = _minmax({k: v for k, v in bm25.items() if v > 0}), _minmax(similarity)
+            fused = {i: alpha * semantic.get(i, 0.0) + (1 - alpha) * keyword.get(i, 0.0)
+                     for i in set(keyword) | set(semantic)}
+            ranked = sorted(fused.items(), key=lambda kv: -kv[1])[:limit]
+            return SimpleNamespace(objects=[
+                c._object(i, include_vector, score=score,
+                          distance=1 - similarity[i] if i in similarity else None)
+                for i, score in ranked
+            ])
+
+    def fetch_objects(self, filters=None, limit=None, return_properties=None, include_vector=False, **kwargs):
+        c = self._c
+        with c._lock:
+            ids = [i for i, o in c._objects.items() if _matches(filters, i, o["properties"])][:limit]
+            return SimpleNamespace(objects=[c._object(i, include_vector, return_properties) for i in ids])
+
+
+class _Data:
+    def __init__(self, collection):
+        self._c = collection
+
+    def delete_many(self, where):
+        c = self._c
+        with c._lock:
+            ids = [i for i, o in c._objects.items() if _matches(where, i, o["properties"])]
+            for i in ids:
+                del c._objects[i]
+            c._version += 1
+        return SimpleNamespace(successful=len(ids), failed=0, matches=len(ids))
+
+    def update(self, uuid, properties):
+        c = self._c
+        with c._lock:
+            c._objects[str(uuid)]["properties"].update(properties)
+            c._version += 1
+
+
+class _Aggregate:
+    def __init__(self, collection):
+        self._c = collection
+
+    def over_all(self, group_by=None, total_count=False, **kwargs):
+        c = self._c
+        with c._lock:
+            groups = None
+            if group_by:
+                counts = Counter(o["properties"].get(group_by) for o in c._objects.values())
+                groups = [SimpleNamespace(grouped_by=SimpleNamespace(prop=group_by, value=value), total_count=n)
+                          for value, n in counts.items()]
+            return SimpleNamespace(total_count=len(c._objects), groups=groups, properties={})
+
+
+class FakeCollection:
+    K1, B = 1.2, 0.75
+
+    def __init__(self, name, properties):
+        self.name = name
+        self._property_names = [p.name for p in properties or []]
+        self._objects = OrderedDict()
+        self._lock = threading.RLock()
+        self._version = 0
+        self._index = None
+        self.batch = _Batch(self)
+        self.query = _Query(self)
+        self.data = _Data(self)
+        self.aggregate = _Aggregate(self)
+        self.config = SimpleNamespace(
+            get=lambda: SimpleNamespace(properties=[SimpleNamespace(name=n) for n in self._property_names]),
+            add_property=lambda prop: self._property_names.append(prop.name),
+        )
+
+    def _put(self, object_id, properties, vector):
+        object_id = str(object_id or uuid.uuid4())
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._objects[object_id] = {"properties": dict(properties), "vector": vector}
+            self._version += 1
+
+    def _object(self, object_id, include_vector=False, return_properties=None, **metadata):
+        entry = self._objects[object_id]
+        properties = entry["properties"]
+        if return_properties:
+            properties = {k: properties.get(k) for k in return_properties}
+        vector = entry["vector"].tolist() if include_vector and entry["vector"] is not None else None
+        return FakeObject(object_id, dict(properties), vector, **metadata)
+
+    def _bm25(self, query, ids, query_properties):
+        """BM25 scores {object id: score} of the candidate ids (whitespace tokens, as the schema tokenizes)."""
+        key = (self._version, tuple(query_properties))
+        if self._index is None or self._index[0] != key:
+            terms = {i: Counter(t for p in query_properties for t in str(o["properties"].get(p) or "").lower().split())
+                     for i, o in self._objects.items()}
+            df = Counter(t for counts in terms.values() for t in counts)
+            lengths = {i: sum(c.values()) for i, c in terms.items()}
+            average = (sum(lengths.values()) / len(lengths)) if lengths else 0.0
+            self._index = (key, terms, df, lengths, average)
+        _, terms, df, lengths, average = self._index
+        n = len(terms)
+        scores = {}
+        for i in ids:
+            counts, score = terms[i], 0.0
+            for t in set(query.lower().split()):
+                tf = counts.get(t)
+                if tf:
+                    idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                    score += idf * tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * lengths[i] / (average or 1)))
+            scores[i] = score
+        return scores
+
+    def iterator(self, include_vector=False, return_properties=None):
+        with self._lock:
+            ids = list(self._objects)
+        for i in ids:
+            if i in self._objects:
+                yield self._object(i, include_vector, return_properties)
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class _Collections:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def exists(self, name):
+        return name in self._collections
+
+    def create(self, name, properties=None, **kwargs):
+        with self._lock:
+            self._collections.setdefault(name, FakeCollection(name, properties))
+        return self._collections[name]
+
+    def get(self, name):
+        with self._lock:
+            return self._collections.setdefault(name, FakeCollection(name, None))
+
+    def delete(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def list_all(self):
+        with self._lock:
+            return {name: SimpleNamespace(name=name) for name in self._collections}
+
+
+class FakeWeaviateClient:
+    def __init__(self):
+        self.collections = _Collections()
+
+    def is_live(self):
+        return True
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,69 @@
+"""
+Deterministic synthetic Chinese/English text for benchmarks.
+Words are drawn from a Zipf-like distribution so term statistics look like
+real enterprise documents (a few very common terms, a long tail of rare ones).
+"""
+import random
+
+ZH_WORDS = [
+    "数据", "系统", "管理", "平台", "分析", "用户", "服务", "模型", "检索", "知识库",
+    "文档", "能耗", "优化", "算法", "架构", "部署", "接口", "配置", "监控", "告警",
+    "网络", "安全", "存储", "计算", "调度", "任务", "流程", "审批", "报表", "指标",
+    "设备", "传感器", "采集", "传输", "协议", "边缘", "云端", "集群", "节点", "容器",
+    "版本", "发布", "测试", "质量", "缺陷", "需求", "设计", "开发", "运维", "日志",
+    "性能", "延迟", "吞吐", "并发", "缓存", "索引", "查询", "向量", "嵌入", "语义",
+    "关键词", "权限", "角色", "认证", "令牌", "加密", "备份", "恢复", "迁移", "升级",
+    "客户", "合同", "订单", "财务", "预算", "成本", "采购", "供应商", "库存", "物流",
+    "项目", "里程碑", "风险", "进度", "资源", "人员", "培训", "制度", "规范", "标准",
+    "电力", "光伏", "储能", "负荷", "预测", "调峰", "变压器", "线路", "巡检", "故障",
+    "问数", "大模型", "智能体", "提示词", "推理", "微调", "评测", "召回", "排序", "重排",
+]
+EN_WORDS = [
+    "API", "SDK", "Kubernetes", "Docker", "Redis", "Celery", "Weaviate", "Flask", "React",
+    "PDF", "Excel", "PPT", "JSON", "HTTP", "gRPC", "BM25", "HNSW", "RAG", "LLM", "GPU",
+    "latency", "throughput", "pipeline", "index", "query", "vector", "cluster", "token",
+]
+PUNCT = ["，", "。", "；", "！", "？"]
+
+
+def _weights(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+class TextFactory:
+    def __init__(self, seed=42, topic=None):
+        """topic: if set, reorders the vocabulary so each topic has its own frequent words."""
+        self.rng = random.Random(seed)
+        self.zh_words = list(ZH_WORDS)
+        if topic is not None:
+            random.Random(f"topic-{topic}").shuffle(self.zh_words)
+        self.zh_weights = _weights(len(self.zh_words))
+        self.en_weights = _weights(len(EN_WORDS))
+
+    def sentence(self, min_words=6, max_words=18, en_ratio=0.15):
+        words = []
+        for _ in range(self.rng.randint(min_words, max_words)):
+            if self.rng.random() < en_ratio:
+                words.append(" " + self.rng.choices(EN_WORDS, self.en_weights)[0] + " ")
+            else:
+                words.append(self.rng.choices(self.zh_words, self.zh_weights)[0])
+        return "".join(words).strip() + self.rng.choice(PUNCT)
+
+    def paragraph(self, sentences=5):
+        return "".join(self.sentence() for _ in range(sentences))
+
+    def document(self, paragraphs=4):
+        return "\n\n".join(self.paragraph(self.rng.randint(3, 7)) for _ in range(paragraphs))
+
+    def query(self, min_words=2, max_words=4):
+        return "".join(self.rng.choices(self.zh_words, self.zh_weights, k=self.rng.randint(min_words, max_words)))
+
+
+def make_documents(n, seed=42, topic=None):
+    factory = TextFactory(seed, topic)
+    return [factory.document() for _ in range(n)]
+
+
+def make_queries(n, seed=7, topic=None):
+    factory = TextFactory(seed, topic)
+    return [factory.query() for _ in range(n)]
@@ -0,0 +1,87 @@
+"""
+Starts the Flask API for load tests with no external services: Celery runs
+tasks in-process (CELERY_TASK_ALWAYS_EAGER), Weaviate is the in-memory
+stand-in, and the models are a fake_models.py server. All state (uploads,
+users, KB list, settings) lives in --data-dir.
+
+Usage:
+    python benchmarks/load_server.py --models-url http://127.0.0.1:PORT --data-dir DIR
+                                     [--port 5174] [--corpus-dir DIR] [--no-answer-cache]
+
+With --corpus-dir (corpus.py output) the files are ingested into the default
+KB before the server starts listening. Uploads are ingested inside the upload
+request, so /api/upload latency includes ingestion.
+load_test.py starts this script; it can also be run by hand.
+"""
+import os
+import sys
+import shutil
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare(data_dir, models_url, answer_cache):
+    """Points Config and the KB list at data_dir and the models at models_url, before the app is imported."""
+    os.environ["CELERY_TASK_ALWAYS_EAGER"] = "1"
+    from config import Config
+    from services import kb_service
+    from services.vector_db import VectorDB
+    from fake_models import configure
+    from fake_weaviate import FakeWeaviateClient
+
+    Config.BASE_DIR = data_dir
+    Config.DATA_FOLDER = os.path.join(data_dir, "data")
+    Config.PROCESSED_FOLDER = os.path.join(Config.DATA_FOLDER, "processed")
+    Config.SLIDES_FOLDER = os.path.join(Config.PROCESSED_FOLDER, "slides")
+    Config.UPLOAD_FOLDER = os.path.join(data_dir, "file")
+    Config.USERS_FILE = os.path.join(data_dir, "users.json")
+    Config.CONFIG_FILE = os.path.join(data_dir, "config.json")
+    Config.CELERY_TASK_ALWAYS_EAGER = True
+    Config.SETTINGS["tracing"] = {**Config.SETTINGS["tracing"], "exporter": "none"}
+    Config.SETTINGS["answer_cache"] = {**Config.SETTINGS["answer_cache"], "enabled": answer_cache}
+    kb_service.KB_FILE = os.path.join(data_dir, "knowledge_bases.json")
+    configure(Config, models_url)
+
+    # Every VectorDB of the process (API, eager tasks) shares one in-memory store
+    client = FakeWeaviateClient()
+    VectorDB._connect = lambda self: client
+
+
+def seed(app_module, corpus_dir):
+    """Copies the corpus files into the default KB's upload folder and ingests them."""
+    from config import Config
+    files_dir = os.path.join(corpus_dir, "files")
+    target = os.path.join(Config.UPLOAD_FOLDER, "default")
+    os.makedirs(target, exist_ok=True)
+    service = app_module.get_ingestion_service()
+    for name in sorted(os.listdir(files_dir)):
+        path = shutil.copy(os.path.join(files_dir, name), target)
+        try:
+            service.process_file(path)
+        except Exception as e:
+            print(f"Seeding: failed to ingest {name}: {e}")
+    app_module.get_kb_service().update_file_count("default")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models-url", required=True)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--port", type=int, default=5174)
+    parser.add_argument("--corpus-dir")
+    parser.add_argument("--no-answer-cache", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    prepare(os.path.abspath(args.data_dir), args.models_url, not args.no_answer_cache)
+    import app as app_module
+    if args.corpus_dir:
+        seed(app_module, args.corpus_dir)
+    print(f"Load test server listening on http://127.0.0.1:{args.port}", flush=True)
+    app_module.app.run(host="127.0.0.1", port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
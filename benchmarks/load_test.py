@@ -0,0 +1,406 @@
+"""
+Concurrent load test for the HTTP API with a configurable user mix.
+
+Usage:
+    python benchmarks/load_test.py [--users 100] [--duration 60] [--ramp-up 10] [--think-ms 1000]
+                                   [--mix chat=70,browse=25,upload=5] [--docs 20]
+                                   [--llm-ms 300] [--token-ms 20] [--embed-ms 20] [--rerank-ms 30]
+                                   [--url http://host:5174 --user admin --password ...] [--pids 123,456]
+                                   [--json out.json]
+
+Without --url, a local stack is started: fake_models.py and load_server.py
+(the Flask API with in-process Celery tasks and the in-memory Weaviate
+stand-in), seeded with a corpus.py corpus of --docs files. Model latencies
+default to values typical of hosted models, so concurrency behaves like a
+deployment; set them to 0 to measure the API alone.
+
+Each virtual user logs in, then loops: pick a scenario by --mix weight, run
+it, wait an exponentially distributed think time.
+- chat:   POST /api/query/stream with a golden query; time to first token is
+          the first answer delta
+- browse: GET /api/knowledge-bases, /api/knowledge-bases/default/documents
+          and /api/documents
+- upload: POST /api/upload of a corpus file under a unique name (locally,
+          ingestion runs inside the request)
+Reported per endpoint: throughput, p50/p95/p99/max latency, error rate and
+errors by cause; for chat also time to first token. Resource usage (CPU %,
+RSS, threads) is sampled per process: the local API and model servers, or the
+--pids of a deployment on this host (e.g. the API and Celery worker PIDs).
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict, Counter
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from corpus import generate_corpus
+from bench_tokenizer import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "chat=70,browse=25,upload=5"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# ---- recording ----
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)   # endpoint -> [latency ms] of successful requests
+        self.errors = defaultdict(Counter)  # endpoint -> Counter(cause)
+        self.requests = Counter()
+        self.ttft = []
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency_ms, error=None, ttft_ms=None):
+        with self._lock:
+            self.requests[endpoint] += 1
+            if error:
+                self.errors[endpoint][error] += 1
+            else:
+                self.samples[endpoint].append(latency_ms)
+                if ttft_ms is not None:
+                    self.ttft.append(ttft_ms)
+
+    def report(self, seconds):
+        endpoints = {}
+        for endpoint in sorted(self.requests):
+            latencies = self.samples[endpoint]
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": self.requests[endpoint],
+                "rps": round(self.requests[endpoint] / seconds, 2),
+                "error_rate": round(errors / self.requests[endpoint], 4),
+                "errors": dict(self.errors[endpoint]),
+                **latency_summary(latencies),
+            }
+        total = sum(self.requests.values())
+        return {
+            "seconds": round(seconds, 1),
+            "requests": total,
+            "rps": round(total / seconds, 2),
+            "error_rate": round(sum(sum(e.values()) for e in self.errors.values()) / total, 4) if total else 0.0,
+            "endpoints": endpoints,
+            "ttft_ms": latency_summary(self.ttft),
+        }
+
+
+def latency_summary(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    return {"p50": round(percentile(values, 0.50), 1), "p95": round(percentile(values, 0.95), 1),
+            "p99": round(percentile(values, 0.99), 1), "max": round(max(values), 1)}
+
+
+def timed_request(recorder, endpoint, session, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, timeout=120, **kwargs)
+        error = None if response.ok else f"http_{response.status_code}"
+    except requests.RequestException as e:
+        error = type(e).__name__
+    recorder.record(endpoint, (time.perf_counter() - start) * 1000, error)
+
+
+# ---- scenarios ----
+
+def chat(user):
+    start = time.perf_counter()
+    ttft, done, error = None, False, None
+    try:
+        with user.session.post(f"{user.url}/api/query/stream", json={"query": user.rng.choice(user.queries),
+                                                                      "kb_id": "default"},
+                               stream=True, timeout=120) as response:
+            if not response.ok:
+                error = f"http_{response.status_code}"
+            else:
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "):
+                        continue
+                    payload = line[6:]
+                    if payload == b"[DONE]":
+                        done = True
+                        break
+                    event = json.loads(payload)
+                    if event.get("type") == "delta":
+                        if ttft is None:
+                            ttft = (time.perf_counter() - start) * 1000
+                        if event.get("answer", "").startswith(("\n[API Error", "\n[Stream Error")):
+                            error = "llm_error"
+                    elif "answer" in event and "type" not in event:
+                        error = "stream_error"
+                if not done and error is None:
+                    error = "incomplete_stream"
+    except requests.RequestException as e:
+        error = type(e).__name__
+    user.recorder.record("POST /api/query/stream", (time.perf_counter() - start) * 1000, error, ttft)
+
+
+def browse(user):
+    for path in ("/api/knowledge-bases", "/api/knowledge-bases/default/documents", "/api/documents"):
+        timed_request(user.recorder, f"GET {path}", user.session, "GET", f"{user.url}{path}")
+
+
+def upload(user):
+    path = user.rng.choice(user.upload_files)
+    user.uploads += 1
+    name = f"load_u{user.index:03d}_{user.uploads:04d}_{os.path.basename(path)}"
+    with open(path, "rb") as f:
+        timed_request(user.recorder, "POST /api/upload", user.session, "POST", f"{user.url}/api/upload",
+                      files={"file": (name, f)}, data={"kb_id": "default"})
+
+
+SCENARIOS = {"chat": chat, "browse": browse, "upload": upload}
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, args, token, queries, upload_files, recorder, deadline):
+        super().__init__(name=f"user-{index}", daemon=True)
+        self.index = index
+        self.url = args.url
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self.queries = queries
+        self.upload_files = upload_files
+        self.recorder = recorder
+        self.deadline = deadline
+        self.think = args.think_ms / 1000
+        self.mix = list(args.mix.items())
+        self.uploads = 0
+
+    def run(self):
+        names, weights = zip(*self.mix)
+        while time.time() < self.deadline:
+            SCENARIOS[self.rng.choices(names, weights)[0]](self)
+            if self.think:
+                time.sleep(min(self.rng.expovariate(1 / self.think), max(0.0, self.deadline - time.time())))
+
+
+# ---- resource sampling ----
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU %, RSS and thread count of the given processes (psutil, or /proc on Linux)."""
+    def __init__(self, pids, interval=1.0):
+        super().__init__(name="resource-sampler", daemon=True)
+        self.pids = pids  # name -> pid
+        self.interval = interval
+        self.samples = defaultdict(list)  # name -> [(cpu %, rss MB, threads)]
+        self._done = threading.Event()
+        try:
+            import psutil
+            self._processes = {name: psutil.Process(pid) for name, pid in pids.items()}
+        except ImportError:
+            self._processes = None
+        self.available = self._processes is not None or os.path.isdir("/proc")
+
+    @staticmethod
+    def _read_proc(pid):
+        """(cpu seconds, rss MB, threads) from /proc."""
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        threads = int(fields[17])
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        return cpu, rss, threads
+
+    def _read(self, name):
+        if self._processes is not None:
+            p = self._processes[name]
+            with p.oneshot():
+                times = p.cpu_times()
+                return times.user + times.system, p.memory_info().rss / (1024 * 1024), p.num_threads()
+        return self._read_proc(self.pids[name])
+
+    def run(self):
+        if not self.available:
+            return
+        previous = {}
+        while True:
+            now = time.perf_counter()
+            for name in self.pids:
+                try:
+                    cpu, rss, threads = self._read(name)
+                except Exception:
+                    continue
+                if name in previous:
+                    last_cpu, last_time = previous[name]
+                    self.samples[name].append((100 * (cpu - last_cpu) / (now - last_time), rss, threads))
+                previous[name] = (cpu, now)
+            if self._done.wait(self.interval):
+                return
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def report(self):
+        report = {}
+        for name, samples in self.samples.items():
+            cpu = [s[0] for s in samples]
+            report[name] = {"pid": self.pids[name], "cpu_percent_mean": round(sum(cpu) / len(cpu), 1),
+                            "cpu_percent_max": round(max(cpu), 1),
+                            "rss_mb_max": round(max(s[1] for s in samples), 1),
+                            "threads_max": max(s[2] for s in samples)}
+        return report
+
+
+# ---- local stack ----
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_stack(args, tmp, corpus_dir):
+    """Starts fake_models.py and load_server.py; returns ([processes], api url, models url)."""
+    models = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_models.py"), "--embed-ms", str(args.embed_ms),
+         "--rerank-ms", str(args.rerank_ms), "--llm-ms", str(args.llm_ms), "--token-ms", str(args.token_ms)],
+        stdout=subprocess.PIPE, text=True)
+    models_url = models.stdout.readline().strip()
+    port = free_port()
+    log_path = os.path.join(tmp, "server.log")
+    command = [sys.executable, os.path.join(HERE, "load_server.py"), "--models-url", models_url,
+               "--data-dir", os.path.join(tmp, "server"), "--port", str(port), "--corpus-dir", corpus_dir]
+    if args.no_answer_cache:
+        command.append("--no-answer-cache")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).ok:
+                return [models, server], url, models_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    for p in (models, server):
+        p.terminate()
+    raise SystemExit(f"Load test server did not start; see {log_path}")
+
+
+def login(url, user, password):
+    response = requests.post(f"{url}/api/auth/login", json={"username": user, "password": password}, timeout=30)
+    if not response.ok:
+        raise SystemExit(f"Login as {user} failed: HTTP {response.status_code} {response.text[:200]}")
+    return response.json()["token"]
+
+
+def print_report(result):
+    load = result["load"]
+    print(f"\n{result['params']['users']} users, {load['seconds']}s: {load['requests']} requests "
+          f"({load['rps']} req/s), error rate {load['error_rate']:.2%}")
+    print(f"{'endpoint':<44} {'reqs':>7} {'req/s':>7} {'err %':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for endpoint, s in load["endpoints"].items():
+        cells = " ".join(f"{s[k]:>8.1f}" if s[k] is not None else f"{'-':>8}" for k in ("p50", "p95", "p99", "max"))
+        print(f"{endpoint:<44} {s['requests']:>7} {s['rps']:>7.2f} {100 * s['error_rate']:>7.2f} {cells}")
+        for cause, n in s["errors"].items():
+            print(f"    {cause}: {n}")
+    ttft = load["ttft_ms"]
+    if ttft["p50"] is not None:
+        print(f"chat time to first token (ms): p50 {ttft['p50']}  p95 {ttft['p95']}  p99 {ttft['p99']}  max {ttft['max']}")
+    if result["resources"]:
+        print(f"\n{'process':<16} {'pid':>8} {'cpu % mean':>11} {'cpu % max':>10} {'rss MB max':>11} {'threads':>8}")
+        for name, r in result["resources"].items():
+            print(f"{name:<16} {r['pid']:>8} {r['cpu_percent_mean']:>11.1f} {r['cpu_percent_max']:>10.1f} "
+                  f"{r['rss_mb_max']:>11.1f} {r['threads_max']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after ramp-up starts")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds over which users are started")
+    parser.add_argument("--think-ms", type=float, default=1000, help="mean think time between actions")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--docs", type=int, default=20, help="corpus size (seeded locally; queries and uploads)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-ms", type=float, default=20)
+    parser.add_argument("--rerank-ms", type=float, default=30)
+    parser.add_argument("--llm-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--no-answer-cache", action="store_true", help="local server: disable the answer cache")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--url", help="load an already running API instead of starting a local one")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--pids", help="with --url: comma-separated PIDs on this host to sample resources of")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = os.path.join(tmp, "corpus")
+        golden = generate_corpus(corpus_dir, args.docs, args.seed)
+        queries = [q["query"] for q in golden["queries"]]
+        upload_files = [os.path.join(corpus_dir, "files", f["file"]) for f in golden["files"]]
+
+        processes = []
+        if args.url:
+            pids = {f"pid-{pid}": int(pid) for pid in (args.pids or "").split(",") if pid.strip()}
+        else:
+            print(f"Starting local API with {args.docs} seeded documents...")
+            processes, args.url, _ = start_local_stack(args, tmp, corpus_dir)
+            pids = {"api": processes[1].pid, "models": processes[0].pid}
+        try:
+            token = login(args.url, args.user, args.password)
+            recorder = Recorder()
+            sampler = ResourceSampler(pids)
+            sampler.start()
+            start = time.time()
+            deadline = start + args.duration
+            users = []
+            print(f"Running {args.users} users for {args.duration:.0f}s (mix: "
+                  f"{', '.join(f'{k}={v:g}' for k, v in args.mix.items())})...")
+            for i in range(args.users):
+                user = VirtualUser(i, args, token, queries, upload_files, recorder, deadline)
+                user.start()
+                users.append(user)
+                if args.ramp_up and args.users > 1:
+                    time.sleep(args.ramp_up / args.users)
+            for user in users:
+                user.join()
+            elapsed = time.time() - start
+            sampler.stop()
+        finally:
+            for p in processes:
+                p.terminate()
+                p.wait()
+
+    result = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("json", "password")},
+        "load": recorder.report(elapsed),
+        "resources": sampler.report(),
+    }
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -53,8 +53,15 @@ def batch_reindex():
     except Exception as e:
         print(f"  Warning clearing collection: {e}")
 
+    # Describe images up front with a bounded pool; the per-file pass below hits the cache
+    image_paths = [os.path.join(root, f) for root, _, files in os.walk(file_dir)
+                   for f in files if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    if image_paths:
+        print(f"\n[STEP 2] Describing {len(image_paths)} images concurrently...")
+        ingestion_service.image_processor.describe_images(image_paths)
+
     # Walk and Process
-    print("\n[STEP 2] Walking through 'file/' directory...")
+    print("\n[STEP 3] Walking through 'file/' directory...")
     success_count = 0
     fail_count = 0
     
@@ -0,0 +1,58 @@
+"""
+Moves parent chunks of existing collections out of Weaviate into the parent side store.
+Only parents that have children are moved; childless parents stay searchable.
+
+Usage: python migrate_parents.py [--dry-run] [kb_id ...]
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.vector_db import VectorDB
+
+def migrate_kb(db, kb_id, dry_run=False):
+    coll = db.client.collections.get(f"KB_{kb_id}")
+    parents, child_parent_ids = {}, set()
+    for obj in coll.iterator(return_properties=["text", "source_file", "chunk_id", "is_parent", "parent_id", "doc_id"]):
+        props = obj.properties
+        if props.get("is_parent"):
+            parents[props.get("doc_id") or str(obj.uuid)] = (obj.uuid, props)
+        elif props.get("parent_id"):
+            child_parent_ids.add(props["parent_id"])
+
+    movable = {pid: v for pid, v in parents.items() if pid in child_parent_ids}
+    by_file = {}
+    for pid, (_, props) in movable.items():
+        by_file.setdefault(props.get("source_file", ""), []).append(
+            # The page number is stored in the chunk_id property (see VectorDB.add_documents)
+            (pid, props.get("text", ""), props.get("chunk_id") or 0)
+        )
+    print(f"- {kb_id}: {len(parents)} parents, {len(movable)} with children in {len(by_file)} files")
+    if dry_run or not movable:
+        return len(movable)
+
+    db.switch_kb(kb_id)
+    for filename, records in by_file.items():
+        records.sort(key=lambda r: r[2])
+        # replace=False keeps parents stored by an earlier, interrupted run
+        db.parent_store.put_file(kb_id, filename, records, replace=False)
+        uuids = [str(movable[pid][0]) for pid, _, _ in records]
+        for start in range(0, len(uuids), 1000):
+            db.delete_objects(uuids[start:start + 1000])
+    return len(movable)
+
+def main(argv):
+    dry_run = "--dry-run" in argv
+    kb_ids = [a for a in argv if not a.startswith("--")]
+    db = VectorDB(Config(), kb_id="default")
+    try:
+        kb_ids = kb_ids or [name.replace("KB_", "", 1) for name in db.list_all_kbs()]
+        moved = sum(migrate_kb(db, kb_id, dry_run) for kb_id in kb_ids)
+        action = "would move" if dry_run else "moved"
+        print(f"Done: {action} {moved} parent objects to {db.parent_store.db_path}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,26 @@
+"""
+Builds the KB routing index (services/kb_router.py) from what is already in Weaviate.
+New ingests keep it up to date; run this once for KBs indexed before routing existed.
+
+Usage: python rebuild_routing_index.py [kb_id ...]
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.vector_db import VectorDB
+
+def rebuild(kb_ids):
+    db = VectorDB(Config(), kb_id="default")
+    try:
+        kb_ids = kb_ids or [name.replace("KB_", "", 1) for name in db.list_all_kbs()]
+        for kb_id in kb_ids:
+            coll = db.client.collections.get(f"KB_{kb_id}")
+            n_files = db.kb_router.rebuild_kb(kb_id, coll)
+            print(f"- {kb_id}: {n_files} files summarized")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild(sys.argv[1:])
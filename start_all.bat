@@ -1,5 +1,6 @@
 @echo off
 
 start cmd /k "cd backend && venv\Scripts\activate && python app.py"
-start cmd /k "cd backend && venv\Scripts\activate && celery -A worker.celery_app worker --loglevel=info -P solo"
+start cmd /k "cd backend && venv\Scripts\activate && celery -A worker.celery_app worker -Q ingest_interactive,ingest_default,ingest_bulk -n bulk@%%h --loglevel=info -P solo"
+start cmd /k "cd backend && venv\Scripts\activate && celery -A worker.celery_app worker -Q ingest_interactive -n interactive@%%h --loglevel=info -P solo"
 start cmd /k "cd frontend && npm run dev"
@@ -0,0 +1,71 @@
+import os
+import sys
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.answer_cache import AnswerCache, KBGenerations
+
+VECTOR = [0.6, 0.8]
+
+
+class FlakyRedis:
+    """The two hash commands KBGenerations uses; raises while `down`."""
+    def __init__(self):
+        self.hash = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("Connection refused")
+
+    def hmget(self, key, fields):
+        self._check()
+        return [self.hash.get(f) for f in fields]
+
+    def hincrby(self, key, field, amount):
+        self._check()
+        self.hash[field] = self.hash.get(field, 0) + amount
+
+
+def generations(redis):
+    gens = KBGenerations(Config, redis_client=redis)
+    gens.RETRY_SECONDS = 0  # retry Redis on every call
+    return gens
+
+
+def test_cache_is_bypassed_while_redis_is_down():
+    redis = FlakyRedis()
+    api = AnswerCache(Config, generations(redis))
+    key = api.make_key(["kb"], ["doc-1"])
+    api.put(key, VECTOR, {"answer": "old"})
+    assert api.get(api.make_key(["kb"], ["doc-1"]), VECTOR)["answer"] == "old"
+
+    redis.down = True
+    assert api.make_key(["kb"], ["doc-1"]) is None
+    assert api.get(None, VECTOR) is None
+    api.put(None, VECTOR, {"answer": "unversioned"})
+    assert api.get_stats()["entries"] == 1
+
+
+def test_bumps_made_while_redis_is_down_are_replayed():
+    redis = FlakyRedis()
+    api = AnswerCache(Config, generations(redis))
+    key = api.make_key(["kb"], ["doc-1"])
+    api.put(key, VECTOR, {"answer": "old"})
+
+    # The KB changes while Redis is unreachable (e.g. a delete on another API process)
+    redis.down = True
+    generations(redis).bump("kb")
+    redis.down = False
+    # Once Redis is back, the earlier entry no longer matches
+    assert api.get(api.make_key(["kb"], ["doc-1"]), VECTOR) is None
+    assert redis.hash == {"kb": 1}
+    KBGenerations._unsent.clear()
+
+
+if __name__ == "__main__":
+    test_cache_is_bypassed_while_redis_is_down()
+    test_bumps_made_while_redis_is_down_are_replayed()
+    print("OK")
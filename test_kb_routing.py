@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.kb_router import KBRouter
+from services.tokenizer import get_tokenizer
+
+KB_TEXTS = {
+    "finance": ["季度营收同比增长百分之十二，毛利率保持稳定。", "财务报表显示现金流充足，应收账款周转加快。"],
+    "hr": ["新员工入职培训包括安全规范和考勤制度。", "年度绩效考核结果影响薪酬调整和晋升。"],
+    "devops": ["知识库检索服务部署在容器集群上，日志统一采集。", "数据库备份每天凌晨执行，故障时自动切换。"],
+}
+
+
+class StoredCollection:
+    """A Weaviate collection as rebuild_kb reads it: text stored BM25-tokenized."""
+    def __init__(self, texts, tokenizer):
+        self.objects = [SimpleNamespace(properties={"text": get_tokenizer(tokenizer).tokenize(t), "source_file": "doc.txt"},
+                                        vector=None) for t in texts]
+
+    def iterator(self, include_vector=False, return_properties=None):
+        return iter(self.objects)
+
+
+def test_query_routes_to_rebuilt_kb():
+    with tempfile.TemporaryDirectory() as tmp:
+        class TestConfig(Config):
+            DATA_FOLDER = tmp
+            SETTINGS = dict(Config.SETTINGS)
+        router = KBRouter(TestConfig)
+        for tokenizer in ("unigram", "bigram"):
+            for kb_id, texts in KB_TEXTS.items():
+                router.rebuild_kb(kb_id, StoredCollection(texts, tokenizer), tokenizer=tokenizer)
+            for query, expected in (("知识库检索服务怎么部署", "devops"), ("季度营收和毛利率", "finance"),
+                                    ("绩效考核与薪酬", "hr")):
+                scores = router.score(query)
+                best = max(scores, key=scores.get)
+                print(f"{tokenizer}: '{query}' -> {best} {scores}")
+                assert best == expected and scores[best] > 0, (tokenizer, query, scores)
+
+            # Same term sketch as summarizing the raw chunk text at ingest
+            rebuilt = router.score("知识库检索")
+            router.add_file("devops", "doc.txt", KB_TEXTS["devops"])
+            assert router.score("知识库检索") == rebuilt
+
+
+if __name__ == "__main__":
+    test_query_routes_to_rebuilt_kb()
+    print("OK")
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import threading
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.single_flight import SingleFlight
+
+
+class TestConfig(Config):
+    SETTINGS = {**Config.SETTINGS, "single_flight": {"enabled": True, "redis": False, "follower_timeout": 0.2}}
+
+
+def on_error(e):
+    return {"error": type(e).__name__}
+
+
+def test_leader_waits_past_follower_timeout():
+    flights = SingleFlight(TestConfig)
+
+    def slow():
+        time.sleep(0.5)
+        return {"answer": 42}
+    assert flights.call("k", slow, on_error) == {"answer": 42}
+
+
+def test_stalled_leader_times_out_followers_through_on_error():
+    flights = SingleFlight(TestConfig)
+    release = threading.Event()
+
+    def stalled():
+        release.wait(5)
+        return {"answer": 42}
+    leader = {}
+    thread = threading.Thread(target=lambda: leader.update(result=flights.call("k", stalled, on_error)))
+    thread.start()
+    while not flights.get_stats()["active"]:
+        time.sleep(0.01)
+
+    # Both entry points turn the follower's timeout into the on_error event
+    assert flights.call("k", stalled, on_error) == {"error": "TimeoutError"}
+    assert list(flights.subscribe("k", lambda: iter([stalled()]), on_error)) == [{"error": "TimeoutError"}]
+
+    release.set()
+    thread.join(5)
+    assert leader["result"] == {"answer": 42}
+    assert flights.get_stats()["followers"] == 2
+
+
+if __name__ == "__main__":
+    test_leader_waits_past_follower_timeout()
+    test_stalled_leader_times_out_followers_through_on_error()
+    print("OK")
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+
+# Add backend (and the in-memory Weaviate stand-in) to path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'benchmarks'))
+
+from types import SimpleNamespace
+from config import Config
+from services import kb_service as kb_module
+from services.kb_service import KnowledgeBaseService
+from services.vector_db import VectorDB
+from services.ingestion_service import IngestionService
+from services.reindex import reindex_into_staging
+from fake_weaviate import FakeWeaviateClient
+
+DIM = 128
+TEXT = "Staging collections keep search on the old settings. " * 40
+
+
+def embed(texts):
+    vectors = []
+    for text in texts:
+        digest = hashlib.sha512(text.encode("utf-8")).digest() * 2
+        vectors.append([b / 255.0 - 0.5 for b in digest[:DIM]])
+    return vectors
+
+
+def setup(tmp):
+    class TestConfig(Config):
+        DATA_FOLDER = os.path.join(tmp, "data")
+        UPLOAD_FOLDER = os.path.join(tmp, "file")
+        PROCESSED_FOLDER = os.path.join(tmp, "data", "processed")
+        SLIDES_FOLDER = os.path.join(tmp, "data", "processed", "slides")
+        SETTINGS = {**Config.SETTINGS, "tracing": {**Config.SETTINGS["tracing"], "exporter": "none"}}
+    for folder in (TestConfig.UPLOAD_FOLDER, TestConfig.SLIDES_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+    kb_module.KB_FILE = os.path.join(tmp, "knowledge_bases.json")
+    with open(kb_module.KB_FILE, 'w', encoding='utf-8') as f:
+        json.dump([{"id": "k1", "name": "k1"}], f)
+    client = FakeWeaviateClient()
+    db = VectorDB(TestConfig, embedding_fn=embed, kb_id="k1", client=client)
+    kbs = KnowledgeBaseService(TestConfig, db)
+    return TestConfig, client, db, kbs
+
+
+def add_file(cfg, name, text=TEXT):
+    path = os.path.join(cfg.UPLOAD_FOLDER, "k1", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def live_state(client, db):
+    with db.parent_store._connect() as conn:
+        parents = conn.execute("SELECT COUNT(*) FROM parents WHERE kb_id = 'k1'").fetchone()[0]
+    with db.kb_router._connect() as conn:
+        routed = sorted(r[0] for r in conn.execute("SELECT filename FROM files WHERE kb_id = 'k1'"))
+    collection = client.collections.get("KB_k1")
+    files = sorted({o.properties["source_file"] for o in collection.iterator()})
+    return {"objects": len(collection), "files": files, "parents": parents, "routed": routed}
+
+
+def test_new_collection_settings_stay_pending():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg, client, db, kbs = setup(tmp)
+        kb, changed = kbs.update_settings("k1", {"vector_dims": 64})
+        assert changed == ["vector_dims"]
+        assert kb["pending_settings"] == {"vector_dims": 64} and "vector_dims" not in kb
+        # Search and ingestion keep the live collection's full-size vectors
+        assert kb_module.load_kb_settings("k1")["vector_dims"] == 0
+        assert len(db.codec().prepare(embed(["q"]))[0]) == DIM
+        # Requesting the live value again cancels the pending change
+        kb, _ = kbs.update_settings("k1", {"vector_dims": 0})
+        assert "pending_settings" not in kb
+        # Uploads are refused while a re-index runs; a crashed one stops blocking after the TTL
+        kbs.begin_reindex("k1")
+        assert kbs.is_reindexing("k1")
+        cfg.REINDEX_LOCK_TTL = 0
+        assert not kbs.is_reindexing("k1")
+        kbs.end_reindex("k1")
+        assert "reindexing_since" not in kbs.get("k1")
+
+
+def test_failed_reindex_leaves_live_kb_untouched():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg, client, db, kbs = setup(tmp)
+        service = IngestionService(cfg, db)
+        for name in ("a.txt", "b.txt"):
+            service.process_file(add_file(cfg, name, TEXT + name))
+        before = live_state(client, db)
+        kbs.update_settings("k1", {"vector_dims": 64})
+        pending = kbs.get("k1")["pending_settings"]
+
+        process_file = service.process_file
+        def failing(path):
+            if path.endswith("b.txt"):
+                raise ValueError("extraction failed")
+            return process_file(path)
+        service.process_file = failing
+        try:
+            reindex_into_staging(kbs, db, service, "k1", pending)
+            assert False, "a failed file must abort the re-index"
+        except RuntimeError as e:
+            assert "live collection unchanged" in str(e)
+
+        assert live_state(client, db) == before
+        assert db.collection_name == "KB_k1" and sorted(client.collections.list_all()) == ["KB_k1"]
+        assert kbs.get("k1")["pending_settings"] == {"vector_dims": 64}
+        assert not os.listdir(os.path.join(cfg.DATA_FOLDER, "staging"))
+
+
+def test_reindex_swaps_in_files_added_meanwhile():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg, client, db, kbs = setup(tmp)
+        service = IngestionService(cfg, db)
+        service.process_file(add_file(cfg, "a.txt"))
+        kbs.update_settings("k1", {"vector_dims": 64})
+
+        process_file = service.process_file
+        def adding(path):
+            # A file lands on disk while the first pass runs
+            if not os.path.exists(os.path.join(cfg.UPLOAD_FOLDER, "k1", "late.txt")):
+                add_file(cfg, "late.txt", TEXT + "late")
+            return process_file(path)
+        service.process_file = adding
+        assert reindex_into_staging(kbs, db, service, "k1", kbs.get("k1")["pending_settings"]) == 2
+
+        state = live_state(client, db)
+        assert state["files"] == ["a.txt", "late.txt"] and state["routed"] == ["a.txt", "late.txt"]
+        kb = kbs.get("k1")
+        assert kb["vector_dims"] == 64 and "pending_settings" not in kb
+        vectors = [v["default"] for v in (o.vector for o in client.collections.get("KB_k1").iterator(include_vector=True))]
+        assert vectors and all(len(v) == 64 for v in vectors)
+        assert sorted(client.collections.list_all()) == ["KB_k1"]
+
+
+def test_add_documents_raises_on_failed_objects():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg, client, db, kbs = setup(tmp)
+        db.collection.batch.failed_objects = [SimpleNamespace(message="vector dimension mismatch")]
+        try:
+            db.add_documents(["text"], [{"source_file": "a.txt"}], ["00000000-0000-0000-0000-000000000001"])
+            assert False, "failed objects must raise"
+        except RuntimeError as e:
+            assert "vector dimension mismatch" in str(e)
+
+
+if __name__ == "__main__":
+    test_new_collection_settings_stay_pending()
+    test_failed_reindex_leaves_live_kb_untouched()
+    test_reindex_swaps_in_files_added_meanwhile()
+    test_add_documents_raises_on_failed_objects()
+    print("OK")
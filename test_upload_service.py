@@ -0,0 +1,103 @@
+import io
+import os
+import sys
+import hashlib
+import tempfile
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from config import Config
+from services.blob_store import BlobStore
+from services.upload_service import ChunkedUploadService, UploadError
+
+CHUNK = 1024
+CONTENT = bytes(range(256)) * 10  # 2560 bytes: 3 chunks, the last one short
+
+
+def make_config(tmp):
+    class TestConfig(Config):
+        DATA_FOLDER = os.path.join(tmp, "data")
+        UPLOAD_FOLDER = os.path.join(tmp, "file")
+    return TestConfig
+
+
+def upload(service, content=CONTENT, order=None):
+    manifest = service.init("doc.txt", "kb", len(content), CHUNK)
+    for index in order or range(manifest["total_chunks"]):
+        service.put_chunk(manifest["upload_id"], index, io.BytesIO(content[index * CHUNK:(index + 1) * CHUNK]))
+    return manifest["upload_id"]
+
+
+def test_retry_after_failed_on_complete_is_not_a_duplicate():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = make_config(tmp)
+        blob_store = BlobStore(cfg)
+        service = ChunkedUploadService(cfg, blob_store)
+        upload_id = upload(service, order=[2, 0, 1])
+        dest = os.path.join(cfg.UPLOAD_FOLDER, "kb")
+
+        def failing(file_path, file_hash, is_duplicate):
+            raise RuntimeError("broker down")
+        try:
+            service.complete(upload_id, dest, failing)
+            assert False, "on_complete error must propagate"
+        except RuntimeError:
+            pass
+
+        calls = []
+        def enqueue(file_path, file_hash, is_duplicate):
+            calls.append((file_hash, is_duplicate))
+            return {"task_id": "t1", "duplicate": is_duplicate}
+        # A fresh service, as after a restart: no in-process hash state
+        retry = ChunkedUploadService(cfg, blob_store)
+        assert retry.complete(upload_id, dest, enqueue) == {"task_id": "t1", "duplicate": False}
+        assert calls == [(hashlib.sha256(CONTENT).hexdigest(), False)]
+        with open(os.path.join(dest, "doc.txt"), 'rb') as f:
+            assert f.read() == CONTENT
+        # Completed: further calls return the stored result without re-enqueueing
+        assert retry.complete(upload_id, dest, enqueue)["task_id"] == "t1" and len(calls) == 1
+
+
+def test_same_content_again_is_a_duplicate():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = make_config(tmp)
+        service = ChunkedUploadService(cfg, BlobStore(cfg))
+        dest = os.path.join(cfg.UPLOAD_FOLDER, "kb")
+        first = service.complete(upload(service), dest, lambda p, h, d: {"duplicate": d})
+        second = service.complete(upload(service), os.path.join(cfg.UPLOAD_FOLDER, "kb2"),
+                                  lambda p, h, d: {"duplicate": d})
+        assert first == {"duplicate": False} and second == {"duplicate": True}
+
+
+def test_failed_rewrite_leaves_chunk_missing():
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = make_config(tmp)
+        service = ChunkedUploadService(cfg, BlobStore(cfg))
+        upload_id = upload(service)
+        assert service.status(upload_id)["missing"] == []
+
+        # A retried chunk that breaks off midway must not keep the earlier marker
+        try:
+            service.put_chunk(upload_id, 0, io.BytesIO(b"x" * 10))
+            assert False, "short chunk must be rejected"
+        except UploadError:
+            pass
+        assert service.status(upload_id)["missing"] == [0]
+        try:
+            service.complete(upload_id, os.path.join(cfg.UPLOAD_FOLDER, "kb"), lambda p, h, d: {})
+            assert False, "complete must refuse missing chunks"
+        except UploadError:
+            pass
+
+        # Rewritten in full, the hash is recomputed over the final content
+        service.put_chunk(upload_id, 0, io.BytesIO(CONTENT[:CHUNK]))
+        result = service.complete(upload_id, os.path.join(cfg.UPLOAD_FOLDER, "kb"), lambda p, h, d: {"hash": h})
+        assert result == {"hash": hashlib.sha256(CONTENT).hexdigest()}
+
+
+if __name__ == "__main__":
+    test_retry_after_failed_on_complete_is_not_a_duplicate()
+    test_same_content_again_is_a_duplicate()
+    test_failed_rewrite_leaves_chunk_missing()
+    print("OK")